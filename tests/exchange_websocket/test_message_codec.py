@@ -0,0 +1,78 @@
+from trading_package.exchange_websocket.message_codec import MessageCodec, FeedMessage
+from trading_package.exchange_websocket.shared_ring_buffer import SharedRingBuffer
+from trading_package.helper.enums import Currency
+from trading_package.helper.timestamps import parse_timestamp_ns
+from trading_package.portfolio.product import Product, ProductManager
+import json
+import unittest
+
+ORDER_ID = 'd50ec984-77a8-460a-b958-66f114b0de9b'
+MESSAGES = [
+    {'type': 'received', 'product_id': 'BTC-USD', 'sequence': 10, 'time': '2017-08-01T15:04:05.123456Z',
+     'side': 'buy', 'price': '4012.34', 'size': '0.5', 'order_id': ORDER_ID},
+    {'type': 'open', 'product_id': 'BTC-USD', 'sequence': 11, 'time': '2017-08-01T15:04:05.123457Z',
+     'side': 'sell', 'price': '4012.35', 'remaining_size': '1.25', 'order_id': ORDER_ID},
+    {'type': 'done', 'product_id': 'LTC-BTC', 'sequence': 12, 'time': '2017-08-01T15:04:06.000000Z',
+     'side': 'sell', 'price': '0.01234', 'remaining_size': '0', 'order_id': ORDER_ID, 'reason': 'canceled'},
+    {'type': 'match', 'product_id': 'BTC-USD', 'sequence': 13, 'time': '2017-08-01T15:04:07.500000Z',
+     'side': 'buy', 'price': '4012.34', 'size': '0.12345678', 'maker_order_id': ORDER_ID},
+    {'type': 'change', 'product_id': 'BTC-USD', 'sequence': 14, 'time': '2017-08-01T15:04:08.000001Z',
+     'side': 'buy', 'price': '4012.34', 'old_size': '2', 'new_size': '1.5', 'order_id': ORDER_ID},
+    {'type': 'resync', 'product_id': 'LTC-BTC', 'sequence': 15},
+    {'type': 'handoff', 'product_id': 'BTC-USD', 'sequence': 16},
+]
+
+
+def get_product_manager():
+    product_manager = ProductManager()
+    product_manager + Product(product_id='BTC-USD', quote_currency=Currency.USD, base_currency=Currency.BTC,
+                              quote_increment='0.01', base_min_size='0.01')
+    product_manager + Product(product_id='LTC-BTC', quote_currency=Currency.BTC, base_currency=Currency.LTC,
+                              quote_increment='0.00001', base_min_size='0.01')
+    return product_manager
+
+
+class MessageCodecTestCase(unittest.TestCase):
+    def test_that_messages_round_trip(self):
+        codec = MessageCodec(get_product_manager())
+        for message in MESSAGES:
+            payload = codec.encode(message)
+            assert len(payload) == codec.get_message_size()
+            assert len(payload) * 3 < len(json.dumps(message)) or message['type'] in ['resync', 'handoff']
+            decoded = codec.decode(payload)
+            assert isinstance(decoded, FeedMessage)
+            assert sorted(decoded.keys()) == sorted(message.keys())
+            for key, value in message.items():
+                if key in ['price', 'size', 'remaining_size', 'old_size', 'new_size']:
+                    assert float(decoded[key]) == float(value)
+                else:
+                    assert decoded[key] == value
+            if 'time' in message:
+                assert decoded.get_timestamp_ns() == parse_timestamp_ns(message['time'])
+            assert 'new_funds' not in decoded
+            assert decoded.get('new_funds') is None
+        assert codec.decode(codec.encode(MESSAGES[1])).get_price_ticks() == 401235
+        change = codec.decode(codec.encode(MESSAGES[4]))
+        assert (change.get_size_units(), change.get_old_size_units()) == (150000000, 200000000)
+
+    def test_that_messages_that_do_not_fit_are_left_as_json(self):
+        codec = MessageCodec(get_product_manager())
+        market_order = dict(MESSAGES[0])
+        del market_order['price']
+        off_grid = dict(MESSAGES[1], price='4012.345')
+        unknown_product = dict(MESSAGES[1], product_id='ETH-USD')
+        short_id = dict(MESSAGES[1], order_id='1')
+        for message in [market_order, off_grid, unknown_product, short_id]:
+            assert codec.encode(message) is None
+
+        ring_buffer = SharedRingBuffer(slot_count=8, slot_size=512, reader_count=1, codec=codec)
+        reader = ring_buffer.get_reader(0)
+        ring_buffer.put_message(MESSAGES[3])
+        ring_buffer.put_message(short_id, json.dumps(short_id).encode('utf-8'))
+        assert reader.get(block=False).to_dict() == reader.ring_buffer.codec.decode(
+            codec.encode(MESSAGES[3])).to_dict()
+        assert reader.get(block=False) == short_id
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+from multiprocessing import Process
+from trading_package.exchange_websocket.order_id_filter import OrderIdFilter, HeldMessages
+import time
+import unittest
+
+
+def register(order_id_filter, order_ids):
+    order_id_filter.register(order_ids)
+    order_id_filter.de_register(order_ids[:1])
+
+
+class OrderIdFilterTestCase(unittest.TestCase):
+    # updates reach the queue from a feeder thread so this syncs until check passes, returning what was released
+    def sync_until(self, order_id_filter, check):
+        deadline = time.time() + 5
+        released = order_id_filter.sync()
+        while not check(released) and time.time() < deadline:
+            time.sleep(0.01)
+            released.extend(order_id_filter.sync())
+        return released
+
+    def test_that_only_registered_orders_get_through(self):
+        order_id_filter = OrderIdFilter()
+        # registered from another process as the portfolio processor does
+        process = Process(target=register, args=(order_id_filter, ['a', 'b']))
+        process.start()
+        process.join()
+        self.sync_until(order_id_filter, lambda released: order_id_filter.order_ids == {'b'})
+        assert order_id_filter.order_ids == {'b'}
+        match = {'type': 'match', 'maker_order_id': 'b', 'taker_order_id': 'c'}
+        assert order_id_filter.get_deliveries(match) == [match]
+        assert order_id_filter.get_deliveries({'type': 'done', 'order_id': 'b'}, 'encoded') == ['encoded']
+        assert order_id_filter.get_deliveries({'type': 'done', 'order_id': 'a'}) == []
+        assert order_id_filter.get_deliveries({'type': 'match', 'maker_order_id': 'c', 'taker_order_id': 'b'}) == []
+        assert order_id_filter.get_counts() == {'delivered': 2, 'dropped': 2, 'replayed': 0}
+
+    # the exchange can send messages about an order before the reply to placing it gets it registered
+    def test_that_messages_before_registration_are_replayed(self):
+        order_id_filter = OrderIdFilter()
+        received = {'type': 'received', 'order_id': 'd'}
+        match = {'type': 'match', 'maker_order_id': 'd', 'taker_order_id': 'e'}
+        for message in [received, {'type': 'open', 'order_id': 'f'}, match]:
+            assert order_id_filter.get_deliveries(message) == []
+        order_id_filter.register(['d'])
+        # released as soon as the registration is synced rather than with the next message
+        assert self.sync_until(order_id_filter, lambda released: len(released) > 0) == [received, match]
+        done = {'type': 'done', 'order_id': 'd'}
+        assert order_id_filter.get_deliveries(done) == [done]
+        assert order_id_filter.get_counts() == {'delivered': 1, 'dropped': 3, 'replayed': 2}
+        assert order_id_filter.held.get_held() == 1
+
+    def test_that_held_messages_are_bounded(self):
+        held = HeldMessages(max_size=3)
+        for idx, order_id in enumerate(['a', 'b', 'a', 'c', 'a']):
+            held.hold(order_id, idx)
+        assert held.release(['a', 'b']) == [2, 4]
+        assert held.get_expired() == 2 and held.get_held() == 1
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+from multiprocessing import Process, Queue
+from queue import Empty
+from trading_package.exchange_websocket.shared_ring_buffer import SharedRingBuffer, SharedRingBufferException
+import json
+import unittest
+
+
+def read_all(ring_buffer, reader_id, count, results):
+    reader = ring_buffer.get_reader(reader_id)
+    results.put([reader.get(timeout=5)['sequence'] for _ in range(count)])
+
+
+class SharedRingBufferTestCase(unittest.TestCase):
+    def test_that_every_reader_sees_every_message(self):
+        ring_buffer = SharedRingBuffer(slot_count=8, slot_size=64, reader_count=2)
+        readers = [ring_buffer.get_reader(reader_id) for reader_id in range(2)]
+        assert readers[0].empty()
+        self.assertRaises(Empty, readers[0].get, False)
+        for sequence in range(5):
+            ring_buffer.put(json.dumps({'sequence': sequence}).encode('utf-8'))
+        assert [readers[0].get(block=False)['sequence'] for _ in range(5)] == list(range(5))
+        assert readers[0].empty()
+        assert readers[1].get_lag() == 5
+        assert readers[1].get(block=False) == {'sequence': 0}
+        assert ring_buffer.get_stats() == [{'reads': 5, 'overruns': 0, 'lag': 0},
+                                           {'reads': 1, 'overruns': 0, 'lag': 4}]
+        self.assertRaises(SharedRingBufferException, ring_buffer.put, b'x' * 64)
+
+        # the slow reader is lapped and skips to the oldest message still held
+        for sequence in range(5, 20):
+            ring_buffer.put_message({'sequence': sequence})
+        assert readers[1].get(block=False) == {'sequence': 12}
+        assert readers[1].get_overruns() == 11
+        # overruns are only found when the reader next reads
+        assert readers[0].get_overruns() == 0
+        assert readers[0].get(block=False) == {'sequence': 12}
+        assert readers[0].get_overruns() == 7
+
+    def test_that_readers_in_other_processes_see_the_messages(self):
+        ring_buffer = SharedRingBuffer(slot_count=64, slot_size=64, reader_count=2)
+        results = Queue()
+        processes = [Process(target=read_all, args=(ring_buffer, reader_id, 50, results)) for reader_id in range(2)]
+        for process in processes:
+            process.start()
+        for sequence in range(50):
+            ring_buffer.put_message({'sequence': sequence})
+        outputs = [results.get(timeout=10) for _ in processes]
+        for process in processes:
+            process.join()
+        assert outputs == [list(range(50)), list(range(50))]
+        assert [stats['reads'] for stats in ring_buffer.get_stats()] == [50, 50]
+
+
+if __name__ == '__main__':
+    unittest.main()
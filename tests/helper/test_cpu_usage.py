@@ -0,0 +1,26 @@
+from queue import Empty
+from time import time
+from trading_package.exchange_websocket.shared_ring_buffer import SharedRingBuffer
+from trading_package.helper.cpu_usage import CpuUsage
+import unittest
+
+
+class CpuUsageTestCase(unittest.TestCase):
+    def test_that_blocking_on_an_empty_feed_uses_almost_no_cpu(self):
+        cpu_usage = CpuUsage(60)
+        assert not cpu_usage.is_due()
+        assert cpu_usage.is_due(time() + 60)
+        start_time = time()
+        while time() - start_time < 0.1:
+            pass
+        assert cpu_usage.get_usage() > 50
+
+        reader = SharedRingBuffer(slot_count=8, slot_size=64, reader_count=1).get_reader(0)
+        start_time = time()
+        self.assertRaises(Empty, reader.get, True, 0.3)
+        assert time() - start_time >= 0.3
+        assert cpu_usage.get_usage() < 20
+
+
+if __name__ == '__main__':
+    unittest.main()
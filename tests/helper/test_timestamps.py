@@ -0,0 +1,18 @@
+from trading_package.helper.timestamps import parse_timestamp_ns, datetime_to_ns, days_from_civil
+from dateutil import parser
+import unittest
+
+
+class TimestampsTestCase(unittest.TestCase):
+    def test_that_timestamps_parse_like_dateutil(self):
+        assert days_from_civil(1970, 1, 1) == 0
+        assert days_from_civil(2000, 3, 1) == 11017
+        for timestamp in ['2017-08-01T15:04:05.123456Z', '2016-02-29T23:59:59Z', '2018-12-31T00:00:00.1Z',
+                          '1999-01-01T12:30:00.000001Z', '2017-08-01T15:04:05.123456+01:00']:
+            assert parse_timestamp_ns(timestamp) == datetime_to_ns(parser.parse(timestamp))
+        assert parse_timestamp_ns('2017-08-01T15:04:05.123456789Z') % 10 ** 9 == 123456789
+        assert parse_timestamp_ns('1970-01-01T00:00:01Z') == 10 ** 9
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+from networkx import DiGraph, simple_cycles
+from numpy import prod
+from trading_package.helper.enums import Currency
+from trading_package.network.cycle_set import CycleSet
+import random
+import unittest
+
+
+class CycleSetTestCase(unittest.TestCase):
+    def test_that_cycle_values_match_multiplying_the_weights(self):
+        random.seed(7)
+        currencies = [currency.name for currency in Currency]
+        # both directions of every product, as the network has
+        edges = [(start, end) for start in currencies for end in currencies if start != end]
+        weights = {edge: random.uniform(0.5, 2) for edge in edges}
+        cycle_set = CycleSet(edges)
+        assert cycle_set.has_topology(reversed(edges))
+        dg = DiGraph()
+        dg.add_edges_from(edges)
+        assert len(cycle_set.get_cycles()) == len(list(simple_cycles(dg)))
+
+        ranked = cycle_set.get_ranked_cycles(weights)
+        assert len(ranked) == len(cycle_set.get_cycles())
+        assert [value for value, _ in ranked] == sorted(value for value, _ in ranked)
+        for value, cycle in ranked:
+            assert cycle[0] == cycle[-1] == max(cycle, key=lambda x: Currency[x].value)
+            self.assertAlmostEqual(value, prod([weights[(start, end)] for start, end in zip(cycle[:-1], cycle[1:])]))
+        for currency in currencies:
+            assert cycle_set.get_ranked_cycles(weights, currency) == [(value, cycle) for value, cycle in ranked if
+                                                                     currency in cycle]
+
+        # cycles of equal value are all kept and cycles missing a weight are left out
+        weights = {edge: 1. for edge in edges}
+        del weights[edges[0]]
+        ranked = cycle_set.get_ranked_cycles(weights)
+        assert all(abs(value - 1) < 1e-9 for value, _ in ranked)
+        assert len(ranked) == len([cycle for cycle in cycle_set.get_cycles() if
+                                   edges[0] not in list(zip(cycle[:-1], cycle[1:]))])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+from trading_package.network.cycle_set import CycleSet
+from trading_package.network.negative_cycle_finder import NegativeCycleFinder
+import random
+import unittest
+
+
+def get_weights(currency_count: int, seed: int):
+    random.seed(seed)
+    currencies = ['C{}'.format(idx) for idx in range(currency_count)]
+    prices = {currency: random.uniform(1, 100) for currency in currencies}
+    # consistent prices less a fee, with the odd mispriced edge
+    return {(start, end): prices[start] / prices[end] * 0.998 * random.choice([1., 1., 1., 1.01]) for start in
+            currencies for end in currencies if start != end and random.random() < 0.7}
+
+
+class NegativeCycleFinderTestCase(unittest.TestCase):
+    def test_that_found_cycles_are_profitable_cycles_of_the_network(self):
+        for seed in range(10):
+            weights = get_weights(6, seed)
+            cycle_set = CycleSet(weights.keys())
+            values = {tuple(cycle): value for value, cycle in cycle_set.get_ranked_cycles(weights)}
+            profitable = [cycle for cycle, value in values.items() if value > 1 + 1e-9]
+            finder = NegativeCycleFinder(weights)
+
+            ranked = finder.get_ranked_cycles(max_cycles=len(weights))
+            assert (len(ranked) > 0) == (len(profitable) > 0)
+            assert [value for value, _ in ranked] == sorted(value for value, _ in ranked)
+            for value, cycle in ranked:
+                assert value > 1
+                self.assertAlmostEqual(value, values[tuple(cycle)])
+
+            for start in sorted({currency for edge in weights for currency in edge}):
+                ranked = finder.get_ranked_cycles(start, max_length=3, max_cycles=len(weights))
+                assert (len(ranked) > 0) == any(start in cycle and len(cycle) <= 4 for cycle in profitable)
+                for value, cycle in ranked:
+                    assert start in cycle and len(cycle) <= 4
+                    self.assertAlmostEqual(value, values[tuple(cycle)])
+
+    def test_that_the_only_profitable_cycle_is_found(self):
+        weights = {('BTC', 'USD'): 4000., ('USD', 'BTC'): 1 / 4001., ('ETH', 'USD'): 301., ('USD', 'ETH'): 1 / 302.,
+                   ('ETH', 'BTC'): 0.0748, ('BTC', 'ETH'): 13.33}
+        finder = NegativeCycleFinder(weights)
+        ranked = finder.get_ranked_cycles()
+        assert [cycle for _, cycle in ranked] == [['USD', 'BTC', 'ETH', 'USD']]
+        self.assertAlmostEqual(ranked[0][0], 13.33 * 301. / 4001.)
+        assert finder.get_ranked_cycles('ETH', max_length=3) == ranked
+        assert finder.get_ranked_cycles('ETH', max_length=2) == []
+        weights[('ETH', 'USD')] = 299.
+        assert NegativeCycleFinder(weights).get_ranked_cycles() == []
+
+
+if __name__ == '__main__':
+    unittest.main()
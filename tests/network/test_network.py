@@ -1,11 +1,23 @@
+from trading_package.network.edge_recompute_scheduler import EdgeRecomputeScheduler
 from trading_package.network.network import NetworkManager
 from networkx import get_edge_attributes
 from trading_package.order_book.order_book import OrderBook, Order
-from trading_package.helper.enums import OrderSide, OrderType, Currency, NetworkType, EdgeType, QuoteType
+from trading_package.order_book.order_book_store import LadderOrderBookStore
+from trading_package.order_book.trade_history import MemoryTradeHistory
+from trading_package.helper.enums import OrderSide, OrderType, OrderStatus, Currency, NetworkType, EdgeType, QuoteType
 from trading_package.portfolio.product import Product
+import random
 import unittest
 
 
+def get_network_hashes(nm):
+    network_hashes = {key: nm.redis_server.hgetall(key) for key in nm.redis_server.keys('network:*')}
+    # versions count writes, which recomputing every edge makes more of
+    for network_hash in network_hashes.values():
+        network_hash.pop(NetworkManager.VERSION_FIELD)
+    return network_hashes
+
+
 class NetworkTestCase(unittest.TestCase):
     def test_that_network_correctly_computes_edges(self):
         def get_price(side):
@@ -42,10 +54,88 @@ class NetworkTestCase(unittest.TestCase):
         # print(get_edge_attributes(nm.get_network(NetworkType.price, quote_type=QuoteType.product, edge_type=EdgeType.mean), 'weight'))
         # print(nm.get_next_nodes_and_avail_qties_by_cycle_value(EdgeType.mean, Currency.USD), {
         #     2.3331111259249386: (Currency.BTC, '150.01', '1.5')})
-        assert nm.get_next_nodes_and_avail_qties_by_cycle_value(EdgeType.mean, Currency.USD) == {
-            2.3331111259249386: (Currency.BTC, '150.01', '1.5')}
-        assert nm.get_next_nodes_and_avail_qties_by_cycle_value(EdgeType.mean, Currency.BTC) == {
-            2.3331111259249386: (Currency.USD, '349.99', '1.5')}
+        # cycle values are worked out in log space so only match to within rounding
+        for currency, next_node in [(Currency.USD, (Currency.BTC, '150.01', '1.5')),
+                                    (Currency.BTC, (Currency.USD, '349.99', '1.5'))]:
+            next_nodes = nm.get_next_nodes_and_avail_qties_by_cycle_value(EdgeType.mean, currency)
+            assert len(next_nodes) == 1
+            self.assertAlmostEqual(next_nodes[0][0], 2.3331111259249386)
+            assert next_nodes[0][1:] == next_node
+
+    def test_that_scheduled_edges_match_recomputing_every_edge(self):
+        product_id = 'BTC-USD'
+        product = Product(product_id=product_id, quote_currency=Currency.USD, base_currency=Currency.BTC,
+                          quote_increment='0.01', base_min_size='0.01')
+        ob = OrderBook(product, store=LadderOrderBookStore(product_id), trade_history=MemoryTradeHistory(3600))
+        ob.redis_server.flushdb()
+        nm = NetworkManager()
+        scheduler = EdgeRecomputeScheduler(nm)
+        random.seed(3)
+        live = {side: {} for side in OrderSide}
+        for idx in range(300):
+            side = random.choice(list(OrderSide))
+            action = random.random()
+            if action < 0.5 or len(live[side]) == 0:
+                # mostly far from the top so most changes cannot move the edges
+                offset = random.choice([1, 2, 3] + list(range(20, 60)))
+                price = '{:.2f}'.format(100 - offset / 10 if side == OrderSide.bid else 101 + offset / 10)
+                live[side][str(idx)] = (price, random.choice(['0.5', '1.0', '2.0']))
+                ob + Order(product_id, idx, side, live[side][str(idx)][1], price, order_id=str(idx))
+            elif action < 0.8:
+                order_id = random.choice(sorted(live[side]))
+                price, size = live[side].pop(order_id)
+                ob - Order(product_id, idx, side, size, price, order_type=OrderType.cancel,
+                           status=OrderStatus.canceled, order_id=order_id)
+            else:
+                order_id = random.choice(sorted(live[side]))
+                price, size = live[side][order_id]
+                live[side][order_id] = (price, str(float(size) / 2))
+                ob - Order(product_id, idx, side, str(float(size) / 2), price, order_type=OrderType.match,
+                           order_id=order_id)
+            scheduler.mark_changes(product_id, ob.pop_changes())
+            scheduler.recompute_due({product_id: ob})
+            scheduled = get_network_hashes(nm)
+            for order_side in OrderSide:
+                nm.update_from_order_book(ob, order_side)
+            assert scheduled == get_network_hashes(nm)
+        counters = scheduler.get_counters()
+        assert counters['skipped'] > counters['performed'] > 0
+
+        # a burst inside the window is recomputed once
+        scheduler = EdgeRecomputeScheduler(nm, window=10)
+        for idx in range(3):
+            scheduler.mark(product_id, OrderSide.bid, 9000 + idx, False, now_time=100)
+        assert scheduler.recompute_due({product_id: ob}, now_time=105) == 0
+        assert scheduler.recompute_due({product_id: ob}, now_time=110) == len(EdgeType)
+        assert scheduler.get_counters()['coalesced'] == 2
+        assert not scheduler.has_pending()
+
+    def test_that_weights_are_only_read_again_when_the_network_changes(self):
+        nm = NetworkManager()
+        nm.redis_server.flushdb()
+        nm.add_edge(EdgeType.best, QuoteType.currency, Currency.BTC, Currency.USD, 4000., 2.)
+        nm.add_edge(EdgeType.best, QuoteType.currency, Currency.USD, Currency.BTC, 1 / 4010., 8000.)
+        weights = nm.get_weights(NetworkType.price, EdgeType.best, QuoteType.currency)
+        assert weights == {('BTC', 'USD'): '4000.0', ('USD', 'BTC'): str(1 / 4010.)}
+        assert nm.get_weights(NetworkType.price, EdgeType.best, QuoteType.currency) is weights
+        nm.add_edge(EdgeType.best, QuoteType.currency, Currency.BTC, Currency.USD, 4001., 2.)
+        nm.add_edge(EdgeType.best, QuoteType.currency, Currency.BTC, Currency.USD, 4002., 2.)
+        assert nm.get_weights(NetworkType.price, EdgeType.best, QuoteType.currency)[('BTC', 'USD')] == '4002.0'
+        # a snapshot is read again whole when any of its networks changed
+        price, qty = nm.get_weights_snapshot([(NetworkType.price, EdgeType.best, QuoteType.currency),
+                                              (NetworkType.quantity, EdgeType.best, QuoteType.currency)])
+        assert qty == {('BTC', 'USD'): '2.0', ('USD', 'BTC'): '8000.0'}
+        stats = nm.get_cache_stats()
+        assert (stats['hits'], stats['misses'], stats['stale'], stats['max_versions_behind']) == (1, 4, 2, 2)
+        assert stats['hit_rate'] == 1 / 5
+
+        # weights younger than the max age are used without checking
+        nm = NetworkManager(cache_max_age=60)
+        weights = nm.get_weights(NetworkType.price, EdgeType.best, QuoteType.currency)
+        nm.add_edge(EdgeType.best, QuoteType.currency, Currency.BTC, Currency.USD, 4003., 2.)
+        assert nm.get_weights(NetworkType.price, EdgeType.best, QuoteType.currency) is weights
+        assert nm.get_cache_stats()['unchecked'] == 1
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,44 @@
+from trading_package.helper.enums import Currency, EdgeType, QuoteType
+from trading_package.network.network import NetworkManager
+from trading_package.network.network_change_listener import NetworkChangeListener
+import time
+import unittest
+
+
+class NetworkChangeListenerTestCase(unittest.TestCase):
+    def poll(self, listener: NetworkChangeListener, count: int) -> None:
+        # notifications take a moment to arrive
+        deadline = time.time() + 1
+        while listener.poll() < count and time.time() < deadline:
+            time.sleep(0.01)
+
+    def test_that_the_strategy_runs_only_after_changes(self):
+        nm = NetworkManager()
+        nm.redis_server.flushdb()
+        listener = NetworkChangeListener(min_interval=10)
+        assert listener.is_due(now_time=100)
+        assert listener.pop_changes(now_time=100) == (set(), {})
+        assert nm.publish_changes() == 0
+
+        nm.add_edge(EdgeType.best, QuoteType.currency, Currency.BTC, Currency.USD, 4000., 2.)
+        nm.add_edge(EdgeType.best, QuoteType.currency, Currency.BTC, Currency.USD, 4001., 2.)
+        nm.add_edge(EdgeType.mean, QuoteType.product, Currency.USD, Currency.BTC, 4002., 2.)
+        assert nm.publish_changes() == 1
+        self.poll(listener, 1)
+        assert listener.is_due(now_time=110)
+        # no more often than the min interval
+        assert not listener.is_due(now_time=105)
+        edges, versions = listener.pop_changes(now_time=110)
+        assert edges == {'best:currency:BTC:USD', 'mean:product:USD:BTC'}
+        assert versions == {'network:price:best:currency': 2, 'network:quantity:best:currency': 2,
+                            'network:price:mean:product': 1, 'network:quantity:mean:product': 1}
+        assert not listener.is_due(now_time=200)
+
+        listener.mark()
+        assert listener.is_due(now_time=200)
+        assert listener.get_counters() == {'notifications': 1, 'marks': 1, 'evaluations': 2}
+        listener.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
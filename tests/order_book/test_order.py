@@ -1,5 +1,8 @@
-from trading_package.helper.enums import OrderSide
+from trading_package.helper.enums import OrderSide, OrderType, Currency
+from trading_package.helper.timestamps import parse_timestamp_ns
 from trading_package.order_book.order import Order
+from trading_package.order_book.order_event import OrderEvent
+from trading_package.portfolio.product import Product
 import unittest
 
 
@@ -14,5 +17,18 @@ class OrderTestCase(unittest.TestCase):
         o.add_filled_size('0.05')
         assert o.get_remaining_size() == '0.05'
 
+    def test_that_order_events_match_orders(self):
+        o = Order('BTC-USD', 0, OrderSide.bid, '0.1', '100', order_type=OrderType.change)
+        o.add_filled_size('0.05')
+        product = Product('BTC-USD', Currency.USD, Currency.BTC, '0.01', '0.01')
+        e = OrderEvent('BTC-USD', 0, OrderSide.bid, 10000000, product.price_to_ticks('100'),
+                       parse_timestamp_ns('2017-01-01T00:00:01.5Z'), order_type=OrderType.change, filled_units=5000000)
+        for getter in ['get_product_id', 'get_sequence_id', 'get_order_side', 'get_size', 'get_size_units',
+                       'get_filled_units', 'get_remaining_units', 'get_order_type', 'get_status']:
+            assert getattr(e, getter)() == getattr(o, getter)()
+        assert e.get_price_ticks() == 10000
+        assert e.get_unix_timestamp() == 1483228801
+        assert not hasattr(e, '__dict__')
+
 if __name__ == '__main__':
     unittest.main()
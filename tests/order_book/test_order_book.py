@@ -1,11 +1,41 @@
 from trading_package.order_book.order import Order
 from trading_package.order_book.order_book import OrderBook
+from trading_package.order_book.order_book_resync import OrderBookResync
+from trading_package.order_book.order_book_snapshot import OrderBookSnapshot
+from trading_package.order_book.order_book_store import LadderOrderBookStore, RedisOrderBookStore, OrderBookStore
+from trading_package.order_book.price_ladder import PriceLadder
+from trading_package.order_book.redis_write_batcher import RedisWriteBatcher
+from trading_package.order_book.trade_history import MemoryTradeHistory, RedisTradeHistory
+from trading_package.order_book.trade_statistics import RollingTradeStatistics
 from trading_package.helper.enums import OrderSide, OrderStatus, OrderType
 from trading_package.portfolio.product import Product
 from trading_package.helper.enums import Currency
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from statistics import mean, median, mode
+import random
 import unittest
 
 
+def apply_mixed_orders(ob):
+    product_id = ob.get_product_id()
+    orders = [
+        (OrderSide.bid, '10', '1.0', '1'), (OrderSide.bid, '9.5', '2.0', '2'), (OrderSide.bid, '9.5', '0.5', '3'),
+        (OrderSide.ask, '11', '1.0', '4'), (OrderSide.ask, '12', '3.0', '5'), (OrderSide.ask, '11', '0.25', '6')
+    ]
+    for side, price, size, order_id in orders:
+        ob + Order(product_id, 0, side, size, price, order_id=order_id)
+    ob - Order(product_id, 0, OrderSide.bid, '0.5', '10', order_type=OrderType.match, order_id='1')
+    ob - Order(product_id, 0, OrderSide.ask, '0.25', '11', order_type=OrderType.cancel,
+               status=OrderStatus.canceled, order_id='6')
+    ob - Order(product_id, 0, OrderSide.ask, '1.0', '11', order_type=OrderType.match,
+               status=OrderStatus.filled, order_id='4')
+    order = Order(product_id, 0, OrderSide.bid, '2.0', '9.5', order_type=OrderType.change, order_id='2')
+    order.add_filled_size('1.5')
+    ob - order
+    ob + Order(product_id, 0, OrderSide.ask, '0.1', '11', order_type=OrderType.match, historical=True)
+
+
 class OrderBookTestCase(unittest.TestCase):
     def test_that_order_book_works_as_expected(self):
         product_id = 'BTC-USD'
@@ -82,6 +112,273 @@ class OrderBookTestCase(unittest.TestCase):
 
             assert (ob.get_best(get_other_side(side)) == float(get_price(get_other_side(side))))
 
+    def test_that_in_memory_order_book_matches_redis_order_book(self):
+        product_id = 'BTC-USD'
+        product = Product(product_id=product_id, quote_currency=Currency.USD, base_currency=Currency.BTC,
+                          quote_increment='0.01', base_min_size='0.01')
+        redis_ob = OrderBook(product)
+        redis_ob.redis_server.flushdb()
+        memory_ob = OrderBook(product, store=LadderOrderBookStore(product_id), trade_history=MemoryTradeHistory(60))
+
+        for ob in [redis_ob, memory_ob]:
+            apply_mixed_orders(ob)
+
+        for side in OrderSide:
+            for depth in [0, 0.5, 1, 2.5, 10]:
+                assert memory_ob.get_price(side, depth) == redis_ob.get_price(side, depth)
+        assert memory_ob.get_best_bid_ask() == (10., 12.)
+        assert memory_ob.pop_changed_sides() == {OrderSide.bid, OrderSide.ask}
+        assert memory_ob.pop_changed_sides() == set()
+        assert redis_ob.pop_changed_sides() == {OrderSide.bid, OrderSide.ask}
+
+    def test_that_in_memory_order_book_is_mirrored_to_redis(self):
+        product_id = 'BTC-USD'
+        product = Product(product_id=product_id, quote_currency=Currency.USD, base_currency=Currency.BTC,
+                          quote_increment='0.01', base_min_size='0.01')
+        store = LadderOrderBookStore(product_id, RedisOrderBookStore(product_id))
+        memory_ob = OrderBook(product, store=store)
+        memory_ob.redis_server.flushdb()
+        reader_ob = OrderBook(product)
+
+        memory_ob + Order(product_id, 0, OrderSide.bid, '1.0', '10', order_id='1')
+        memory_ob + Order(product_id, 0, OrderSide.bid, '1.0', '11', order_id='2')
+        # nothing is written until the mirror is flushed
+        assert reader_ob.get_best(OrderSide.bid) is None
+        memory_ob.flush()
+        assert reader_ob.get_price(OrderSide.bid, 1.5) == memory_ob.get_price(OrderSide.bid, 1.5)
+
+        memory_ob - Order(product_id, 0, OrderSide.bid, '1.0', '11', order_type=OrderType.cancel,
+                          status=OrderStatus.canceled, order_id='2')
+        memory_ob.flush()
+        assert reader_ob.get_best(OrderSide.bid) == 10.
+
+    def test_that_batched_writes_are_flushed_together(self):
+        product_id = 'BTC-USD'
+        product = Product(product_id=product_id, quote_currency=Currency.USD, base_currency=Currency.BTC,
+                          quote_increment='0.01', base_min_size='0.01')
+        reader_ob = OrderBook(product)
+        reader_ob.redis_server.flushdb()
+        batcher = RedisWriteBatcher(reader_ob.redis_server, max_batch_size=3, max_delay=60)
+        batched_ob = OrderBook(product, batcher=batcher)
+
+        batched_ob + Order(product_id, 0, OrderSide.ask, '1.0', '10', order_id='1')
+        batched_ob + Order(product_id, 0, OrderSide.ask, '2.0', '11', order_id='2')
+        assert reader_ob.get_best(OrderSide.ask) is None
+        assert not batcher.is_due()
+        batched_ob + Order(product_id, 0, OrderSide.ask, '1.0', '12', order_id='3')
+        assert batcher.is_due()
+        batcher.flush()
+        assert reader_ob.get_best(OrderSide.ask) == 10.
+
+        # the store knows what is at each level so removing does not read it back and flush
+        batched_ob - Order(product_id, 0, OrderSide.ask, '1.0', '10', order_type=OrderType.cancel,
+                           status=OrderStatus.canceled, order_id='1')
+        batched_ob - Order(product_id, 0, OrderSide.ask, '0.5', '11', order_type=OrderType.match, order_id='2')
+        assert batcher.get_pending_mutations() == 2
+        assert reader_ob.get_best(OrderSide.ask) == 10.
+        assert batched_ob.get_price(OrderSide.ask, 2) == (11., 12., 11 * 1.5 + 12 * 0.5, 0.5, 1.)
+        assert reader_ob.get_price(OrderSide.ask, 2) == batched_ob.get_price(OrderSide.ask, 2)
+        assert batched_ob.get_volume(OrderSide.ask, OrderType.match, 60) == 0.5
+        assert batcher.get_pending_mutations() == 0
+
+    def test_that_scripted_order_book_matches_in_memory_order_book(self):
+        product_id = 'BTC-USD'
+        product = Product(product_id=product_id, quote_currency=Currency.USD, base_currency=Currency.BTC,
+                          quote_increment='0.01', base_min_size='0.01')
+        memory_ob = OrderBook(product, store=LadderOrderBookStore(product_id), trade_history=MemoryTradeHistory(60))
+        memory_ob.redis_server.flushdb()
+        apply_mixed_orders(memory_ob)
+
+        for batcher in [None, RedisWriteBatcher(memory_ob.redis_server)]:
+            memory_ob.redis_server.flushdb()
+            scripted_ob = OrderBook(product, batcher=batcher,
+                                    store=RedisOrderBookStore(product_id, batcher=batcher, use_scripts=True))
+            assert scripted_ob.get_store().uses_scripts()
+            apply_mixed_orders(scripted_ob)
+            for side in OrderSide:
+                for depth in [0, 0.5, 1, 2.5, 10]:
+                    assert scripted_ob.get_price(side, depth) == memory_ob.get_price(side, depth)
+                for order_type in OrderType:
+                    assert scripted_ob.get_volume(side, order_type, 60) == memory_ob.get_volume(side, order_type, 60)
+            assert scripted_ob.get_volume(OrderSide.ask, OrderType.match, 60) == 1.1
+            assert memory_ob.redis_server.smembers('order_book:changed_products:bid') == {product_id}
+
+    def test_that_depth_index_matches_walking_the_levels(self):
+        random.seed(4)
+        product_id = 'LTC-BTC'
+        store = LadderOrderBookStore(product_id)
+        for idx in range(500):
+            side = random.choice(list(OrderSide))
+            tick = random.randint(1, 200) + (1000 if side is OrderSide.ask else 0)
+            size = random.randint(10 ** 6, 5 * 10 ** 8)
+            store.add_order(side, tick, str(idx), size)
+            if idx % 3 == 0:
+                store.remove_order(side, tick, str(idx), size)
+            elif idx % 5 == 0:
+                store.match_order(side, tick, str(idx), 500000)
+
+        for side in OrderSide:
+            for depth in [0, 10 ** 5, 10 ** 8, 125 * 10 ** 7, 10 ** 10, 4 * 10 ** 10, 10 ** 12]:
+                assert store.get_depth(side, depth) == OrderBookStore.get_depth(store, side, depth)
+
+        # building the index in bulk gives the same tree as adding level by level
+        for side in OrderSide:
+            ladder = store.get_ladder(side)
+            loaded = PriceLadder(side)
+            loaded.load_levels(sorted([(level.tick, level.size, level.orders)
+                                       for level in ladder.get_levels(0, len(ladder))], key=lambda x: x[0]))
+            assert loaded.index.sizes == ladder.index.sizes
+            assert loaded.index.notionals == ladder.index.notionals
+
+        product = Product(product_id=product_id, quote_currency=Currency.BTC, base_currency=Currency.LTC,
+                          quote_increment='0.00001', base_min_size='0.01')
+        ob = OrderBook(product, store=LadderOrderBookStore(product_id))
+        ob + Order(product_id, 0, OrderSide.ask, '1', '0.01', order_id='1')
+        ob + Order(product_id, 0, OrderSide.ask, '3', '0.02', order_id='2')
+        assert ob.get_vwap(OrderSide.ask, 2) == 0.015
+        assert ob.get_vwap(OrderSide.ask, 10) == 0.0175
+        assert ob.get_vwap(OrderSide.ask, 0) == 0.01
+        assert ob.get_vwap(OrderSide.bid, 1) is None
+
+    def test_that_trade_history_only_keeps_the_lookback(self):
+        memory_history = MemoryTradeHistory(60)
+        redis_history = RedisTradeHistory('BTC-USD', 60)
+        redis_history.redis_server.flushdb()
+        for history in [memory_history, redis_history]:
+            for timestamp in range(1000, 1200, 2):
+                history.add_trade(OrderSide.bid, OrderType.match, timestamp, '0.5')
+            history.add_trade(OrderSide.bid, OrderType.match, 1198, '0.25')
+            # too old to matter any more
+            history.add_trade(OrderSide.bid, OrderType.match, 1000, '1')
+            trades = history.get_trades(OrderSide.bid, OrderType.match, 0, 1200)
+            assert trades[0] == (1138, 0.5)
+            assert trades[-1] == (1198, 0.75)
+            assert len(trades) == 31
+            assert history.get_trades(OrderSide.ask, OrderType.match, 0, 1200) == []
+        assert len(memory_history.get_window(OrderSide.bid, OrderType.match)) == 31
+
+        set_key, size_key = redis_history.get_keys(OrderSide.bid, OrderType.match, 1198)
+        assert redis_history.redis_server.zcard(set_key) == 31
+        assert 0 < redis_history.redis_server.ttl(size_key) <= 60
+
+    def test_that_rolling_trade_statistics_match_recomputing_the_window(self):
+        random.seed(7)
+        history = MemoryTradeHistory(30)
+        for timestamp in range(1000, 1400):
+            for _ in range(random.randint(0, 2)):
+                size = random.choice(['0.01', '0.1', '0.25', '0.5', '1'])
+                history.add_trade(OrderSide.ask, OrderType.match, timestamp - random.randint(0, 3), size)
+            statistics = history.get_statistics(OrderSide.ask, OrderType.match, 30, timestamp)
+            sizes = [size for _, size in history.get_trades(OrderSide.ask, OrderType.match, timestamp - 30,
+                                                            timestamp)]
+            assert statistics.get_count() == len(sizes)
+            if len(sizes) == 0:
+                assert statistics.get_mean() is None
+                continue
+            assert abs(statistics.get_volume() - sum(sizes)) < 1e-9
+            assert abs(statistics.get_mean() - mean(sizes)) < 1e-9
+            assert abs(statistics.get_median() - median(sizes)) < 1e-9
+            rounded = [round(size, 8) for size in sizes]
+            most_common = max(rounded.count(size) for size in rounded)
+            if len(set(size for size in rounded if rounded.count(size) == most_common)) == 1:
+                assert statistics.get_mode() == mode(rounded)
+            else:
+                assert statistics.get_mode() is None
+        assert history.get_statistics(OrderSide.ask, OrderType.match, 10, 1400) is None
+
+        # a second bucket that grows moves from one half of the median to the other
+        statistics = RollingTradeStatistics(60)
+        for timestamp, size in [(1, 1), (2, 2), (3, 3), (1, 5)]:
+            statistics.add(timestamp, size * 100000000)
+        assert statistics.get_median() == 3.0
+        assert statistics.get_mode() is None
+        statistics.expire(2)
+        assert statistics.get_median() == 2.5
+        assert statistics.get_volume() == 5.0
+
+    def test_that_rolling_trade_statistics_survive_compacting_the_heaps(self):
+        random.seed(9)
+        statistics = RollingTradeStatistics(60)
+        buckets = {}
+        # trades landing in seconds that already have one leave removed sizes behind until the heaps are rebuilt
+        for idx in range(3 * RollingTradeStatistics.COMPACT_SLACK):
+            timestamp = random.randint(0, 20)
+            size = random.randint(1, 5)
+            statistics.add(timestamp, size * 100000000)
+            buckets[timestamp] = buckets.get(timestamp, 0) + size
+            assert statistics.get_count() == len(buckets)
+            assert statistics.get_volume() == sum(buckets.values())
+            assert statistics.get_median() == median(buckets.values())
+            counts = Counter(buckets.values()).most_common(2)
+            expected_mode = counts[0][0] if len(counts) == 1 or counts[0][1] > counts[1][1] else None
+            assert statistics.get_mode() == expected_mode
+
+    def test_that_loading_a_snapshot_matches_adding_each_order(self):
+        random.seed(8)
+        product_id = 'BTC-USD'
+        product = Product(product_id=product_id, quote_currency=Currency.USD, base_currency=Currency.BTC,
+                          quote_increment='0.01', base_min_size='0.01')
+        raw_book = {'sequence': 50, 'bids': [], 'asks': []}
+        for idx in range(300):
+            side = random.choice(['bids', 'asks'])
+            price = '{:.2f}'.format((random.randint(900, 1000) if side == 'bids' else random.randint(1001, 1100)) / 100)
+            raw_book[side].append([price, '{:.8f}'.format(random.randint(1, 10 ** 8) / 10 ** 7), str(idx)])
+        raw_trades = [{'time': '2017-01-01T00:00:0{}.5Z'.format(idx), 'side': 'sell', 'size': '0.5', 'price': '10'}
+                      for idx in range(3)]
+        snapshot = OrderBookSnapshot.from_gdax(product, raw_book, raw_trades)
+        assert snapshot.get_order_count() == 300
+        assert snapshot.get_trade_count() == 3
+
+        expected_ob = OrderBook(product, store=LadderOrderBookStore(product_id), trade_history=MemoryTradeHistory(60))
+        for side in OrderSide:
+            for price, size, order_id in raw_book[side.name + 's']:
+                expected_ob + Order(product_id, 50, side, size, price, order_id=order_id)
+
+        expected_ob.redis_server.flushdb()
+        redis_ob = OrderBook(product)
+        # a stale level from before a restart is dropped
+        redis_ob + Order(product_id, 0, OrderSide.bid, '1', '5', order_id='stale')
+        mirrored_ob = OrderBook(product, store=LadderOrderBookStore(product_id, RedisOrderBookStore('BTC-USD-mirror')),
+                                trade_history=MemoryTradeHistory(60))
+        mirror_reader_ob = OrderBook(product, store=RedisOrderBookStore('BTC-USD-mirror'))
+        for ob in [redis_ob, mirrored_ob]:
+            ob.load_snapshot(snapshot)
+            assert ob.get_sequence_id() == 50
+        for ob in [redis_ob, mirrored_ob, mirror_reader_ob]:
+            for side in OrderSide:
+                assert ob.get_store().get_levels(side, 0, 1000) == expected_ob.get_store().get_levels(side, 0, 1000)
+                for depth in [0, 0.5, 3, 1000]:
+                    assert ob.get_price(side, depth) == expected_ob.get_price(side, depth)
+        assert redis_ob.trade_history.get_trades(OrderSide.ask, OrderType.match, 0, 2e9) == \
+            mirrored_ob.trade_history.get_trades(OrderSide.ask, OrderType.match, 0, 2e9)
+        assert len(mirrored_ob.trade_history.get_trades(OrderSide.ask, OrderType.match, 0, 2e9)) == 3
+
+    def test_that_a_resync_replays_only_what_the_snapshot_is_missing(self):
+        product_id = 'BTC-USD'
+        product = Product(product_id=product_id, quote_currency=Currency.USD, base_currency=Currency.BTC,
+                          quote_increment='0.01', base_min_size='0.01')
+        # the first snapshot is from before the gap so has to be fetched again
+        snapshots = [OrderBookSnapshot(8, {}, {}),
+                     OrderBookSnapshot(11, {OrderSide.bid: [(1000, 10 ** 8, {'1': 10 ** 8})]}, {})]
+        executor = ThreadPoolExecutor(max_workers=1)
+        resync = OrderBookResync(product_id, 10, executor, lambda _: snapshots.pop(0))
+        for sequence_id in range(10, 14):
+            resync.add_message({'type': 'open', 'product_id': product_id, 'sequence': sequence_id})
+        snapshot = None
+        while snapshot is None:
+            snapshot = resync.get_snapshot()
+        executor.shutdown()
+        assert resync.get_attempts() == 2
+        assert snapshot.get_sequence_id() == 11
+        assert [message['sequence'] for message in resync.get_replay_messages(snapshot)] == [12, 13]
+
+        ob = OrderBook(product, sequence_id=9, store=LadderOrderBookStore(product_id),
+                       trade_history=MemoryTradeHistory(60))
+        ob + Order(product_id, 9, OrderSide.ask, '1', '11', order_id='2')
+        ob.load_snapshot(snapshot)
+        assert ob.get_best_bid_ask() == (10., None)
+        assert ob.get_sequence_id() == 11
+
 
 if __name__ == '__main__':
     unittest.main()
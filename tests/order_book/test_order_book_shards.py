@@ -0,0 +1,51 @@
+from multiprocessing import Process, Queue
+from trading_package.order_book.order_book_shards import OrderBookShardMap, OrderBookShardException
+import unittest
+
+PRODUCT_IDS = ['BTC-USD', 'ETH-USD', 'ETH-BTC', 'LTC-USD', 'LTC-BTC']
+
+
+def route_all(shard_map, product_ids, results):
+    results.put([shard_map.add_message(product_id) for product_id in product_ids])
+
+
+class OrderBookShardMapTestCase(unittest.TestCase):
+    def test_that_products_are_spread_over_the_shards(self):
+        shard_map = OrderBookShardMap(PRODUCT_IDS, 2, {'LTC-BTC': 1})
+        assert shard_map.get_shard('LTC-BTC') == 1
+        assert sorted(shard_map.get_product_ids(0) + shard_map.get_product_ids(1)) == sorted(PRODUCT_IDS)
+        assert sorted(len(shard_map.get_product_ids(shard)) for shard in range(2)) == [2, 3]
+        self.assertRaises(OrderBookShardException, OrderBookShardMap, PRODUCT_IDS, 2, {'BTC-USD': 2})
+        self.assertRaises(OrderBookShardException, OrderBookShardMap, PRODUCT_IDS, 0)
+
+        # the routing and message counts are shared with other processes
+        results = Queue()
+        process = Process(target=route_all, args=(shard_map, ['BTC-USD', 'BTC-USD', 'LTC-BTC'], results))
+        process.start()
+        shards = results.get(timeout=5)
+        process.join()
+        assert shards == [shard_map.get_shard('BTC-USD'), shard_map.get_shard('BTC-USD'), 1]
+        assert shard_map.get_message_counts()['BTC-USD'] == 2
+        assert shard_map.get_message_counts()['ETH-USD'] == 0
+
+    def test_that_rebalancing_moves_products_off_the_busiest_shard(self):
+        shard_map = OrderBookShardMap(PRODUCT_IDS, 2, {'LTC-BTC': 1})
+        shard_map.assign({'BTC-USD': 0, 'ETH-USD': 0, 'ETH-BTC': 0, 'LTC-USD': 1})
+        rates = {'BTC-USD': 100., 'ETH-USD': 60., 'ETH-BTC': 30., 'LTC-USD': 5., 'LTC-BTC': 5.}
+        assert shard_map.get_loads(rates) == [190., 10.]
+        # within the threshold nothing moves
+        assert shard_map.rebalance(rates, threshold=2) == {}
+        # the product that evens the shards out most goes first
+        moved = shard_map.rebalance(rates, threshold=1.2)
+        assert moved == {'BTC-USD': 1, 'LTC-USD': 0}
+        assert shard_map.get_loads(rates) == [95., 105.]
+        assert shard_map.rebalance(rates, threshold=1.2) == {}
+        # pinned products never move
+        rates['LTC-BTC'] = 500.
+        shard_map.rebalance(rates, threshold=1.2)
+        assert shard_map.get_shard('LTC-BTC') == 1
+        assert shard_map.get_product_ids(1) == ['LTC-BTC']
+
+
+if __name__ == '__main__':
+    unittest.main()
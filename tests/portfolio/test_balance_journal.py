@@ -0,0 +1,58 @@
+from redis import StrictRedis
+from trading_package.portfolio.balance_journal import BalanceJournal
+import time
+import unittest
+
+
+class BalanceJournalTestCase(unittest.TestCase):
+    redis_server = StrictRedis(host='localhost', port=6379, db=0, encoding="utf-8", decode_responses=True)
+    persistent_redis_server = StrictRedis(host='localhost', port=6379, db=1, encoding="utf-8",
+                                          decode_responses=True)
+    key = 'test:portfolio:balance:BTC'
+
+    def setUp(self):
+        self.redis_server.delete(self.key)
+        self.persistent_redis_server.delete(self.key)
+
+    def tearDown(self):
+        self.persistent_redis_server.delete(self.key)
+
+    def test_that_writes_are_coalesced_and_written_behind(self):
+        journal = BalanceJournal(self.redis_server, self.persistent_redis_server, flush_interval=60)
+        for qty in ['1', '2', '3']:
+            journal.set(self.key, qty)
+            journal.add_history(self.key, '100', qty)
+        journal.add_history(self.key, '101', '3')
+        assert self.redis_server.get(self.key) is None
+        assert journal.get_pending() == 4
+        assert journal.flush() == 4
+        assert self.redis_server.get(self.key) == '3'
+        assert self.persistent_redis_server.zrange(self.key, 0, -1, withscores=True) == [('1', 100.), ('2', 100.),
+                                                                                         ('3', 101.)]
+        stats = journal.get_stats()
+        assert (stats['writes'], stats['coalesced'], stats['flushed'], stats['flushes']) == (7, 3, 4, 1)
+        assert journal.flush() == 0
+
+        # the thread writes on its own and close writes whatever is left
+        journal = BalanceJournal(self.redis_server, self.persistent_redis_server, flush_interval=0.01)
+        journal.set(self.key, '4')
+        deadline = time.time() + 5
+        while self.redis_server.get(self.key) != '4' and time.time() < deadline:
+            time.sleep(0.01)
+        assert self.redis_server.get(self.key) == '4'
+        journal.close()
+        journal.set(self.key, '5')
+        assert journal.close() == 1
+        assert self.redis_server.get(self.key) == '5'
+
+    def test_that_sync_writes_go_straight_to_redis(self):
+        journal = BalanceJournal(self.redis_server, self.persistent_redis_server, sync=True)
+        journal.set(self.key, '6')
+        journal.add_history(self.key, '100', '6')
+        assert self.redis_server.get(self.key) == '6'
+        assert self.persistent_redis_server.zscore(self.key, '6') == 100.
+        assert journal.get_pending() == 0
+
+
+if __name__ == '__main__':
+    unittest.main()
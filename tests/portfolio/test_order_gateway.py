@@ -0,0 +1,111 @@
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from requests import RequestException
+from socketserver import ThreadingMixIn
+from threading import Thread
+from trading_package.helper.enums import OrderSide, Currency
+from trading_package.order_book.order import Order
+from trading_package.portfolio.order_gateway import GdaxAuth, OrderGateway
+from trading_package.portfolio.product import Product, ProductManager
+import base64
+import json
+import time
+import unittest
+
+
+# http.server only has ThreadingHTTPServer from python 3.7
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+# answers like the exchange's order endpoints, each request taking DELAY seconds
+class StubExchangeHandler(BaseHTTPRequestHandler):
+    DELAY = 0.2
+    protocol_version = 'HTTP/1.1'
+    auth = GdaxAuth('key', base64.b64encode(b'secret').decode('utf-8'), 'passphrase')
+    signatures_valid = True
+    connections = set()
+
+    def log_message(self, format, *args):
+        pass
+
+    def check_signature(self, body: str) -> None:
+        expected = self.auth.get_signature(self.headers['CB-ACCESS-TIMESTAMP'], self.command, self.path, body)
+        StubExchangeHandler.signatures_valid = self.signatures_valid and self.headers['CB-ACCESS-SIGN'] == expected
+        StubExchangeHandler.connections.add(self.client_address)
+
+    def respond(self, result) -> None:
+        time.sleep(self.DELAY)
+        body = json.dumps(result).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8')
+        self.check_signature(body)
+        params = json.loads(body)
+        if Decimal(params['size']) <= 0:
+            self.respond({'message': 'Invalid size'})
+        else:
+            self.respond(dict(params, id='order-{}'.format(params['price']), status='pending'))
+
+    def do_DELETE(self):
+        self.check_signature('')
+        self.respond([self.path.split('/')[-1]])
+
+
+class OrderGatewayTestCase(unittest.TestCase):
+    def setUp(self):
+        StubExchangeHandler.signatures_valid = True
+        StubExchangeHandler.connections = set()
+        self.server = _Server(('localhost', 0), StubExchangeHandler)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        product_manager = ProductManager()
+        product_manager + Product('BTC-USD', Currency.USD, Currency.BTC, '0.01', '0.01')
+        self.gateway = OrderGateway('http://localhost:{}'.format(self.server.server_port), 'key',
+                                    base64.b64encode(b'secret').decode('utf-8'), 'passphrase', max_workers=3,
+                                    product_manager=product_manager)
+
+    def tearDown(self):
+        self.gateway.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    @staticmethod
+    def get_order(price: str, size: str) -> Order:
+        return Order('BTC-USD', 0, OrderSide.bid, size, price)
+
+    def test_that_orders_are_placed_concurrently(self):
+        orders = [self.get_order(price, '0.01') for price in ['100', '200', '300']]
+        start = time.time()
+        futures = self.gateway.place_orders(orders)
+        responses = [future.result() for future in futures]
+        assert time.time() - start < 2 * StubExchangeHandler.DELAY
+        assert [response['id'] for response in responses] == ['order-100.00', 'order-200.00', 'order-300.00']
+        assert [response['side'] for response in responses] == ['buy'] * 3
+
+        # the connections are kept and used again
+        responses = [future.result() for future in self.gateway.place_orders(orders)]
+        assert len(responses) == 3 and len(StubExchangeHandler.connections) == 3
+        assert self.gateway.cancel_order('order-100.00').result() == ['order-100.00']
+        assert StubExchangeHandler.signatures_valid
+        stats = self.gateway.get_stats()
+        assert (stats['requests'], stats['errors']) == (7, 0)
+
+    def test_that_rejections_and_failures_come_back_on_the_future(self):
+        assert self.gateway.place_order(self.get_order('100', '0')).result() == {'message': 'Invalid size'}
+        self.server.shutdown()
+        self.server.server_close()
+        gateway = OrderGateway('http://localhost:{}'.format(self.server.server_port), 'key',
+                               base64.b64encode(b'secret').decode('utf-8'), 'passphrase', timeout=1)
+        with self.assertRaises(RequestException):
+            gateway.cancel_order('order-100').result()
+        assert gateway.get_stats()['errors'] == 1
+        gateway.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
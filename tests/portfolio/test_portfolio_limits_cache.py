@@ -0,0 +1,73 @@
+from decimal import Decimal
+from redis import StrictRedis
+from trading_package.helper.enums import Currency
+from trading_package.portfolio.portfolio import Portfolio
+from trading_package.portfolio.portfolio_limits_cache import PortfolioLimitsCache
+import time
+import unittest
+
+
+class PortfolioLimitsCacheTestCase(unittest.TestCase):
+    redis_server = StrictRedis(host='localhost', port=6379, db=1)
+    keys = [PortfolioLimitsCache.get_key(kind, Currency.BTC) for kind in
+            [PortfolioLimitsCache.MIN_FRACTION, PortfolioLimitsCache.MAX_FRACTION]]
+
+    # db 1 is persistent so whatever limits were there are put back, as is the server's config
+    def setUp(self):
+        self.saved = dict(zip(self.keys, self.redis_server.mget(self.keys)))
+        self.redis_server.delete(*self.keys)
+        self.saved_events = self.redis_server.config_get('notify-keyspace-events')['notify-keyspace-events']
+
+    def tearDown(self):
+        for key, value in self.saved.items():
+            if value is None:
+                self.redis_server.delete(key)
+            else:
+                self.redis_server.set(key, value)
+        self.redis_server.config_set('notify-keyspace-events', self.saved_events)
+
+    def wait_for(self, get, expected):
+        deadline = time.time() + 5
+        while get() != expected and time.time() < deadline:
+            time.sleep(0.01)
+        assert get() == expected
+
+    def test_that_limit_changes_reach_the_cache(self):
+        self.redis_server.config_set('notify-keyspace-events', '')
+        assert not PortfolioLimitsCache.keyspace_notifications_enabled(self.redis_server)
+        assert PortfolioLimitsCache.enable_keyspace_notifications(self.redis_server)
+        self.redis_server.set(self.keys[1], '0.5')
+        cache = PortfolioLimitsCache(self.redis_server, [Currency.BTC, Currency.USD])
+        portfolio = Portfolio(Currency.BTC, '1', min_fraction='0.1', limits_cache=cache)
+        assert portfolio.get_max_fraction() == Decimal('0.5')
+        assert portfolio.get_min_fraction() == Decimal('0.1')
+        assert cache.get_min_fraction(Currency.USD) is None
+
+        # as an operator would with redis-cli
+        self.redis_server.set(self.keys[0], '0.2')
+        self.wait_for(portfolio.get_min_fraction, Decimal('0.2'))
+        self.redis_server.delete(self.keys[1])
+        self.wait_for(portfolio.get_max_fraction, Decimal('1.0'))
+        assert cache.keyspace_notifications
+
+        # published on the channel where keyspace notifications cannot be used
+        cache.set_fraction(PortfolioLimitsCache.MAX_FRACTION, Currency.BTC, '0.7')
+        self.wait_for(portfolio.get_max_fraction, Decimal('0.7'))
+        stats = cache.get_stats()
+        assert stats['notifications'] >= 3 and stats['errors'] == 0 and stats['lookups'] > 0
+        cache.close()
+
+    def test_that_the_cache_does_not_change_the_server(self):
+        self.redis_server.config_set('notify-keyspace-events', '')
+        cache = PortfolioLimitsCache(self.redis_server, [Currency.BTC])
+        assert cache.get_max_fraction(Currency.BTC) is None
+        # the published key still gets through
+        cache.set_fraction(PortfolioLimitsCache.MAX_FRACTION, Currency.BTC, '0.3')
+        self.wait_for(lambda: cache.get_max_fraction(Currency.BTC), Decimal('0.3'))
+        assert cache.keyspace_notifications is False
+        assert self.redis_server.config_get('notify-keyspace-events')['notify-keyspace-events'] == ''
+        cache.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+from decimal import Decimal
+from trading_package.helper.enums import Currency, OrderSide, OrderStatus
+from trading_package.order_book.order import Order
+from trading_package.portfolio.portfolio_order_book import PortfolioOrderBook
+from trading_package.portfolio.product import Product, ProductManager
+import random
+import unittest
+
+
+class PortfolioOrderBookTestCase(unittest.TestCase):
+    product_manager = ProductManager()
+    product_manager + Product(product_id='BTC-USD', quote_currency=Currency.USD, base_currency=Currency.BTC,
+                              quote_increment='0.01', base_min_size='0.01')
+    product_manager + Product(product_id='LTC-BTC', quote_currency=Currency.BTC, base_currency=Currency.LTC,
+                              quote_increment='0.0001', base_min_size='0.0001')
+
+    # what the totals should be, worked out from the open orders
+    def get_expected(self, order_book: PortfolioOrderBook):
+        hold_qties = {currency: Decimal('0') for currency in Currency}
+        edge_qties = {}
+        edges = set()
+        for order in order_book.get_orders(OrderStatus.open).values():
+            product = self.product_manager.get_product(order.get_product_id())
+            side = order.get_order_side()
+            source_currency = product.get_source_currency(side)
+            hold_qty = product.get_currency_quantity_from_quote_quantity(source_currency, order.get_remaining_size(),
+                                                                         order.get_price())
+            hold_qties[source_currency] = hold_qties[source_currency] + hold_qty
+            currency_set = frozenset(product.get_currency_set())
+            edge_qties[currency_set] = edge_qties.get(currency_set, Decimal('0')) + Decimal(order.get_remaining_size())
+            edges.add((source_currency, product.get_destination_currency(side)))
+        return hold_qties, edge_qties, edges
+
+    def test_that_running_totals_match_the_open_orders(self):
+        random.seed(5)
+        order_book = PortfolioOrderBook(self.product_manager)
+        for idx in range(300):
+            open_ids = sorted(order_book.get_orders(OrderStatus.open))
+            action = random.random()
+            if action < 0.4 or len(open_ids) == 0:
+                product_id = random.choice(['BTC-USD', 'LTC-BTC'])
+                price = '{:.2f}'.format(random.uniform(100, 200)) if product_id == 'BTC-USD' else \
+                    '{:.4f}'.format(random.uniform(0.01, 0.02))
+                order_book + Order(product_id, idx, random.choice(list(OrderSide)), '{:.8f}'.format(random.random()),
+                                   price, order_id=str(idx))
+            elif action < 0.7:
+                order, _ = order_book.get_order_and_status_by_id(random.choice(open_ids))
+                order_book.match_order(order.get_order_id(), '{:.8f}'.format(
+                    Decimal(order.get_remaining_size()) * Decimal(random.choice(['0.5', '1']))))
+            elif action < 0.75:
+                order_book.fill_order(random.choice(open_ids))
+            elif action < 0.8:
+                # as the portfolio processor does while a cancel is confirmed, the order stays with the open ones
+                order, _ = order_book.get_order_and_status_by_id(random.choice(open_ids))
+                order.update_status(OrderStatus.canceled)
+            elif action < 0.9:
+                order_book.cancel_order(random.choice(open_ids))
+            else:
+                order_book - random.choice(open_ids)
+            hold_qties, edge_qties, edges = self.get_expected(order_book)
+            for currency in Currency:
+                assert order_book.get_hold_qty(currency) == hold_qties[currency]
+            for source_currency in Currency:
+                for destination_currency in Currency:
+                    assert order_book.get_edge_qty(source_currency, destination_currency) == edge_qties.get(
+                        frozenset([source_currency, destination_currency]), 0)
+            assert order_book.get_edges_with_open_orders() == edges
+
+        order_id = 'last'
+        order_book + Order('BTC-USD', 0, OrderSide.bid, '1', '10.0', order_id=order_id)
+        assert order_book.get_order_and_status_by_id(order_id)[1] == OrderStatus.open
+        order_book.cancel_order(order_id)
+        order, status = order_book.get_order_and_status_by_id(order_id)
+        assert (order.get_order_id(), status) == (order_id, OrderStatus.canceled)
+        assert order_id not in order_book.get_orders(OrderStatus.open)
+        assert order_book.get_order_and_status_by_id('missing') == (None, None)
+
+
+if __name__ == '__main__':
+    unittest.main()
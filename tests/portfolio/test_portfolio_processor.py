@@ -0,0 +1,61 @@
+from concurrent.futures import Future
+from importlib.util import find_spec
+from multiprocessing import Event, Queue
+from trading_package.helper.enums import Currency
+from trading_package.network.network_change_listener import NetworkChangeListener
+from trading_package.portfolio.portfolio import Portfolio
+from trading_package.portfolio.product import Product, ProductManager
+import time
+import unittest
+
+# the processor talks to the exchange through the GDAX client
+GDAX_INSTALLED = find_spec('GDAX') is not None
+
+
+@unittest.skipUnless(GDAX_INSTALLED, 'GDAX is not installed')
+class PortfolioProcessorTestCase(unittest.TestCase):
+    product = Product(product_id='BTC-USD', quote_currency=Currency.USD, base_currency=Currency.BTC,
+                      quote_increment='0.01', base_min_size='0.01')
+    product_manager = ProductManager()
+    product_manager + product
+
+    def test_that_messages_before_the_order_is_placed_are_replayed(self):
+        from trading_package.portfolio.portfolio_processor import PortfolioProcessor
+        feed = Queue()
+        processor = PortfolioProcessor(self.product_manager, feed, Queue(), Event(), [])
+        processor.network_changes = NetworkChangeListener(0)
+        for currency in [Currency.USD, Currency.BTC]:
+            processor.portfolio + Portfolio(currency, '100')
+
+        # the order fills before the exchange has answered the request placing it
+        messages = [{'type': 'received', 'order_id': 'a', 'product_id': 'BTC-USD', 'side': 'buy', 'size': '1',
+                     'price': '10.00'},
+                    {'type': 'match', 'maker_order_id': 'a', 'taker_order_id': 'b', 'product_id': 'BTC-USD',
+                     'side': 'buy', 'size': '1', 'price': '10.00'},
+                    {'type': 'done', 'order_id': 'a', 'product_id': 'BTC-USD', 'side': 'buy', 'reason': 'filled',
+                     'remaining_size': '0', 'price': '10.00'}]
+        for message in messages:
+            feed.put(message)
+        deadline = time.time() + 5
+        while processor.held_messages.get_held() < len(messages) and time.time() < deadline:
+            processor.process_websocket_message()
+        assert processor.held_messages.get_held() == len(messages)
+        assert processor.portfolio.get_available_qty(Currency.BTC) == 100
+
+        placed = Future()
+        placed.set_result({'id': 'a', 'product_id': 'BTC-USD', 'side': 'buy', 'size': '1', 'price': '10.00',
+                           'filled_size': '0', 'status': 'pending', 'created_at': '2017-01-01T00:00:00.000000Z'})
+        batch = {'failed': False, 'order_ids': []}
+        processor.handle_placed_order(batch, placed)
+        assert batch['order_ids'] == ['a']
+        assert processor.held_messages.get_held() == 0
+        assert processor.portfolio.get_available_qty(Currency.USD) == 90
+        assert processor.portfolio.get_available_qty(Currency.BTC) == 101
+        # done took it off again
+        assert 'a' not in processor.registered_orders
+        processor.network_changes.close()
+        processor.portfolio.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
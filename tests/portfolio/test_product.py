@@ -29,6 +29,15 @@ class ProductTestCase(unittest.TestCase):
     def test_get_diff_price(self):
         assert self.product.get_lower_price('1000.0') == Decimal('999.99')
         assert self.product.get_higher_price('1000.0') == Decimal('1000.01')
+        assert self.product.round_price('1000.004') == Decimal('1000.00')
+
+    def test_ticks(self):
+        assert self.product.price_to_ticks('1000.01') == 100001
+        assert self.product.ticks_to_price(100001) == 1000.01
+        assert self.product.ticks_to_str(100001) == '1000.01'
+        assert self.product.price_to_str('1000.0100001') == '1000.01'
+        assert self.product.notional_to_quote_value(100001 * 150000000) == 1500.015
+        assert self.product.get_base_min_size_units() == 1000000
 
     def test_round_qty(self):
         assert self.product.round_quantity('10.00000042') == Decimal('10.00')
@@ -1,4 +1,18 @@
 NETWORK_LOOKBACK = 24*60*30 # 24 hour lookback
+# network edges are recomputed once a book's changes are RECOMPUTE_WINDOW seconds old so bursts are coalesced
+# and trade size edges at least every RECOMPUTE_MAX_AGE seconds (see EdgeRecomputeScheduler)
+NETWORK_RECOMPUTE_WINDOW = 0.05
+NETWORK_RECOMPUTE_MAX_AGE = 60
+# simple_cycles values every cycle of the network but their number grows exponentially with the currencies,
+# bellman_ford only finds up to MAX_NEGATIVE_CYCLES profitable cycles of at most MAX_CYCLE_LENGTH edges
+# (None for any length) but scales to hundreds of currencies (see NegativeCycleFinder)
+NETWORK_CYCLE_ENGINE = 'simple_cycles'
+NETWORK_MAX_CYCLE_LENGTH = 4
+NETWORK_MAX_NEGATIVE_CYCLES = 20
+# network weights read less than CACHE_MAX_AGE seconds ago are used without checking they are still current
+NETWORK_CACHE_MAX_AGE = 0
+# every network update is published on CHANGES_CHANNEL (see NetworkManager.publish_changes)
+NETWORK_CHANGES_CHANNEL = 'network_changes'
 
 
 STALE_OPEN_ORDERS = 5*60 # 1 minute stale order cancellation
@@ -10,6 +24,11 @@ EDGE_TYPE = 'mean'
 MIN_CYCLE_RETURN = 1.005 # 0.5%
 
 
+# the strategy only looks for trades after the network or our orders changed
+# and at most once every MIN_INTERVAL seconds
+STRATEGY_MIN_INTERVAL = 0.1
+
+
 # I want to be able to fill a
 # x% mean order
 # and fill at the better part of the price
@@ -29,6 +48,104 @@ ORDER_CONFIRMATION_TIME = 600
 ORDER_AGGREGATION_TIME = 1
 
 
+# order book sizes are carried as integer multiples of 1 / SIZE_UNITS (the exchange's size precision)
+# and prices as integer ticks of each product's quote increment
+SIZE_DECIMALS = 8
+SIZE_UNITS = 10 ** SIZE_DECIMALS
+
+
+# keep the order book in the order book processor's memory rather than redis
+# network edges are then computed by the order book processor itself
+IN_MEMORY_ORDER_BOOK = True
+
+
+# copy the in memory order book to redis (for anyone else reading it)
+# at most once every interval seconds
+ORDER_BOOK_REDIS_MIRROR = True
+ORDER_BOOK_MIRROR_INTERVAL = 0.5
+
+
+# queue order book redis writes on one pipeline which is flushed after a drained batch
+# of websocket messages, after MAX_BATCH_SIZE mutations or MAX_DELAY seconds (whichever is first)
+# TRANSACTION wraps each flush in MULTI/EXEC
+ORDER_BOOK_BATCH_WRITES = True
+ORDER_BOOK_WRITE_MAX_BATCH_SIZE = 500
+ORDER_BOOK_WRITE_MAX_DELAY = 0.002
+ORDER_BOOK_WRITE_TRANSACTION = False
+
+
+# apply each message to a redis order book with a single lua script
+# (only used when the order book is not kept in memory)
+ORDER_BOOK_LUA_SCRIPTS = True
+
+
+# a sequence gap on one product only resyncs that product's book
+# the websocket sends a message of this type and the order book processor buffers the product's
+# messages while its snapshot is fetched on one of RESYNC_THREADS threads, then replays them
+ORDER_BOOK_RESYNC_MESSAGE = 'resync'
+ORDER_BOOK_RESYNC_THREADS = 2
+
+
+# books are kept by SHARDS order book processors, each owning some of the products (see OrderBookShardMap)
+# SHARD_MAP pins products to shards ({product id: shard}), the rest are moved between shards every
+# REBALANCE_INTERVAL seconds by message rate when the busiest shard has more than REBALANCE_THRESHOLD
+# times the average rate; a product that moves is handed to its new shard with a message of HANDOFF_MESSAGE type
+ORDER_BOOK_SHARDS = 2
+ORDER_BOOK_SHARD_MAP = {}
+ORDER_BOOK_REBALANCE_INTERVAL = 300
+ORDER_BOOK_REBALANCE_THRESHOLD = 1.5
+ORDER_BOOK_HANDOFF_MESSAGE = 'handoff'
+
+
+# the websocket writes each message once to a shared memory ring buffer read by both the order book
+# and portfolio processors instead of putting it on a queue for each of them
+# SLOTS messages of up to SLOT_SIZE bytes are held, per reader stats are logged every STATS_INTERVAL seconds
+WEBSOCKET_RING_BUFFER = True
+WEBSOCKET_RING_SLOTS = 16384
+WEBSOCKET_RING_SLOT_SIZE = 2048
+WEBSOCKET_RING_STATS_INTERVAL = 60
+# messages go through the ring buffer in the fixed binary layout of MessageCodec rather than as json
+WEBSOCKET_BINARY_MESSAGES = True
+# the websocket only sends the portfolio processor messages about our own orders (see OrderIdFilter)
+PORTFOLIO_ORDER_ID_FILTER = True
+# how many messages about orders not registered yet are held in case they are about to be (see HeldMessages)
+PORTFOLIO_HELD_MESSAGES = 20000
+# seconds between the websocket picking up the order ids the portfolio registered (see OrderIdFilter.sync)
+PORTFOLIO_ORDER_ID_SYNC_INTERVAL = 0.01
+
+
+# process loops block on their queue for up to QUEUE_TIMEOUT seconds when it is empty rather than
+# spinning, then drain up to QUEUE_BATCH_SIZE messages before doing the rest of their work
+# the network processor waits up to NETWORK_UPDATE_TIMEOUT seconds to be told a book changed
+# every process logs its CPU usage every CPU_STATS_INTERVAL seconds
+PROCESS_QUEUE_TIMEOUT = 0.05
+PROCESS_QUEUE_BATCH_SIZE = 1000
+PROCESS_NETWORK_UPDATE_TIMEOUT = 1
+PROCESS_CPU_STATS_INTERVAL = 60
+
+
+# balances are written to redis by a background thread at most JOURNAL_FLUSH_INTERVAL seconds after they change,
+# repeated writes of the same balance in between only writing the last; with JOURNAL_SYNC every write goes
+# straight to redis (see BalanceJournal)
+PORTFOLIO_JOURNAL_FLUSH_INTERVAL = 0.5
+PORTFOLIO_JOURNAL_SYNC = False
+# min and max fractions are cached in memory and read again from redis when it says they changed, when a key
+# (or 'all') is published on LIMITS_CHANNEL and every LIMITS_RELOAD_INTERVAL seconds (see PortfolioLimitsCache)
+PORTFOLIO_LIMITS_CHANNEL = 'portfolio_limits'
+PORTFOLIO_LIMITS_RELOAD_INTERVAL = 60
+# the process manager switches on the keyspace notifications the cache needs at startup, which changes the redis
+# server for every client; with this off they have to be in the server's own config (notify-keyspace-events K$gx)
+# or changes only get through LIMITS_CHANNEL and reloads
+PORTFOLIO_LIMITS_KEYSPACE_EVENTS = True
+
+
+# orders are placed and canceled by GATEWAY_WORKERS threads each keeping a connection to GATEWAY_URL open
+# (see OrderGateway), requests taking longer than GATEWAY_TIMEOUT seconds fail
+ORDER_GATEWAY_URL = 'https://api.gdax.com'
+ORDER_GATEWAY_WORKERS = 4
+ORDER_GATEWAY_TIMEOUT = 5
+
+
 # Really try to restrict exposure
 # Note that these defaults are subsidiary to redis
 PORTFOLIO_MAKEUP = {
@@ -3,12 +3,18 @@ import signal
 from twisted.python import log
 import traceback
 import json
-from twisted.internet import reactor
+from twisted.internet import reactor, task
 from twisted.internet.protocol import ReconnectingClientFactory
 from autobahn.twisted.websocket import WebSocketClientProtocol, WebSocketClientFactory, connectWS
 from datetime import datetime
+from trading_package.config.constants import ORDER_BOOK_RESYNC_MESSAGE, ORDER_BOOK_HANDOFF_MESSAGE, \
+    PORTFOLIO_ORDER_ID_SYNC_INTERVAL
+from trading_package.exchange_websocket.order_id_filter import OrderIdFilter
+from trading_package.exchange_websocket.shared_ring_buffer import SharedRingBuffer, SharedRingBufferException
+from trading_package.order_book.order_book_shards import OrderBookShardMap
 from trading_package.portfolio.product import ProductManager
 from multiprocessing import Queue, Event
+from typing import Optional, List, Dict
 
 
 class MyClientProtocol(WebSocketClientProtocol):
@@ -23,6 +29,9 @@ class MyClientProtocol(WebSocketClientProtocol):
         self.log.info('Product ids: {}'.format(self.products))
         sub_params = json.dumps({"type": "subscribe", "product_ids": self.products}).encode('utf-8')
         self.sendMessage(sub_params)
+        if self.order_id_filter is not None:
+            self.order_id_sync = task.LoopingCall(self.sync_order_ids)
+            self.order_id_sync.start(PORTFOLIO_ORDER_ID_SYNC_INTERVAL, now=False)
         self.ready_event.set()
 
     def onMessage(self, payload, is_binary) -> None:
@@ -36,27 +45,116 @@ class MyClientProtocol(WebSocketClientProtocol):
         raw_msg = json.loads(raw_msg)
         this_sequence_id = int(raw_msg['sequence'])
         product_id = raw_msg['product_id']
-        if product_id in self.last_sequence_id and this_sequence_id != self.last_sequence_id[product_id] + 1:
-            error_msg = 'Sequence ids out of order ({}:{}, {})'.format(product_id, this_sequence_id, self.last_sequence_id)
-            self.log.error(error_msg)
-            self.exit.set()
-            self.sendClose()
+        last_sequence_id = self.last_sequence_id.get(product_id)
+        if last_sequence_id is not None and this_sequence_id <= last_sequence_id:
             return
+        # a handoff rebuilds the book from a snapshot anyway so there is no need to resync it as well
+        handed_off = self.hand_off_if_moved(product_id, this_sequence_id)
+        # only the product with the gap is resynced (see OrderBookResync), everything else keeps going
+        in_sync = True
+        gap = last_sequence_id is not None and this_sequence_id != last_sequence_id + 1
+        if handed_off:
+            self.resync_products.discard(product_id)
+        elif gap or product_id in self.resync_products:
+            if gap:
+                error_msg = 'Sequence ids out of order ({}:{}, {})'.format(product_id, this_sequence_id,
+                                                                          last_sequence_id)
+                self.log.error(error_msg)
+            in_sync = self.resync_order_book(product_id, this_sequence_id)
         self.last_sequence_id[product_id] = this_sequence_id
         try:
             if raw_msg['type'] in ['received', 'open', 'done', 'match', 'change']:
-                self.result_queue.put(raw_msg, False)
-                self.task_queue.put(raw_msg, False)
+                # the ring buffers take the payload as it came off the wire, encoded once for both
+                encoded = None if self.ring_buffers is None else self.ring_buffers[0].encode(raw_msg, payload)
+                # the order book goes first so the portfolio falling behind cannot cost it a message
+                if in_sync and not self.put_feed_message(raw_msg, encoded):
+                    self.resync_order_book(product_id, this_sequence_id + 1)
+                for item in self.get_portfolio_deliveries(raw_msg, encoded):
+                    self.put_portfolio_item(item)
             elif raw_msg['type'] == 'heartbeat':
                 pass
             else:
                 self.log.info('msg: {} ignored\n'.format(raw_msg))
+        except SharedRingBufferException as e:
+            self.log.error(str(e))
         except multiprocessing.queues.Full as e:
             self.log.error(traceback.format_exc())
             self.log.error(str(e))
 
+    # False if the order book could not take the message
+    def put_feed_message(self, message: Dict, encoded: Optional[bytes] = None) -> bool:
+        shard = 0 if self.shard_map is None else self.routes[message['product_id']]
+        try:
+            if self.ring_buffers is None:
+                self.result_queues[shard].put(message, False)
+            else:
+                self.ring_buffers[shard + 1].put(encoded)
+        except (SharedRingBufferException, multiprocessing.queues.Full) as e:
+            self.log.error('Order book lost {}:{}, {}'.format(message['product_id'], message['sequence'], e))
+            return False
+        return True
+
+    # everything before sequence_id has to come from the snapshot (see OrderBookResync)
+    # a resync that cannot be sent is tried again before the product's next message, which is held back until then
+    def resync_order_book(self, product_id: str, sequence_id: int) -> bool:
+        try:
+            self.put_order_book_message({'type': ORDER_BOOK_RESYNC_MESSAGE, 'product_id': product_id,
+                                         'sequence': sequence_id})
+        except (SharedRingBufferException, multiprocessing.queues.Full) as e:
+            self.log.error('Could not resync {}: {}'.format(product_id, e))
+            self.resync_products.add(product_id)
+            return False
+        self.resync_products.discard(product_id)
+        return True
+
+    # with an order id filter the portfolio only gets messages about its own orders (see OrderIdFilter)
+    def get_portfolio_deliveries(self, message: Dict, item=None) -> List:
+        if self.order_id_filter is None:
+            return [message if item is None else item]
+        return self.order_id_filter.get_deliveries(message, item)
+
+    def put_portfolio_item(self, item) -> None:
+        if self.ring_buffers is None:
+            self.task_queue.put(item, False)
+        else:
+            self.ring_buffers[0].put(item)
+
+    # sends on whatever was held for the orders the portfolio registered since the last sync (see OrderIdFilter)
+    # an exception would stop the looping call so it is only logged
+    def sync_order_ids(self) -> None:
+        try:
+            for item in self.order_id_filter.sync():
+                self.put_portfolio_item(item)
+        except (SharedRingBufferException, multiprocessing.queues.Full) as e:
+            self.log.error(str(e))
+
+    # counts the message and if the product has just been moved to another shard, routes it there from now on
+    # and hands it over (the new shard rebuilds the book from a snapshot, see OrderBookProcessor.start_handoff)
+    def hand_off_if_moved(self, product_id: str, sequence_id: int) -> bool:
+        if self.shard_map is None:
+            return False
+        shard = self.shard_map.add_message(product_id)
+        if self.routes[product_id] == shard:
+            return False
+        self.log.info('Handing {} from shard {} to {} at {}'.format(product_id, self.routes[product_id], shard,
+                                                                  sequence_id))
+        self.routes[product_id] = shard
+        self.put_order_book_message({'type': ORDER_BOOK_HANDOFF_MESSAGE, 'product_id': product_id,
+                                     'sequence': sequence_id})
+        return True
+
+    # messages only the owning order book processor needs
+    def put_order_book_message(self, message: Dict) -> None:
+        shard = 0 if self.shard_map is None else self.routes[message['product_id']]
+        if self.ring_buffers is None:
+            self.result_queues[shard].put(message, False)
+        else:
+            self.ring_buffers[shard + 1].put_message(message)
+
     def onClose(self, wasClean, code, reason) -> None:
         self.log.info("-- Process Terminated! --")
+        if self.order_id_sync is not None and self.order_id_sync.running:
+            self.order_id_sync.stop()
 
 
 class MyClientFactory(WebSocketClientFactory, ReconnectingClientFactory):
@@ -84,13 +182,30 @@ class ExchangeWebsocket(multiprocessing.Process):
     PROCESS_NAME = 'Exchange Websocket'
     URL = 'wss://ws-feed.gdax.com'
 
-    def __init__(self, pm: ProductManager, task_queue: Queue, result_queue: Queue, ready_event: Event, exit_event: Event) -> None:
+    # task_queue gets every message and result_queues one queue per order book shard (see OrderBookShardMap)
+    # with ring buffers the queues are not used (see SharedRingBuffer): the first ring gets every message
+    # and there is one more ring per shard
+    # without a shard map every order book message goes to the first shard
+    # with an order id filter only messages about the portfolio's own orders go to task_queue (or the first ring)
+    def __init__(self, pm: ProductManager, task_queue: Queue, result_queues: List[Queue], ready_event: Event,
+                 exit_event: Event, ring_buffers: Optional[List[SharedRingBuffer]] = None,
+                 shard_map: Optional[OrderBookShardMap] = None,
+                 order_id_filter: Optional[OrderIdFilter] = None) -> None:
         multiprocessing.Process.__init__(self)
         protocol = MyClientProtocol
         protocol.products = pm.get_product_ids()
         protocol.task_queue = task_queue
-        protocol.result_queue = result_queue
+        protocol.result_queues = result_queues
+        protocol.ring_buffers = ring_buffers
+        protocol.shard_map = shard_map
+        protocol.order_id_filter = order_id_filter
+        # syncs the order id filter while connected
+        protocol.order_id_sync = None
+        # product id => shard its messages were last sent to
+        protocol.routes = None if shard_map is None else shard_map.get_assignment()
         protocol.last_sequence_id = {}
+        # products whose order book lost a message and still need a resync sent
+        protocol.resync_products = set()
         protocol.exit = exit_event
         protocol.ready_event = ready_event
         self.protocol = protocol
@@ -119,7 +234,7 @@ def main():
     ready_event = multiprocessing.Event()
     result_queue = multiprocessing.Queue()
     queues = [task_queue, result_queue]
-    wsClient = ExchangeWebsocket(get_product_manager(), task_queue, result_queue, ready_event,
+    wsClient = ExchangeWebsocket(get_product_manager(), task_queue, [result_queue], ready_event,
                                  exit_event)
     wsClient.daemon = True
     wsClient.start()
@@ -0,0 +1,196 @@
+import json
+from decimal import Decimal, InvalidOperation
+from struct import Struct
+from typing import Dict, List, Optional, Union
+from uuid import UUID
+
+from trading_package.config.constants import ORDER_BOOK_RESYNC_MESSAGE, ORDER_BOOK_HANDOFF_MESSAGE
+from trading_package.helper.fixed_point import size_to_units, units_to_str
+from trading_package.helper.timestamps import parse_timestamp_ns, ns_to_iso
+from trading_package.portfolio.product import ProductManager
+
+
+class MessageCodecException(Exception):
+    pass
+
+
+# Fixed layout binary encoding of websocket messages for passing between processes.
+# A message is
+# (magic, product index, type, side, reason, sequence, epoch ns, price ticks, size units, old size units, order id)
+# which is 62 bytes against the 250 to 350 of the json it comes from.
+# Only limit orders with uuid order ids on a known product are encoded, encode returns None for anything
+# else and the json is sent as is. The fields in the layout come back exactly; anything else on the message
+# (taker_order_id and trade_id on matches, client_oid, order_type, ...) is dropped as neither the order books
+# nor the portfolio read it.
+# The first byte tells the two apart as json always starts with '{'
+class MessageCodec:
+    MAGIC = 1
+    LAYOUT = Struct('<BHBBBqqqqq16s')
+    TYPES = ['received', 'open', 'done', 'match', 'change', ORDER_BOOK_RESYNC_MESSAGE, ORDER_BOOK_HANDOFF_MESSAGE]
+    # messages from the websocket itself that only carry a product and a sequence id
+    CONTROL_TYPES = [ORDER_BOOK_RESYNC_MESSAGE, ORDER_BOOK_HANDOFF_MESSAGE]
+    SIDES = ['buy', 'sell']
+    REASONS = [None, 'filled', 'canceled']
+    NO_SIDE = 255
+    NO_ORDER_ID = bytes(16)
+    # the field each message type carries its size in (change also has old_size)
+    SIZE_FIELDS = {'received': 'size', 'open': 'remaining_size', 'done': 'remaining_size', 'match': 'size',
+                   'change': 'new_size'}
+
+    def __init__(self, product_manager: ProductManager) -> None:
+        self.product_ids = sorted(product_manager.get_product_ids())
+        self.product_indexes = {product_id: idx for idx, product_id in enumerate(self.product_ids)}
+        self.products = [product_manager.get_product(product_id) for product_id in self.product_ids]
+        self.type_indexes = {message_type: idx for idx, message_type in enumerate(self.TYPES)}
+        self.side_indexes = {side: idx for idx, side in enumerate(self.SIDES)}
+        self.reason_indexes = {reason: idx for idx, reason in enumerate(self.REASONS)}
+        # the keys a decoded message of each type has, by type index
+        self.type_keys = [self.__get_keys(message_type) for message_type in self.TYPES]
+
+    def __get_keys(self, message_type: str) -> List[str]:
+        keys = ['type', 'product_id', 'sequence']
+        if message_type in self.CONTROL_TYPES:
+            return keys
+        keys.extend(['time', 'side', 'price', self.SIZE_FIELDS[message_type],
+                     'maker_order_id' if message_type == 'match' else 'order_id'])
+        if message_type == 'done':
+            keys.append('reason')
+        elif message_type == 'change':
+            keys.append('old_size')
+        return keys
+
+    def get_keys(self, type_index: int) -> List[str]:
+        return self.type_keys[type_index]
+
+    def get_message_size(self) -> int:
+        return self.LAYOUT.size
+
+    def encode(self, message: Dict) -> Optional[bytes]:
+        product_index = self.product_indexes.get(message.get('product_id'))
+        type_index = self.type_indexes.get(message.get('type'))
+        if product_index is None or type_index is None:
+            return None
+        message_type = message['type']
+        sequence = int(message['sequence'])
+        if message_type in self.CONTROL_TYPES:
+            return self.LAYOUT.pack(self.MAGIC, product_index, type_index, self.NO_SIDE, 0, sequence, 0, 0, 0, 0,
+                                    self.NO_ORDER_ID)
+        if 'price' not in message or self.SIZE_FIELDS[message_type] not in message or 'time' not in message:
+            return None
+        if message_type == 'change' and 'old_size' not in message:
+            return None
+        side_index = self.side_indexes.get(message.get('side'))
+        reason_index = self.reason_indexes.get(message.get('reason'))
+        order_id = message.get('maker_order_id' if message_type == 'match' else 'order_id')
+        if side_index is None or reason_index is None or order_id is None:
+            return None
+        try:
+            order_id = UUID(order_id).bytes
+        except ValueError:
+            return None
+        ticks = self.__get_ticks(product_index, message['price'])
+        if ticks is None:
+            return None
+        old_size = size_to_units(message['old_size']) if message_type == 'change' else 0
+        return self.LAYOUT.pack(self.MAGIC, product_index, type_index, side_index, reason_index, sequence,
+                                parse_timestamp_ns(message['time']), ticks,
+                                size_to_units(message[self.SIZE_FIELDS[message_type]]), old_size, order_id)
+
+    # only prices on the product's tick grid can be carried as ticks
+    def __get_ticks(self, product_index: int, price: str) -> Optional[int]:
+        try:
+            ticks = Decimal(price) * self.products[product_index].get_tick_divisor()
+        except InvalidOperation:
+            return None
+        if ticks != ticks.to_integral_value():
+            return None
+        return int(ticks)
+
+    # binary payloads become FeedMessages and anything else is json
+    def decode(self, payload: bytes) -> Union['FeedMessage', Dict]:
+        if payload[0] == self.MAGIC:
+            return FeedMessage(self, payload)
+        return json.loads(payload.decode('utf-8'))
+
+
+# A binary message from MessageCodec read like the dict it was encoded from.
+# Nothing is unpacked until a field is first read and each field is only turned back
+# into a string when asked for; get_timestamp_ns, get_price_ticks and get_size_units skip that
+class FeedMessage:
+    __slots__ = ['codec', 'payload', 'values']
+
+    def __init__(self, codec: MessageCodec, payload: bytes) -> None:
+        self.codec = codec
+        self.payload = payload
+        self.values = None
+
+    def __get_values(self) -> tuple:
+        if self.values is None:
+            self.values = self.codec.LAYOUT.unpack(self.payload)
+        return self.values
+
+    def get_type(self) -> str:
+        return self.codec.TYPES[self.__get_values()[2]]
+
+    def get_product_id(self) -> str:
+        return self.codec.product_ids[self.__get_values()[1]]
+
+    def get_sequence_id(self) -> int:
+        return self.__get_values()[5]
+
+    def get_timestamp_ns(self) -> int:
+        return self.__get_values()[6]
+
+    def get_price_ticks(self) -> int:
+        return self.__get_values()[7]
+
+    def get_size_units(self) -> int:
+        return self.__get_values()[8]
+
+    # only change messages have an old size
+    def get_old_size_units(self) -> int:
+        return self.__get_values()[9]
+
+    def keys(self) -> List[str]:
+        return self.codec.get_keys(self.__get_values()[2])
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.keys()
+
+    def get(self, key: str, default=None):
+        return self[key] if key in self else default
+
+    def __getitem__(self, key: str):
+        values = self.__get_values()
+        if key not in self.codec.get_keys(values[2]):
+            raise KeyError(key)
+        _, product_index, _, side_index, reason_index, sequence, timestamp_ns, ticks, size, old_size, order_id = \
+            values
+        if key == 'type':
+            return self.codec.TYPES[values[2]]
+        elif key == 'product_id':
+            return self.codec.product_ids[product_index]
+        elif key == 'sequence':
+            return sequence
+        elif key == 'time':
+            return ns_to_iso(timestamp_ns)
+        elif key == 'side':
+            return self.codec.SIDES[side_index]
+        elif key == 'price':
+            return self.codec.products[product_index].ticks_to_str(ticks)
+        elif key == 'reason':
+            return self.codec.REASONS[reason_index]
+        elif key == 'old_size':
+            return units_to_str(old_size)
+        elif key in ['order_id', 'maker_order_id']:
+            return str(UUID(bytes=order_id))
+        return units_to_str(size)
+
+    def to_dict(self) -> Dict:
+        return {key: self[key] for key in self.keys()}
+
+    def __str__(self) -> str:
+        return str(self.to_dict())
+
+    def __repr__(self) -> str:
+        return self.__str__()
@@ -0,0 +1,116 @@
+from collections import deque
+from multiprocessing import Queue, queues
+from multiprocessing.sharedctypes import RawArray
+from typing import Dict, Iterable, List, Optional
+
+from trading_package.config.constants import PORTFOLIO_HELD_MESSAGES
+
+
+# the order a feed message is about as far as the portfolio is concerned
+def get_order_id(message) -> Optional[str]:
+    if 'order_id' in message:
+        return message['order_id']
+    elif 'maker_order_id' in message:
+        return message['maker_order_id']
+    return None
+
+
+# Messages about orders that are not registered yet, kept in case they are about to be.
+# An order is only registered once the exchange has answered the request placing it, and messages about it
+# (received, open, even a fill) can come in before that. The oldest messages are dropped once there are more
+# than max_size, which is counted rather than timed so that holding a message never reads the clock
+class HeldMessages:
+    def __init__(self, max_size: int = PORTFOLIO_HELD_MESSAGES) -> None:
+        self.max_size = max_size
+        # (sequence, order id) in the order messages were held, including ones released since
+        self.entries = deque()
+        # order id => [(sequence, item)]
+        self.items = {}
+        self.sequence = 0
+        self.expired = 0
+
+    def hold(self, order_id: Optional[str], item) -> None:
+        if order_id is None:
+            return
+        self.sequence = self.sequence + 1
+        self.entries.append((self.sequence, order_id))
+        self.items.setdefault(order_id, deque()).append((self.sequence, item))
+        while len(self.entries) > self.max_size:
+            sequence, order_id = self.entries.popleft()
+            held = self.items.get(order_id)
+            if held and held[0][0] == sequence:
+                held.popleft()
+                self.expired = self.expired + 1
+                if len(held) == 0:
+                    del self.items[order_id]
+
+    # the items held for order_ids in the order they were held
+    def release(self, order_ids: Iterable[str]) -> List:
+        released = []
+        for order_id in order_ids:
+            released.extend(self.items.pop(order_id, ()))
+        return [item for _, item in sorted(released, key=lambda held: held[0])]
+
+    def get_held(self) -> int:
+        return sum(len(held) for held in self.items.values())
+
+    def get_expired(self) -> int:
+        return self.expired
+
+
+# Lets the websocket drop messages about other people's orders before they reach the portfolio processor.
+# The portfolio processor registers and de-registers its order ids, which reach the websocket's own set
+# as messages on a queue the websocket drains every PORTFOLIO_ORDER_ID_SYNC_INTERVAL seconds rather than
+# polling it for every message.
+# Messages that are not let through are held (see HeldMessages) and sent on as soon as their order is registered.
+# Counts of messages delivered, replayed after being held and dropped are kept in shared memory for the
+# process manager to report
+class OrderIdFilter:
+    REGISTER = 'register'
+    DE_REGISTER = 'de_register'
+
+    def __init__(self, held_messages: int = PORTFOLIO_HELD_MESSAGES) -> None:
+        self.updates = Queue()
+        # the websocket's copy of the registered order ids
+        self.order_ids = set()
+        self.held = HeldMessages(held_messages)
+        # delivered, dropped, replayed
+        self.counts = RawArray('q', 3)
+
+    def register(self, order_ids: List[str]) -> None:
+        self.updates.put((self.REGISTER, order_ids))
+
+    def de_register(self, order_ids: List[str]) -> None:
+        self.updates.put((self.DE_REGISTER, order_ids))
+
+    # applies every register and de-register put so far and returns the items held for the orders registered,
+    # in the order they were held, to be sent to the portfolio processor straight away
+    def sync(self) -> List:
+        released = []
+        while not self.updates.empty():
+            try:
+                action, order_ids = self.updates.get(block=False)
+            except queues.Empty:
+                break
+            if action == self.REGISTER:
+                self.order_ids.update(order_ids)
+                released.extend(self.held.release(order_ids))
+            else:
+                self.order_ids.difference_update(order_ids)
+        self.counts[2] = self.counts[2] + len(released)
+        return released
+
+    # what to send the portfolio processor now that message has come in, item being how message is sent
+    # (the message itself by default): item if message is about a registered order and nothing otherwise
+    def get_deliveries(self, message, item=None) -> List:
+        item = message if item is None else item
+        order_id = get_order_id(message)
+        if order_id in self.order_ids:
+            self.counts[0] = self.counts[0] + 1
+            return [item]
+        self.counts[1] = self.counts[1] + 1
+        self.held.hold(order_id, item)
+        return []
+
+    def get_counts(self) -> Dict[str, int]:
+        return {'delivered': self.counts[0], 'dropped': self.counts[1], 'replayed': self.counts[2]}
@@ -0,0 +1,178 @@
+import json
+from multiprocessing.sharedctypes import RawArray, RawValue
+from queue import Empty
+from struct import Struct
+from time import time, sleep
+from typing import Dict, List, Optional, Union
+
+from trading_package.exchange_websocket.message_codec import MessageCodec, FeedMessage
+
+
+class SharedRingBufferException(Exception):
+    pass
+
+
+# Single producer, multi consumer ring of fixed size slots in shared memory.
+# The websocket writes each raw message once and every consumer process reads it from
+# the same memory with its own cursor, instead of each message being pickled and sent
+# down one pipe per consumer.
+# Each slot holds (sequence, length) followed by the payload. The writer never waits for
+# readers; a reader that falls more than slot_count messages behind has been overrun and
+# skips to the oldest message still held, counting what it lost
+class SharedRingBuffer:
+    HEADER = Struct('<qI')
+
+    # payloads are json unless there is a codec to encode and decode them (see MessageCodec)
+    def __init__(self, slot_count: int = 16384, slot_size: int = 2048, reader_count: int = 2,
+                 codec: Optional[MessageCodec] = None) -> None:
+        if slot_size <= self.HEADER.size:
+            raise SharedRingBufferException('Slot size {} leaves no room for a payload'.format(slot_size))
+        self.slot_count = slot_count
+        self.slot_size = slot_size
+        self.reader_count = reader_count
+        self.codec = codec
+        self.data = RawArray('B', slot_count * slot_size)
+        # sequence of the next message to be written
+        self.write_sequence = RawValue('q', 0)
+        # per reader: sequence of the next message to read, messages read and messages lost to overruns
+        self.cursors = RawArray('q', reader_count)
+        self.reads = RawArray('q', reader_count)
+        self.overruns = RawArray('q', reader_count)
+        # memoryviews cannot be sent to another process so each process makes its own
+        self.view = None
+
+    def __getstate__(self) -> Dict:
+        state = self.__dict__.copy()
+        state['view'] = None
+        return state
+
+    def get_view(self) -> memoryview:
+        if self.view is None:
+            self.view = memoryview(self.data).cast('B')
+        return self.view
+
+    def get_slot_count(self) -> int:
+        return self.slot_count
+
+    def get_payload_size(self) -> int:
+        return self.slot_size - self.HEADER.size
+
+    def get_write_sequence(self) -> int:
+        return self.write_sequence.value
+
+    def get_offset(self, sequence: int) -> int:
+        return (sequence % self.slot_count) * self.slot_size
+
+    def put(self, payload: bytes) -> int:
+        if len(payload) > self.get_payload_size():
+            raise SharedRingBufferException('Message of {} bytes does not fit in a {} byte slot'.format(
+                len(payload), self.get_payload_size()))
+        view = self.get_view()
+        sequence = self.write_sequence.value
+        offset = self.get_offset(sequence)
+        # a reader copying this slot sees the sequence change and knows it was overwritten
+        self.HEADER.pack_into(view, offset, -1, 0)
+        start = offset + self.HEADER.size
+        view[start:start + len(payload)] = payload
+        self.HEADER.pack_into(view, offset, sequence, len(payload))
+        self.write_sequence.value = sequence + 1
+        return sequence
+
+    # payload is the message as it came off the wire, sent as is if the codec cannot encode it
+    def put_message(self, message: Dict, payload: Optional[bytes] = None) -> int:
+        return self.put(self.encode(message, payload))
+
+    # encoding once lets the same bytes be put on several rings sharing a codec
+    def encode(self, message: Dict, payload: Optional[bytes] = None) -> bytes:
+        encoded = None if self.codec is None else self.codec.encode(message)
+        if encoded is None:
+            encoded = json.dumps(message).encode('utf-8') if payload is None else payload
+        return encoded
+
+    def decode(self, payload: bytes) -> Union[Dict, FeedMessage]:
+        if self.codec is None:
+            return json.loads(payload.decode('utf-8'))
+        return self.codec.decode(payload)
+
+    def get_reader(self, reader_id: int) -> 'SharedRingBufferReader':
+        if not 0 <= reader_id < self.reader_count:
+            raise SharedRingBufferException('Reader {} out of range {}'.format(reader_id, self.reader_count))
+        return SharedRingBufferReader(self, reader_id)
+
+    def get_lag(self, reader_id: int) -> int:
+        return self.write_sequence.value - self.cursors[reader_id]
+
+    # {reads, overruns, lag} for every reader, readable from any process
+    def get_stats(self) -> List[Dict[str, int]]:
+        return [{'reads': self.reads[reader_id], 'overruns': self.overruns[reader_id],
+                 'lag': self.get_lag(reader_id)} for reader_id in range(self.reader_count)]
+
+
+# One consumer's view of a SharedRingBuffer with the get/empty interface of a Queue
+class SharedRingBufferReader:
+    # a blocked get polls quickly at first and backs off to MAX_POLL_INTERVAL the longer the ring stays empty
+    POLL_INTERVAL = 0.0005
+    MAX_POLL_INTERVAL = 0.005
+
+    def __init__(self, ring_buffer: SharedRingBuffer, reader_id: int) -> None:
+        self.ring_buffer = ring_buffer
+        self.reader_id = reader_id
+
+    def get_reader_id(self) -> int:
+        return self.reader_id
+
+    def empty(self) -> bool:
+        return self.ring_buffer.cursors[self.reader_id] >= self.ring_buffer.get_write_sequence()
+
+    def get(self, block: bool = True, timeout: Optional[float] = None) -> Union[Dict, FeedMessage]:
+        deadline = None if timeout is None else time() + timeout
+        poll_interval = self.POLL_INTERVAL
+        while True:
+            payload = self.read()
+            if payload is not None:
+                return self.ring_buffer.decode(payload)
+            if not block:
+                raise Empty
+            if deadline is not None:
+                remaining = deadline - time()
+                if remaining <= 0:
+                    raise Empty
+                sleep(min(poll_interval, remaining))
+            else:
+                sleep(poll_interval)
+            poll_interval = min(poll_interval * 2, self.MAX_POLL_INTERVAL)
+
+    # returns the next raw payload or None if there is nothing new
+    def read(self) -> Optional[bytes]:
+        ring_buffer = self.ring_buffer
+        view = ring_buffer.get_view()
+        while True:
+            cursor = ring_buffer.cursors[self.reader_id]
+            write_sequence = ring_buffer.get_write_sequence()
+            if cursor >= write_sequence:
+                return None
+            oldest = write_sequence - ring_buffer.get_slot_count()
+            if cursor < oldest:
+                self.__skip(cursor, oldest)
+                continue
+            offset = ring_buffer.get_offset(cursor)
+            sequence, length = ring_buffer.HEADER.unpack_from(view, offset)
+            start = offset + ring_buffer.HEADER.size
+            payload = bytes(view[start:start + length])
+            # the writer lapped us while we were copying
+            if sequence != cursor or ring_buffer.HEADER.unpack_from(view, offset)[0] != cursor:
+                self.__skip(cursor, cursor + 1)
+                continue
+            ring_buffer.cursors[self.reader_id] = cursor + 1
+            ring_buffer.reads[self.reader_id] = ring_buffer.reads[self.reader_id] + 1
+            return payload
+
+    def __skip(self, cursor: int, new_cursor: int) -> None:
+        self.ring_buffer.overruns[self.reader_id] = self.ring_buffer.overruns[self.reader_id] + new_cursor - cursor
+        self.ring_buffer.cursors[self.reader_id] = new_cursor
+
+    def get_overruns(self) -> int:
+        return self.ring_buffer.overruns[self.reader_id]
+
+    def get_lag(self) -> int:
+        return self.ring_buffer.get_lag(self.reader_id)
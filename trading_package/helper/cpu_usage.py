@@ -0,0 +1,28 @@
+from time import time, process_time
+from typing import Optional
+
+
+# CPU time this process (all of its threads) used as a percentage of one core
+# over the wall time since it was last reported
+class CpuUsage:
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self.last_time = time()
+        self.last_cpu_time = process_time()
+
+    def is_due(self, now_time: Optional[float] = None) -> bool:
+        now_time = time() if now_time is None else now_time
+        return now_time - self.last_time >= self.interval
+
+    # percentage since the last call, resets the window
+    def get_usage(self) -> float:
+        now_time = time()
+        cpu_time = process_time()
+        usage = 100 * (cpu_time - self.last_cpu_time) / max(now_time - self.last_time, 1e-9)
+        self.last_time = now_time
+        self.last_cpu_time = cpu_time
+        return usage
+
+    def get_message(self) -> str:
+        elapsed = time() - self.last_time
+        return 'CPU usage {:.1f}% over {:.0f}s'.format(self.get_usage(), elapsed)
@@ -52,6 +52,15 @@ class OrderType(Enum):
     cancel = 4
 
 
+# what an order does to its price level
+class BookOperation(Enum):
+    add = 1
+    remove = 2
+    change = 3
+    match = 4
+    record = 5
+
+
 class OrderStatus(Enum):
     open = 1
     filled = 2
@@ -59,6 +68,12 @@ class OrderStatus(Enum):
     unconfirmed = 4
 
 
+# how profitable cycles are found, see NetworkManager.get_cycles_by_value
+class CycleEngine(Enum):
+    simple_cycles = 1
+    bellman_ford = 2
+
+
 class QuoteType(Enum):
     product = 1
     currency = 2
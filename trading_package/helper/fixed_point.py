@@ -0,0 +1,18 @@
+from trading_package.config.constants import SIZE_DECIMALS, SIZE_UNITS
+
+
+# sizes are parsed once into integer units so that they can be added and subtracted
+# exactly without going through Decimal
+def size_to_units(size: str) -> int:
+    return int(round(float(size) * SIZE_UNITS))
+
+
+def units_to_size(units: int) -> float:
+    return units / SIZE_UNITS
+
+
+# only needed where a size goes back out as a string (redis trade history, REST orders)
+def units_to_str(units: int) -> str:
+    whole, fraction = divmod(abs(units), SIZE_UNITS)
+    size = '{}{}.{:0{}d}'.format('-' if units < 0 else '', whole, fraction, SIZE_DECIMALS)
+    return size.rstrip('0').rstrip('.')
@@ -0,0 +1,46 @@
+from calendar import timegm
+from datetime import datetime
+from time import time
+
+from dateutil import parser
+
+NANOSECONDS = 10 ** 9
+
+
+# days since 1970-01-01 of a proleptic gregorian date
+def days_from_civil(year: int, month: int, day: int) -> int:
+    year = year - (month <= 2)
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * (month + (-3 if month > 2 else 9)) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - 719468
+
+
+# the exchange sends UTC times as YYYY-MM-DDTHH:MM:SS[.fraction]Z so the fields are read
+# straight out of the string; anything else goes through dateutil
+def parse_timestamp_ns(timestamp: str) -> int:
+    if len(timestamp) < 20 or timestamp[4] != '-' or timestamp[10] != 'T' or timestamp[-1] != 'Z':
+        return datetime_to_ns(parser.parse(timestamp))
+    try:
+        seconds = (days_from_civil(int(timestamp[0:4]), int(timestamp[5:7]), int(timestamp[8:10])) * 86400 +
+                   int(timestamp[11:13]) * 3600 + int(timestamp[14:16]) * 60 + int(timestamp[17:19]))
+        fraction = timestamp[20:-1] if timestamp[19] == '.' else ''
+        nanoseconds = int(fraction[:9].ljust(9, '0')) if fraction else 0
+    except ValueError:
+        return datetime_to_ns(parser.parse(timestamp))
+    return seconds * NANOSECONDS + nanoseconds
+
+
+def datetime_to_ns(value) -> int:
+    return timegm(value.utctimetuple()) * NANOSECONDS + value.microsecond * 1000
+
+
+def now_ns() -> int:
+    return int(time() * NANOSECONDS)
+
+
+# the exchange's format (microseconds) back from epoch nanoseconds
+def ns_to_iso(timestamp_ns: int) -> str:
+    seconds, nanoseconds = divmod(timestamp_ns, NANOSECONDS)
+    return '{}.{:06d}Z'.format(datetime.utcfromtimestamp(seconds).strftime('%Y-%m-%dT%H:%M:%S'), nanoseconds // 1000)
@@ -0,0 +1,82 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from networkx import DiGraph, simple_cycles
+from numpy import zeros, array, log, exp, isfinite, isnan, nan, float64, ndarray, flatnonzero, argsort
+
+from trading_package.helper.enums import Currency
+
+Edge = Tuple[str, str]
+
+
+# currencies the exchange does not have (as in benchmarks) rank below those it does, by name
+def get_currency_rank(currency: str) -> Tuple[int, str]:
+    return (Currency[currency].value if currency in Currency.__members__ else 0), currency
+
+
+# Every simple cycle of a network topology, enumerated once and kept as an incidence matrix
+# of cycles by edges so the value of every cycle (the product of its edge weights) is one
+# matrix product over log weights, redone only when the weights change.
+# The topology (which currencies trade with which) almost never changes, see NetworkManager.get_cycle_set
+class CycleSet:
+    def __init__(self, edges: Iterable[Edge]) -> None:
+        self.edges = sorted(set(edges))
+        self.edge_indexes = {edge: idx for idx, edge in enumerate(self.edges)}
+        dg = DiGraph()
+        dg.add_edges_from(self.edges)
+        self.cycles = sorted(self.rotate(cycle) for cycle in simple_cycles(dg))
+        self.incidence = zeros((len(self.cycles), len(self.edges)), dtype=float64)
+        for cycle_idx, cycle in enumerate(self.cycles):
+            for start, end in zip(cycle[:-1], cycle[1:]):
+                self.incidence[cycle_idx, self.edge_indexes[(start, end)]] = 1.
+        # currency => indexes of the cycles through it
+        self.currency_cycles = {}
+        for cycle_idx, cycle in enumerate(self.cycles):
+            for currency in cycle[:-1]:
+                self.currency_cycles.setdefault(currency, []).append(cycle_idx)
+        self.weights = None
+        self.values = None
+
+    # the currencies in a cycle start (and end) at the one with the largest value for long term sanity
+    @staticmethod
+    def rotate(cycle: List[str]) -> List[str]:
+        best_curr_ind = cycle.index(max(cycle, key=get_currency_rank))
+        cycle = cycle[best_curr_ind:] + cycle[:best_curr_ind]
+        return cycle + [cycle[0]]
+
+    def get_edges(self) -> List[Edge]:
+        return self.edges
+
+    def has_topology(self, edges: Iterable[Edge]) -> bool:
+        return sorted(set(edges)) == self.edges
+
+    # [[currency, ..., currency]] with the first currency repeated at the end
+    def get_cycles(self) -> List[List[str]]:
+        return self.cycles
+
+    # the value of every cycle in get_cycles order, nan for cycles with a missing or non positive weight
+    def get_values(self, weights: Dict[Edge, float]) -> ndarray:
+        weight_vector = array([float(weights.get(edge, nan)) for edge in self.edges], dtype=float64)
+        # the same weights as last time, missing ones included (array_equal only takes equal_nan from numpy 1.19)
+        if self.values is not None and ((weight_vector == self.weights) |
+                                        (isnan(weight_vector) & isnan(self.weights))).all():
+            return self.values
+        valid = isfinite(weight_vector) & (weight_vector > 0)
+        log_weights = zeros(len(self.edges), dtype=float64)
+        log_weights[valid] = log(weight_vector[valid])
+        values = exp(self.incidence @ log_weights)
+        values[(self.incidence @ (~valid).astype(float64)) > 0] = nan
+        self.weights = weight_vector
+        self.values = values
+        return values
+
+    # [(value, cycle)] in ascending order of value, only cycles through start_currency if given
+    def get_ranked_cycles(self, weights: Dict[Edge, float],
+                          start_currency: Optional[str] = None) -> List[Tuple[float, List[str]]]:
+        values = self.get_values(weights)
+        if start_currency is None:
+            cycle_indexes = array(range(len(self.cycles)), dtype=int)
+        else:
+            cycle_indexes = array(self.currency_cycles.get(start_currency, []), dtype=int)
+        cycle_indexes = cycle_indexes[flatnonzero(isfinite(values[cycle_indexes]))]
+        ranked = cycle_indexes[argsort(values[cycle_indexes], kind='mergesort')]
+        return [(float(values[cycle_idx]), self.cycles[cycle_idx]) for cycle_idx in ranked.tolist()]
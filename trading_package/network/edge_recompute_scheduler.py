@@ -0,0 +1,121 @@
+from time import time
+from typing import Dict, Optional, Tuple, Set
+
+from trading_package.helper.enums import OrderSide, EdgeType
+from trading_package.network.network import NetworkManager
+
+# a change whose price is not known counts as a change at the very top of the side
+ALL_TICKS = {OrderSide.bid: float('inf'), OrderSide.ask: float('-inf')}
+
+
+def get_other_side(side: OrderSide) -> OrderSide:
+    return OrderSide.ask if side == OrderSide.bid else OrderSide.bid
+
+
+# whether tick is at or nearer the top of the side than boundary (higher for bids, lower for asks)
+def is_at_or_better(side: OrderSide, tick: float, boundary: float) -> bool:
+    return tick >= boundary if side == OrderSide.bid else tick <= boundary
+
+
+def get_better_tick(side: OrderSide, tick: Optional[float], other_tick: float) -> float:
+    if tick is None:
+        return other_tick
+    return max(tick, other_tick) if side == OrderSide.bid else min(tick, other_tick)
+
+
+# Decides which network edges need recomputing after order book changes.
+# Each (product, side) remembers the best changed tick and whether it traded since it was last recomputed,
+# and each edge the part of the book it was computed from (see EdgeInputs), so only edges a change can
+# move are recomputed: the best edge when the top of the book changed, the trade size edges when there
+# were trades or the levels they filled through changed.
+# Changes are coalesced for window seconds after the first one so a burst costs one recomputation,
+# and trade size edges are recomputed at least every max_age seconds while their book changes
+# as old trades drop out of their lookback
+class EdgeRecomputeScheduler:
+    def __init__(self, network_manager: NetworkManager, window: float = 0., max_age: float = 60.) -> None:
+        self.network_manager = network_manager
+        self.window = window
+        self.max_age = max_age
+        # (product id, side) => [time of first change, best changed tick or None, traded]
+        self.pending = {}
+        # (product id, side, edge type) => (inputs, time computed)
+        self.edges = {}
+        self.counters = {'changes': 0, 'coalesced': 0, 'performed': 0, 'skipped': 0}
+
+    def get_counters(self) -> Dict[str, int]:
+        return dict(self.counters)
+
+    def get_message(self) -> str:
+        return 'Network edges: {performed} recomputed, {skipped} skipped, {coalesced} of {changes} changes ' \
+               'coalesced'.format(**self.counters)
+
+    def has_pending(self) -> bool:
+        return len(self.pending) > 0
+
+    # tick is the best level that changed (ALL_TICKS for anything) or None if only trades were recorded
+    def mark(self, product_id: str, side: OrderSide, tick: Optional[float], traded: bool,
+             now_time: Optional[float] = None) -> None:
+        self.counters['changes'] = self.counters['changes'] + 1
+        pending = self.pending.get((product_id, side))
+        if pending is None:
+            self.pending[(product_id, side)] = [time() if now_time is None else now_time, tick, traded]
+            return
+        self.counters['coalesced'] = self.counters['coalesced'] + 1
+        if tick is not None:
+            pending[1] = get_better_tick(side, pending[1], tick)
+        pending[2] = pending[2] or traded
+
+    def mark_changes(self, product_id: str, changes: Tuple[Dict[OrderSide, float], Set[OrderSide]],
+                     now_time: Optional[float] = None) -> None:
+        changed_ticks, traded_sides = changes
+        for side in OrderSide:
+            if side in changed_ticks or side in traded_sides:
+                self.mark(product_id, side, changed_ticks.get(side), side in traded_sides, now_time)
+
+    # recomputes the affected edges of every (product, side) whose first change is older than window
+    # order_books is {product id: order book}; returns the number of edges recomputed
+    def recompute_due(self, order_books: Dict, now_time: Optional[float] = None) -> int:
+        now_time = time() if now_time is None else now_time
+        # product id => {side: (best changed tick, traded)}
+        due = {}
+        for product_id, side in [key for key, pending in self.pending.items() if now_time - pending[0] >= self.window]:
+            _, tick, traded = self.pending.pop((product_id, side))
+            due.setdefault(product_id, {})[side] = (tick, traded)
+        performed = 0
+        for product_id, changes in due.items():
+            # a change on one side can still move the other side's edges if they looked at the spread
+            for side in OrderSide:
+                other_tick = changes.get(get_other_side(side), (None, False))[0]
+                if side not in changes and other_tick is None:
+                    continue
+                tick, traded = changes.get(side, (None, False))
+                for edge_type in EdgeType:
+                    if not self.is_affected(product_id, side, edge_type, tick, traded, other_tick, now_time):
+                        if side in changes:
+                            self.counters['skipped'] = self.counters['skipped'] + 1
+                        continue
+                    inputs = self.network_manager.update_edge_type(order_books[product_id], side, edge_type)
+                    self.edges[(product_id, side, edge_type)] = (inputs, now_time)
+                    performed = performed + 1
+        self.counters['performed'] = self.counters['performed'] + performed
+        return performed
+
+    # other_tick is the best change on the other side of the book, which only matters to edges that
+    # looked at the spread
+    def is_affected(self, product_id: str, side: OrderSide, edge_type: EdgeType, tick: Optional[float],
+                    traded: bool, other_tick: Optional[float], now_time: float) -> bool:
+        edge = self.edges.get((product_id, side, edge_type))
+        # an edge never computed is computed when its own side changes
+        if edge is None:
+            return tick is not None or traded
+        inputs, computed_time = edge
+        if edge_type != EdgeType.best and (traded or now_time - computed_time >= self.max_age):
+            return True
+        if not inputs.get_read_book():
+            return False
+        if tick is not None and (inputs.get_worst_tick() is None or
+                                 is_at_or_better(side, tick, inputs.get_worst_tick())):
+            return True
+        other_best_tick = inputs.get_other_best_tick()
+        return other_tick is not None and other_best_tick is not None and \
+            is_at_or_better(get_other_side(side), other_tick, other_best_tick)
@@ -0,0 +1,153 @@
+from collections import deque
+from math import log, exp, inf
+from typing import Dict, List, Optional, Set, Tuple
+
+from trading_package.network.cycle_set import CycleSet
+
+Edge = Tuple[str, str]
+
+# cycles within this much of a value of 1 are rounding, not arbitrage
+COST_TOLERANCE = 1e-12
+
+
+# Profitable cycles found as negative cycles of the network with -log(weight) edge costs,
+# so a cycle whose weights multiply to more than 1 costs less than 0.
+# Unlike CycleSet nothing is enumerated: each search is a Bellman-Ford (queue based, SPFA) pass over the edges,
+# which stays polynomial however many currencies there are, at the price of finding cycles one at a time.
+# After a cycle is found its costliest edge is left out and the search repeats, so at most max_cycles are found
+# and a profitable cycle sharing that edge with a better one can be missed
+class NegativeCycleFinder:
+    def __init__(self, weights: Dict[Edge, float]) -> None:
+        self.costs = {}
+        for edge, weight in weights.items():
+            weight = float(weight)
+            if weight > 0 and weight != inf:
+                self.costs[edge] = -log(weight)
+        self.nodes = sorted({currency for edge in self.costs for currency in edge})
+        # currency => [(next currency, cost)]
+        self.out_edges = {node: [] for node in self.nodes}
+        for (start, end), cost in sorted(self.costs.items()):
+            self.out_edges[start].append((end, cost))
+
+    def get_cost(self, cycle: List[str]) -> float:
+        return sum(self.costs[(start, end)] for start, end in zip(cycle[:-1], cycle[1:]))
+
+    # a cycle with the first currency repeated at the end, or None if there is no negative cycle
+    def find_cycle(self, excluded: Set[Edge]) -> Optional[List[str]]:
+        # every currency starts at distance 0 as if from a source joined to all of them
+        distances = {node: 0. for node in self.nodes}
+        # edges on the current cheapest path to each currency
+        lengths = {node: 0 for node in self.nodes}
+        predecessors = {}
+        queue = deque(self.nodes)
+        queued = set(self.nodes)
+        while len(queue) > 0:
+            start = queue.popleft()
+            queued.discard(start)
+            for end, cost in self.out_edges[start]:
+                if (start, end) in excluded or distances[start] + cost >= distances[end] - COST_TOLERANCE:
+                    continue
+                distances[end] = distances[start] + cost
+                predecessors[end] = start
+                lengths[end] = lengths[start] + 1
+                # a path with as many edges as there are currencies goes round a cycle
+                if lengths[end] >= len(self.nodes):
+                    cycle = self.__get_predecessor_cycle(predecessors, end)
+                    if cycle is not None and self.get_cost(cycle) < -COST_TOLERANCE:
+                        return cycle
+                if end not in queued:
+                    queue.append(end)
+                    queued.add(end)
+        return None
+
+    # following predecessors back from node until one repeats, None if they run out first
+    @staticmethod
+    def __get_predecessor_cycle(predecessors: Dict[str, str], node: str) -> Optional[List[str]]:
+        seen = []
+        while node not in seen:
+            if node not in predecessors:
+                return None
+            seen.append(node)
+            node = predecessors[node]
+        cycle = seen[seen.index(node):]
+        cycle.reverse()
+        return cycle + [cycle[0]]
+
+    # the cheapest negative cycle through start of at most max_length edges, or None
+    # distances are by number of edges so only walks that close at start are considered
+    def find_cycle_through(self, start: str, max_length: int, excluded: Set[Edge]) -> Optional[List[str]]:
+        if start not in self.out_edges:
+            return None
+        distances = {start: 0.}
+        # per length: currency => the currency before it
+        predecessors = []
+        best_cycle = None
+        best_cost = -COST_TOLERANCE
+        for length in range(1, max_length + 1):
+            next_distances = {}
+            next_predecessors = {}
+            for node, distance in distances.items():
+                for end, cost in self.out_edges[node]:
+                    if (node, end) in excluded or distance + cost >= next_distances.get(end, inf):
+                        continue
+                    next_distances[end] = distance + cost
+                    next_predecessors[end] = node
+            predecessors.append(next_predecessors)
+            if start in next_distances and next_distances[start] < best_cost:
+                cycle = self.__get_cycle_through(start, self.__get_walk(predecessors, start))
+                if cycle is not None and self.get_cost(cycle) < best_cost:
+                    best_cycle = cycle
+                    best_cost = self.get_cost(cycle)
+            # a walk back at start is a cycle already, going on would repeat it
+            next_distances.pop(start, None)
+            distances = next_distances
+        return best_cycle
+
+    @staticmethod
+    def __get_walk(predecessors: List[Dict[str, str]], end: str) -> List[str]:
+        walk = [end]
+        for length_predecessors in reversed(predecessors):
+            walk.append(length_predecessors[walk[-1]])
+        walk.reverse()
+        return walk
+
+    # the cheapest walk may go round an inner loop, which is cut out to leave the simple cycle through start
+    def __get_cycle_through(self, start: str, walk: List[str]) -> Optional[List[str]]:
+        cycle = []
+        for node in walk[:-1]:
+            if node in cycle:
+                cycle = cycle[:cycle.index(node)]
+            cycle.append(node)
+        cycle.append(start)
+        return cycle if len(cycle) > 2 or (cycle[0], cycle[0]) in self.costs else None
+
+    # [(value, cycle)] in ascending order of value like CycleSet.get_ranked_cycles, only cycles worth more than 1
+    # with start_currency only cycles through it and with max_length only cycles of at most that many edges
+    def get_ranked_cycles(self, start_currency: Optional[str] = None, max_length: Optional[int] = None,
+                          max_cycles: int = 20) -> List[Tuple[float, List[str]]]:
+        if start_currency is not None:
+            starts = [start_currency]
+        else:
+            starts = None if max_length is None else self.nodes
+        cycles = {}
+        excluded = set()
+        for _ in range(max_cycles):
+            cycle = self.__find_cheapest_cycle(starts, max_length, excluded)
+            if cycle is None:
+                break
+            edges = list(zip(cycle[:-1], cycle[1:]))
+            excluded.add(max(edges, key=lambda edge: self.costs[edge]))
+            cycle = CycleSet.rotate(cycle[:-1])
+            cycles[tuple(cycle)] = (exp(-self.get_cost(cycle)), cycle)
+        return sorted(cycles.values())
+
+    def __find_cheapest_cycle(self, starts: Optional[List[str]], max_length: Optional[int],
+                              excluded: Set[Edge]) -> Optional[List[str]]:
+        if starts is None:
+            return self.find_cycle(excluded)
+        best_cycle = None
+        for start in starts:
+            cycle = self.find_cycle_through(start, len(self.nodes) if max_length is None else max_length, excluded)
+            if cycle is not None and (best_cycle is None or self.get_cost(cycle) < self.get_cost(best_cycle)):
+                best_cycle = cycle
+        return best_cycle
@@ -1,39 +1,149 @@
+import json
 from decimal import Decimal
+from time import time
 from typing import Dict, Tuple, List, Optional
 
-from networkx import DiGraph, simple_cycles, get_edge_attributes
-from numpy import prod
+from networkx import DiGraph
 from redis import StrictRedis
 
 from trading_package.config.constants import *
 from trading_package.helper.enums import *
+from trading_package.network.cycle_set import CycleSet
+from trading_package.network.negative_cycle_finder import NegativeCycleFinder
 
 
+# The part of an order book side an edge was computed from (see EdgeRecomputeScheduler):
+# whether the levels were read at all, the worst tick read (None if the whole side was read)
+# and the other side's best tick if the spread was looked at
+class EdgeInputs:
+    __slots__ = ['read_book', 'worst_tick', 'other_best_tick']
+
+    def __init__(self, read_book: bool, worst_tick: Optional[int] = None,
+                 other_best_tick: Optional[float] = None) -> None:
+        self.read_book = read_book
+        self.worst_tick = worst_tick
+        self.other_best_tick = other_best_tick
+
+    def get_read_book(self) -> bool:
+        return self.read_book
+
+    def get_worst_tick(self) -> Optional[int]:
+        return self.worst_tick
+
+    def get_other_best_tick(self) -> Optional[float]:
+        return self.other_best_tick
+
+
+Network = Tuple[NetworkType, EdgeType, QuoteType]
+
+
+# Each network hash carries a version field that every write increments in the same transaction,
+# so readers keep the weights they last read and only read them again once the version has moved on.
+# Within cache_max_age seconds of reading them the weights are used without even checking the version,
+# at the cost of acting on weights up to that old (the staleness in get_cache_stats)
 class NetworkManager:
-    def __init__(self):
+    VERSION_FIELD = 'version'
+
+    def __init__(self, cycle_engine: CycleEngine = CycleEngine[NETWORK_CYCLE_ENGINE],
+                 max_cycle_length: Optional[int] = NETWORK_MAX_CYCLE_LENGTH,
+                 cache_max_age: float = NETWORK_CACHE_MAX_AGE):
         self.redis_server = StrictRedis(host='localhost', port=6379, db=0, encoding="utf-8", decode_responses=True)
+        self.cycle_engine = cycle_engine
+        self.max_cycle_length = max_cycle_length
+        self.cache_max_age = cache_max_age
+        # (edge type, quote type) => cycles of the network's current topology
+        self.cycle_sets = {}
+        # network => (version, time read, weights)
+        self.weights_cache = {}
+        # edges written and the versions they made since changes were last published
+        self.changed_edges = set()
+        self.changed_versions = {}
+        self.cache_stats = {'hits': 0, 'unchecked': 0, 'misses': 0, 'stale': 0, 'versions_behind': 0,
+                            'max_versions_behind': 0, 'unchecked_age': 0., 'max_unchecked_age': 0.}
 
     def get_network(self, network_type: NetworkType, edge_type: EdgeType, quote_type: QuoteType) -> DiGraph:
-        network_keys = self.redis_server.keys(self.get_redis_key(network_type, edge_type, quote_type) + '*')
-        pipe = self.redis_server.pipeline()
-        for network_key in network_keys:
-            pipe.hgetall(network_key)
-        res = pipe.execute()
         dg = DiGraph()
-        for idx, val in enumerate(network_keys):
-            start_currency = val.split(':')[-1]
-            for end_currency, weight in res[idx].items():
-                edge_weight = weight
-                end_currency = end_currency
-                dg.add_edge(start_currency, end_currency, weight=edge_weight)
+        for (start_currency, end_currency), weight in self.get_weights(network_type, edge_type, quote_type).items():
+            dg.add_edge(start_currency, end_currency, weight=weight)
         return dg
 
+    # {(start currency, end currency): weight} as stored in redis
+    def get_weights(self, network_type: NetworkType, edge_type: EdgeType, quote_type: QuoteType) -> Dict[
+        Tuple[str, str], str]:
+        return self.get_weights_snapshot([(network_type, edge_type, quote_type)])[0]
+
+    # the weights of each network all as they were at one moment, read again only if any version moved on
+    def get_weights_snapshot(self, networks: List[Network]) -> List[Dict[Tuple[str, str], str]]:
+        now_time = time()
+        cached = [self.weights_cache.get(network) for network in networks]
+        if all(entry is not None and now_time - entry[1] < self.cache_max_age for entry in cached):
+            for entry in cached:
+                self.__add_cache_stat('unchecked', 'unchecked_age', now_time - entry[1])
+            return [entry[2] for entry in cached]
+        pipe = self.redis_server.pipeline(transaction=False)
+        for network in networks:
+            pipe.hget(self.get_redis_key(*network), self.VERSION_FIELD)
+        versions = [int(version or 0) for version in pipe.execute()]
+        if all(entry is not None and entry[0] == version for entry, version in zip(cached, versions)):
+            self.cache_stats['hits'] = self.cache_stats['hits'] + len(networks)
+            for network, entry in zip(networks, cached):
+                self.weights_cache[network] = (entry[0], now_time, entry[2])
+            return [entry[2] for entry in cached]
+        # every network is read again in one transaction even if only one changed, so they stay consistent
+        pipe = self.redis_server.pipeline(transaction=True)
+        for network in networks:
+            pipe.hgetall(self.get_redis_key(*network))
+        snapshot = []
+        for network, entry, network_hash in zip(networks, cached, pipe.execute()):
+            version = int(network_hash.pop(self.VERSION_FIELD, 0))
+            self.cache_stats['misses'] = self.cache_stats['misses'] + 1
+            if entry is not None:
+                self.__add_cache_stat('stale', 'versions_behind', version - entry[0])
+            weights = {}
+            for edge_field, weight in network_hash.items():
+                start_currency, end_currency = edge_field.split(':')
+                weights[(start_currency, end_currency)] = weight
+            self.weights_cache[network] = (version, now_time, weights)
+            snapshot.append(weights)
+        return snapshot
+
+    def __add_cache_stat(self, counter: str, stat: str, value: float) -> None:
+        self.cache_stats[counter] = self.cache_stats[counter] + 1
+        self.cache_stats[stat] = self.cache_stats[stat] + value
+        self.cache_stats['max_' + stat] = max(self.cache_stats['max_' + stat], value)
+
+    # hits and unchecked reads are served from the cache, misses read redis (stale ones had an older version cached)
+    # versions behind is how many writes a stale entry missed and unchecked age how old weights used unchecked were
+    def get_cache_stats(self) -> Dict[str, float]:
+        stats = dict(self.cache_stats)
+        reads = stats['hits'] + stats['unchecked'] + stats['misses']
+        stats['hit_rate'] = (stats['hits'] + stats['unchecked']) / reads if reads > 0 else 0.
+        return stats
+
+    def get_cache_message(self) -> str:
+        stats = self.get_cache_stats()
+        return 'Network cache: {:.1%} hit rate over {} reads, stale reads {:.1f} versions behind on average ' \
+               '(max {}), unchecked reads {:.3f}s old on average (max {:.3f}s)'.format(
+                stats['hit_rate'], stats['hits'] + stats['unchecked'] + stats['misses'],
+                stats['versions_behind'] / stats['stale'] if stats['stale'] > 0 else 0., stats['max_versions_behind'],
+                stats['unchecked_age'] / stats['unchecked'] if stats['unchecked'] > 0 else 0.,
+                stats['max_unchecked_age'])
+
+    # cycles are only enumerated again when an edge appears or disappears
+    def get_cycle_set(self, edge_type: EdgeType, quote_type: QuoteType, weights: Dict[Tuple[str, str], str]) -> \
+            CycleSet:
+        cycle_set = self.cycle_sets.get((edge_type, quote_type))
+        if cycle_set is None or not cycle_set.has_topology(weights.keys()):
+            cycle_set = CycleSet(weights.keys())
+            self.cycle_sets[(edge_type, quote_type)] = cycle_set
+        return cycle_set
+
     # Portfolio hash is {currency_enum: currency_qty}
     # Return is ({currency_enum: (final_currency_qty, edge_val)}, total_qty)
     def value_portfolio(self, portfolio_hash: Dict[Currency, Decimal], final_currency: Currency) -> Tuple[
         Dict[Currency, Tuple[Decimal, Decimal]], Decimal]:
         fc = final_currency.name
-        dg = self.get_network(NetworkType.price, EdgeType.best, QuoteType.currency)
+        weights = self.get_weights(NetworkType.price, EdgeType.best, QuoteType.currency)
         return_hash = {}
         total_qty = Decimal('0')
         for currency, qty in portfolio_hash.items():
@@ -43,7 +153,7 @@ class NetworkManager:
                 return_hash[currency] = (qty, Decimal(1.0))
                 continue
             try:
-                edge_val = Decimal(dg[c][fc]['weight'])
+                edge_val = Decimal(weights[(c, fc)])
                 final_qty = edge_val * qty
                 return_hash[currency] = (final_qty, edge_val)
                 total_qty = total_qty + final_qty
@@ -54,90 +164,104 @@ class NetworkManager:
     def add_edge(self, edge_type: EdgeType, quote_type: QuoteType, start_currency: Currency, end_currency: Currency,
                  weight: float,
                  qty: float = 1e9) -> None:
-        price_key_val = self.get_redis_key(NetworkType.price, edge_type, quote_type, start_currency)
-        self.redis_server.hset(price_key_val, end_currency.name, weight)
-        qty_key_val = self.get_redis_key(NetworkType.quantity, edge_type, quote_type, start_currency)
-        self.redis_server.hset(qty_key_val, end_currency.name, qty)
-
-    # TODO maybe dont index by cycle value because they will overwrite on another. Should at the least
-    # be a list
-    def get_cycles_by_value(self, edge_type: EdgeType, quote_type: QuoteType) -> Dict[float, List[str]]:
-        dg = self.get_network(NetworkType.price, edge_type, quote_type)
-        weights = get_edge_attributes(dg, 'weight')
-        cycle_vals = {}
-        for cycle in simple_cycles(dg):
-            # sort the currencies in cycle for long term sanity
-            best_curr = max(cycle, key=lambda x: Currency[x].value)
-            best_curr_ind = cycle.index(best_curr)
-            cycle = [cycle[best_curr_ind]] + cycle[(best_curr_ind + 1):] + cycle[:best_curr_ind]
-            cycle.append(cycle[0])
-            prodw = [float(weights[(cycle[i], cycle[i + 1])]) for i in range(len(cycle) - 1)]
-            prodw = prod(prodw)
-            cycle_vals[prodw] = cycle
-        return cycle_vals
+        edge_field = self.get_edge_field(start_currency, end_currency)
+        pipe = self.redis_server.pipeline(transaction=True)
+        network_keys = [self.get_redis_key(network_type, edge_type, quote_type) for network_type in
+                        [NetworkType.price, NetworkType.quantity]]
+        for network_key, value in zip(network_keys, [weight, qty]):
+            pipe.hset(network_key, edge_field, value)
+            pipe.hincrby(network_key, self.VERSION_FIELD, 1)
+        res = pipe.execute()
+        self.changed_edges.add(':'.join([edge_type.name, quote_type.name, edge_field]))
+        for network_key, version in zip(network_keys, res[1::2]):
+            self.changed_versions[network_key] = version
+
+    # tells subscribers to NETWORK_CHANGES_CHANNEL which edges were written since the last call
+    # as {"edges": ["edge type:quote type:SRC:DST"], "versions": {network key: version}}
+    # returns the number of subscribers told
+    def publish_changes(self) -> int:
+        if len(self.changed_edges) == 0:
+            return 0
+        message = json.dumps({'edges': sorted(self.changed_edges), 'versions': self.changed_versions})
+        self.changed_edges = set()
+        self.changed_versions = {}
+        return self.redis_server.publish(NETWORK_CHANGES_CHANNEL, message)
+
+    # [(cycle value, cycle)] in ascending order of value, cycles with the same value are all kept
+    # the bellman_ford engine only returns profitable cycles (worth more than 1)
+    def get_cycles_by_value(self, edge_type: EdgeType, quote_type: QuoteType) -> List[Tuple[float, List[str]]]:
+        return self.get_ranked_cycles(edge_type, quote_type)
 
     def get_cycles_for_currency_by_value(self, edge_type: EdgeType, quote_type: QuoteType, start_currency: Currency) -> \
-            Dict[float, List[str]]:
-        cycles_by_val = self.get_cycles_by_value(edge_type, quote_type)
-        output = {}
-        for cycle_val, cycle in cycles_by_val.items():
-            if start_currency.name not in cycle:
-                continue
-            output[cycle_val] = cycle
-        return output
+            List[Tuple[float, List[str]]]:
+        return self.get_ranked_cycles(edge_type, quote_type, start_currency.name)
+
+    def get_ranked_cycles(self, edge_type: EdgeType, quote_type: QuoteType, start_currency: Optional[str] = None,
+                          weights: Optional[Dict[Tuple[str, str], str]] = None) -> List[Tuple[float, List[str]]]:
+        if weights is None:
+            weights = self.get_weights(NetworkType.price, edge_type, quote_type)
+        if self.cycle_engine == CycleEngine.bellman_ford:
+            return NegativeCycleFinder(weights).get_ranked_cycles(start_currency, self.max_cycle_length,
+                                                                  NETWORK_MAX_NEGATIVE_CYCLES)
+        return self.get_cycle_set(edge_type, quote_type, weights).get_ranked_cycles(weights, start_currency)
 
     @staticmethod
     def get_next_node_in_cycle(cycle: List[str], start_currency: Currency) -> Currency:
         return Currency[cycle[cycle.index(start_currency.name) + 1]]
 
+    # each network is one hash of every edge so reading it never has to look for keys
+    @staticmethod
+    def get_redis_key(network_type: NetworkType, edge_type: EdgeType, quote_type: QuoteType) -> str:
+        return ':'.join(['network', network_type.name, edge_type.name, quote_type.name])
+
     @staticmethod
-    def get_redis_key(network_type: NetworkType, edge_type: EdgeType, quote_type: QuoteType,
-                      start_currency: Optional[Currency] = None) -> str:
-        currency = '' if start_currency is None else start_currency.name
-        return ':'.join(
-            ['network', network_type.name, edge_type.name,
-             quote_type.name, currency])
+    def get_edge_field(start_currency: Currency, end_currency: Currency) -> str:
+        return '{}:{}'.format(start_currency.name, end_currency.name)
 
     def get_edge_weight(self, edge_type: EdgeType, quote_type: QuoteType, start_currency: Currency,
                         destination_currency: Currency,
                         network_type: NetworkType = NetworkType.price) -> Optional[float]:
-        key_val = self.get_redis_key(network_type, edge_type, quote_type, start_currency)
-        edge_weight = self.redis_server.hget(key_val, destination_currency.name)
+        edge_weight = self.redis_server.hget(self.get_redis_key(network_type, edge_type, quote_type),
+                                             self.get_edge_field(start_currency, destination_currency))
         if edge_weight is None:
             return None
         return edge_weight
 
-    # this return {[cycle_value]: (next_node, edge_weight_product, edge_qty_product)}
-    def get_next_nodes_and_avail_qties_by_cycle_value(self, edge_type: EdgeType, start_currency: Currency) -> Dict[
-        float, Tuple[Currency, float, float]]:
-        cycles = self.get_cycles_for_currency_by_value(edge_type, QuoteType.currency, start_currency)
-        output = {}
-        for cycle_val in sorted(cycles):
-            cycle = cycles[cycle_val]
+    # this returns [(cycle_value, next_node, edge_weight_product, edge_qty_product)] in ascending order of cycle value
+    # the cycles and the edges to trade along are all read from the same snapshot
+    def get_next_nodes_and_avail_qties_by_cycle_value(self, edge_type: EdgeType, start_currency: Currency) -> List[
+        Tuple[float, Currency, float, float]]:
+        currency_weights, product_weights, product_qties = self.get_weights_snapshot(
+            [(NetworkType.price, edge_type, QuoteType.currency), (NetworkType.price, edge_type, QuoteType.product),
+             (NetworkType.quantity, edge_type, QuoteType.product)])
+        output = []
+        for cycle_val, cycle in self.get_ranked_cycles(edge_type, QuoteType.currency, start_currency.name,
+                                                       currency_weights):
             next_node = self.get_next_node_in_cycle(cycle, start_currency)
-            edge_weight = self.get_edge_weight(edge_type, QuoteType.product, start_currency, next_node,
-                                               NetworkType.price)
-            avail_qty = self.get_edge_weight(edge_type, QuoteType.product, start_currency, next_node,
-                                             NetworkType.quantity)
-            output[cycle_val] = (next_node, edge_weight, avail_qty)
+            edge = (start_currency.name, next_node.name)
+            output.append((cycle_val, next_node, product_weights.get(edge), product_qties.get(edge)))
         return output
 
-    def update_edge_type(self, order_book, side: OrderSide, edge_type: EdgeType) -> None:
+    # returns what the edge was computed from
+    def update_edge_type(self, order_book, side: OrderSide, edge_type: EdgeType) -> EdgeInputs:
         product = order_book.product
         source_currency = product.get_source_currency(side)
         destination_currency = product.get_destination_currency(side)
         if edge_type is EdgeType.best:
-            price = order_book.get_best(side)
-            if price is not None:
-                product_price = float(price)
+            best_tick = order_book.get_best_tick(side)
+            if best_tick is not None:
+                product_price = product.ticks_to_price(best_tick)
                 currency_price = order_book.product.convert_quote_price_to_currency_price(destination_currency,
                                                                                           product_price)
                 self.add_edge(edge_type, QuoteType.currency, source_currency, destination_currency, currency_price)
                 self.add_edge(edge_type, QuoteType.product, source_currency, destination_currency, product_price)
+            return EdgeInputs(True, best_tick)
         else:
             product_qty = order_book.get_edge_trade_size(side, OrderType.match, NETWORK_LOOKBACK, edge_type,
                                                          ORDER_AGGREGATION_TIME)
-            if product_qty is not None:
+            if product_qty is None:
+                return EdgeInputs(False)
+            else:
                 assert product_qty >= 0, 'Edge trade size is negative! {}, {}, {}'.format(source_currency.name,
                                                                                           destination_currency.name,
                                                                                           product_qty)
@@ -145,10 +269,10 @@ class NetworkManager:
 
                 # note that custom strategy does not allow exceeding best bid
                 allow_exceed_best = edge_type != EdgeType.custom
-                price, avail_qty = order_book.get_network_price(side, product_qty, my_desired_qty,
-                                                                allow_exceed_best=allow_exceed_best)
-                if price is not None:
-                    product_price = float(price)
+                tick, avail_qty, worst_tick, other_best_tick = order_book.get_network_ticks(
+                    side, product_qty, my_desired_qty, allow_exceed_best=allow_exceed_best)
+                if tick is not None:
+                    product_price = order_book.product.ticks_to_price(tick)
                     currency_price = order_book.product.convert_quote_price_to_currency_price(destination_currency,
                                                                                               product_price)
                     currency_qty = order_book.product.get_currency_quantity_from_quote_quantity(destination_currency,
@@ -158,6 +282,7 @@ class NetworkManager:
                                   currency_qty)
                     self.add_edge(edge_type, QuoteType.product, source_currency, destination_currency, product_price,
                                   avail_qty)
+                return EdgeInputs(True, worst_tick, other_best_tick)
 
     def update_from_order_book(self, order_book, side: OrderSide) -> None:
         for edge_type in EdgeType:
@@ -0,0 +1,69 @@
+import json
+from time import time
+from typing import Dict, Optional, Set, Tuple
+
+from redis import StrictRedis
+
+from trading_package.config.constants import NETWORK_CHANGES_CHANNEL
+
+
+# Collects the network changes published by NetworkManager.publish_changes so the strategy only
+# looks for trades when something it depends on changed, and at most once every min_interval seconds.
+# Changes to our own orders are marked directly as they do not come through the network.
+# Starts out due so the strategy runs once for whatever changed before it subscribed
+class NetworkChangeListener:
+    def __init__(self, min_interval: float, redis_server: Optional[StrictRedis] = None) -> None:
+        self.min_interval = min_interval
+        self.redis_server = redis_server or StrictRedis(host='localhost', port=6379, db=0, encoding="utf-8",
+                                                        decode_responses=True)
+        self.pubsub = self.redis_server.pubsub(ignore_subscribe_messages=True)
+        self.pubsub.subscribe(NETWORK_CHANGES_CHANNEL)
+        self.changed = True
+        self.edges = set()
+        # network key => latest version heard of
+        self.versions = {}
+        self.last_evaluation_time = 0.
+        self.counters = {'notifications': 0, 'marks': 0, 'evaluations': 0}
+
+    # reads every notification already received, returns how many there were
+    def poll(self) -> int:
+        count = 0
+        message = self.pubsub.get_message()
+        while message is not None:
+            if message['type'] == 'message':
+                changes = json.loads(message['data'])
+                self.edges.update(changes['edges'])
+                for network_key, version in changes['versions'].items():
+                    self.versions[network_key] = max(version, self.versions.get(network_key, 0))
+                self.changed = True
+                count = count + 1
+            message = self.pubsub.get_message()
+        self.counters['notifications'] = self.counters['notifications'] + count
+        return count
+
+    def mark(self) -> None:
+        self.counters['marks'] = self.counters['marks'] + 1
+        self.changed = True
+
+    def is_due(self, now_time: Optional[float] = None) -> bool:
+        now_time = time() if now_time is None else now_time
+        return self.changed and now_time - self.last_evaluation_time >= self.min_interval
+
+    # the edges changed since the last call and the latest versions, to be called when the strategy runs
+    def pop_changes(self, now_time: Optional[float] = None) -> Tuple[Set[str], Dict[str, int]]:
+        edges = self.edges
+        self.edges = set()
+        self.changed = False
+        self.last_evaluation_time = time() if now_time is None else now_time
+        self.counters['evaluations'] = self.counters['evaluations'] + 1
+        return edges, dict(self.versions)
+
+    def get_counters(self) -> Dict[str, int]:
+        return dict(self.counters)
+
+    def get_message(self) -> str:
+        return 'Strategy: {evaluations} evaluations for {notifications} network notifications and ' \
+               '{marks} order changes'.format(**self.counters)
+
+    def close(self) -> None:
+        self.pubsub.close()
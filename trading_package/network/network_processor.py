@@ -2,6 +2,9 @@ import traceback
 from multiprocessing import Process, queues
 from multiprocessing import Queue, Event
 
+from trading_package.config.constants import PROCESS_NETWORK_UPDATE_TIMEOUT, PROCESS_CPU_STATS_INTERVAL, \
+    NETWORK_RECOMPUTE_WINDOW
+from trading_package.helper.cpu_usage import CpuUsage
 from trading_package.helper.enums import LogType
 from trading_package.order_book.order_book import OrderBookManager
 
@@ -9,25 +12,41 @@ from trading_package.order_book.order_book import OrderBookManager
 class NetworkProcessor(Process):
     PROCESS_NAME = 'Network Processor'
 
-    def __init__(self, product_manager, logging_queue: Queue, exit_event: Event, ready_event: Event) -> None:
+    # network_event is set by the order book processor whenever a book changes (see OrderBookProcessor)
+    def __init__(self, product_manager, logging_queue: Queue, exit_event: Event, ready_event: Event,
+                 network_event: Event) -> None:
         Process.__init__(self)
         self.products = product_manager
         self.exit = exit_event
         self.ready_event = ready_event
+        self.network_event = network_event
         self.logging_queue = logging_queue
         self.order_book_manager = OrderBookManager(product_manager)
+        self.cpu_usage = CpuUsage(PROCESS_CPU_STATS_INTERVAL)
 
     def run(self) -> None:
         self.on_open()
         first = True
         while not self.exit.is_set():
             try:
+                # the timeout only bounds how long exit takes to be noticed, changes always set the event,
+                # unless changes are waiting to be coalesced (see EdgeRecomputeScheduler)
+                # it is cleared before updating so a change made during the update is not missed
+                edge_scheduler = self.order_book_manager.get_edge_scheduler()
+                timeout = NETWORK_RECOMPUTE_WINDOW if edge_scheduler.has_pending() else PROCESS_NETWORK_UPDATE_TIMEOUT
+                if not self.network_event.wait(timeout) and not first and not edge_scheduler.has_pending():
+                    continue
+                self.network_event.clear()
                 self.order_book_manager.update_network_manager()
                 if first:
                     self.ready_event.set()
                     first = False
             except Exception as e:
                 self.on_error(e)
+            finally:
+                if self.cpu_usage.is_due():
+                    self.log(LogType.info, self.cpu_usage.get_message())
+                    self.log(LogType.info, self.order_book_manager.get_edge_scheduler().get_message())
         self.on_close()
 
     def on_open(self) -> None:
@@ -0,0 +1,131 @@
+from heapq import heapify, heappop, heappush
+from typing import Dict, Tuple
+
+
+# Fenwick (binary indexed) tree over the price ticks of one side of the book holding
+# the size and the notional (tick * size) resting at each tick.
+# Index 1 is the best possible price so prefix sums are cumulative depth from the top of the book.
+# Only ticks that have been touched are stored so the tree can span every possible price.
+# Sizes are integers (see SIZE_UNITS in config.constants) which keeps the sums exact
+# no matter how many times a level is added to and taken from
+class DepthIndex:
+    def __init__(self, bits: int = 40) -> None:
+        self.bits = bits
+        self.capacity = 1 << bits
+        self.sizes = {}
+        self.notionals = {}
+        # index => size at that index
+        self.points = {}
+        self.total_size = 0
+        self.total_notional = 0
+        # search assumes sizes are never negative so callers need to know when they are
+        self.negative_points = 0
+
+    def get_capacity(self) -> int:
+        return self.capacity
+
+    def get_total_size(self) -> int:
+        return self.total_size
+
+    def get_total_notional(self) -> int:
+        return self.total_notional
+
+    def get_size(self, index: int) -> int:
+        return self.points.get(index, 0)
+
+    def has_negative_points(self) -> bool:
+        return self.negative_points > 0
+
+    def add(self, index: int, size: int, notional: int) -> None:
+        if size == 0 and notional == 0:
+            return
+        old_point = self.points.get(index, 0)
+        point = old_point + size
+        self.negative_points = self.negative_points + (point < 0) - (old_point < 0)
+        if point == 0:
+            self.points.pop(index, None)
+        else:
+            self.points[index] = point
+        self.total_size = self.total_size + size
+        self.total_notional = self.total_notional + notional
+        while index <= self.capacity:
+            self.__add_to_node(self.sizes, index, size)
+            self.__add_to_node(self.notionals, index, notional)
+            index = index + (index & -index)
+
+    # drop nodes that sum to zero so the tree stays as sparse as the book
+    @staticmethod
+    def __add_to_node(nodes: dict, index: int, value: int) -> None:
+        value = nodes.get(index, 0) + value
+        if value == 0:
+            nodes.pop(index, None)
+        else:
+            nodes[index] = value
+
+    # returns (size, notional) at indexes 1 to index inclusive
+    def get_prefix(self, index: int) -> Tuple[int, int]:
+        size = 0
+        notional = 0
+        while index > 0:
+            size = size + self.sizes.get(index, 0)
+            notional = notional + self.notionals.get(index, 0)
+            index = index - (index & -index)
+        return size, notional
+
+    # returns (index, size before index, notional before index) for the first index
+    # at which the cumulative size reaches size
+    # index is capacity + 1 if the whole side holds less than size
+    def search(self, size: int) -> Tuple[int, int, int]:
+        index = 0
+        size_before = 0
+        notional_before = 0
+        step = self.capacity
+        while step > 0:
+            next_index = index + step
+            node_size = self.sizes.get(next_index, 0)
+            if next_index <= self.capacity and size_before + node_size < size:
+                index = next_index
+                size_before = size_before + node_size
+                notional_before = notional_before + self.notionals.get(next_index, 0)
+            step = step >> 1
+        return index + 1, size_before, notional_before
+
+    # rebuild the tree from {index: (size, notional)} in one pass
+    # each node is pushed to its parent once in ascending order so every node is touched
+    # once instead of once per point below it
+    def load(self, points: Dict[int, Tuple[int, int]]) -> None:
+        self.clear()
+        heap = []
+        for index, (size, notional) in points.items():
+            if size == 0 and notional == 0:
+                continue
+            heap.append(index)
+            self.points[index] = size
+            self.sizes[index] = size
+            self.notionals[index] = notional
+            self.total_size = self.total_size + size
+            self.total_notional = self.total_notional + notional
+            self.negative_points = self.negative_points + (size < 0)
+        heapify(heap)
+        while heap:
+            index = heappop(heap)
+            parent = index + (index & -index)
+            if parent > self.capacity:
+                continue
+            if parent not in self.sizes:
+                self.sizes[parent] = 0
+                self.notionals[parent] = 0
+                heappush(heap, parent)
+            self.sizes[parent] = self.sizes[parent] + self.sizes[index]
+            self.notionals[parent] = self.notionals[parent] + self.notionals[index]
+        for nodes in [self.sizes, self.notionals]:
+            for index in [index for index, value in nodes.items() if value == 0]:
+                del nodes[index]
+
+    def clear(self) -> None:
+        self.sizes = {}
+        self.notionals = {}
+        self.points = {}
+        self.total_size = 0
+        self.total_notional = 0
+        self.negative_points = 0
@@ -1,7 +1,8 @@
+from calendar import timegm
 from datetime import datetime
-from decimal import Decimal
 from dateutil import tz
 from trading_package.helper.enums import *
+from trading_package.helper.fixed_point import size_to_units, units_to_str
 from typing import Dict, Union, Optional
 
 
@@ -19,7 +20,9 @@ class Order:
         self.status = status
         self.sequence_id = int(sequence_id)
         self.size = size
-        self.filled_size = '0'
+        # sizes are parsed once into integer units (see fixed_point)
+        self.size_units = size_to_units(size)
+        self.filled_units = 0
         self.price = str(price)
         self.order_id = order_id
         if created_at is None:
@@ -29,7 +32,7 @@ class Order:
             self.created_at = min(datetime.now(tz.tzutc()), created_at)
         self.historical = historical
         self.confirmed = confirmed
-        if float(self.size) < 0:
+        if self.size_units < 0:
             raise OrderException('Order size must be positive {}'.format(self.size))
 
     def get_historical(self) -> bool:
@@ -45,8 +48,9 @@ class Order:
     def get_created_at(self) -> datetime:
         return self.created_at
 
+    # strftime('%s') would read created_at as local time
     def get_unix_timestamp(self) -> str:
-        return self.created_at.strftime('%s')
+        return str(timegm(self.created_at.utctimetuple()))
 
     def get_created_at_seconds_ago(self, now_time=None) -> int:
         now_time = datetime.now(tz.tzutc()) if now_time is None else now_time
@@ -57,14 +61,20 @@ class Order:
         return self.order_type
 
     def get_filled_size(self) -> str:
-        return self.filled_size
+        return units_to_str(self.filled_units)
+
+    def get_filled_units(self) -> int:
+        return self.filled_units
 
     def add_filled_size(self, qty: str) -> str:
-        self.filled_size = str(Decimal(self.filled_size) + Decimal(qty))
-        return self.filled_size
+        self.filled_units = self.filled_units + size_to_units(qty)
+        return self.get_filled_size()
 
     def get_remaining_size(self) -> str:
-        return str(Decimal(self.size) - Decimal(self.filled_size))
+        return units_to_str(self.get_remaining_units())
+
+    def get_remaining_units(self) -> int:
+        return self.size_units - self.filled_units
 
     def get_sequence_id(self) -> int:
         return self.sequence_id
@@ -91,6 +101,9 @@ class Order:
     def get_size(self) -> str:
         return self.size
 
+    def get_size_units(self) -> int:
+        return self.size_units
+
     def get_gdax_order_params(self) -> Dict[str, Union[bool, str]]:
         return {
             'price': str(self.get_price()),
@@ -1,13 +1,21 @@
-from datetime import datetime
 from statistics import mean, median, mode, StatisticsError
-from typing import List, Tuple, Optional
+from time import time
+from typing import List, Tuple, Optional, Set, Union, Dict
 
-from dateutil import tz
 from redis import StrictRedis
 
+from trading_package.config.constants import NETWORK_LOOKBACK, NETWORK_RECOMPUTE_WINDOW, NETWORK_RECOMPUTE_MAX_AGE
 from trading_package.helper.enums import *
+from trading_package.helper.fixed_point import size_to_units, units_to_size
+from trading_package.network.edge_recompute_scheduler import EdgeRecomputeScheduler, ALL_TICKS, get_better_tick
 from trading_package.network.network import NetworkManager
 from trading_package.order_book.order import Order
+from trading_package.order_book.order_event import OrderEvent
+from trading_package.order_book.order_book_snapshot import OrderBookSnapshot
+from trading_package.order_book.order_book_store import OrderBookStore, RedisOrderBookStore, LadderOrderBookStore
+from trading_package.order_book.redis_write_batcher import RedisWriteBatcher
+from trading_package.order_book.trade_history import TradeHistory, RedisTradeHistory, MemoryTradeHistory
+from trading_package.order_book.trade_statistics import RollingTradeStatistics
 from trading_package.portfolio.product import ProductManager, Product
 
 
@@ -26,14 +34,26 @@ class OrderBookException(Exception):
 class OrderBook:
     # not that sequence ids will be cast to integers
     # order book is also maintained in redis
-    def __init__(self, product: Product, sequence_id: int = 0) -> None:
+    def __init__(self, product: Product, sequence_id: int = 0, store: Optional[OrderBookStore] = None,
+                 batcher: Optional[RedisWriteBatcher] = None, trade_history: Optional[TradeHistory] = None) -> None:
         self.redis_server = StrictRedis(host='localhost', port=6379, db=0, encoding="utf-8", decode_responses=True)
         self.product = product
+        # every order counts towards the batcher's batch size when there is one
+        self.batcher = batcher
+        # price levels and trade history live in redis unless we are given something else
+        self.store = store or RedisOrderBookStore(product.get_product_id(), self.redis_server, batcher)
+        self.trade_history = trade_history or RedisTradeHistory(product.get_product_id(), NETWORK_LOOKBACK,
+                                                                self.redis_server, batcher)
+        if self.store.uses_scripts() and not isinstance(self.trade_history, RedisTradeHistory):
+            raise OrderBookException('Lua scripts record trades in redis so need a redis trade history')
         self.sequence_id = int(sequence_id)
         self.order_book = {side: {} for side in OrderSide}
         self.trades = {side: {order_type: {} for order_type in OrderType} for side in OrderSide}
         self.orders_added = 0
         self.orders_subtracted = 0
+        # since pop_changes: side => best tick changed and sides with trades (see EdgeRecomputeScheduler)
+        self.changed_ticks = {}
+        self.traded_sides = set()
 
     def get_product_id(self) -> str:
         return self.get_product().get_product_id()
@@ -44,42 +64,62 @@ class OrderBook:
     def get_sequence_id(self) -> int:
         return self.sequence_id
 
+    def get_store(self) -> OrderBookStore:
+        return self.store
+
     # this method determines the best maker price at which to place an order
     # so as to fill AT least quantity
+    # everything is worked out in ticks and size units and the price comes back as the exact string of its tick
     def get_network_price(self, side: OrderSide, total_quantity: float, desired_quantity: float = 0,
                           allow_exceed_best: bool = True) -> Tuple[Optional[str], Optional[float]]:
+        tick, avail_qty, _, _ = self.get_network_ticks(side, total_quantity, desired_quantity, allow_exceed_best)
+        return None if tick is None else self.get_product().ticks_to_str(tick), avail_qty
+
+    # get_network_price as (price tick, available quantity) along with the worst tick it read
+    # (None if it read the whole side) and the other side's best tick if it looked at the spread (see EdgeInputs)
+    def get_network_ticks(self, side: OrderSide, total_quantity: float, desired_quantity: float = 0,
+                          allow_exceed_best: bool = True) -> Tuple[Optional[int], Optional[float], Optional[int],
+                                                                   Optional[float]]:
         if total_quantity is None:
             raise OrderBookException('Total quantity cannot be none in get_price: {}'.format(total_quantity))
 
         # this is how much approximately we need to fill first to get best possible price
-        other_quantity = total_quantity - desired_quantity
-        best_price, worst_price, total_price, error, worst_qty = self.get_price(side=side, depth=other_quantity)
+        other_quantity = size_to_units(total_quantity - desired_quantity)
+        best_tick, worst_tick, _, total_qty, error, worst_qty = self.store.get_depth(side, other_quantity)
+        product = self.get_product()
+        # a side without enough in it can be changed by a level anywhere
+        read_tick = worst_tick if total_qty >= other_quantity else None
         # prices haven't loaded yet
-        if worst_price is None or best_price is None:
-            return None, None
+        if worst_tick is None or best_tick is None:
+            return None, None, None, None
         # this means we can optimally place at the back of the queue within an error of the minimum quote size
-        # we do all comparisons as floats to save time at the cost of accuracy here
-        elif error <= float(self.get_product().get_base_min_size_str()):
-            return str(worst_price), desired_quantity
+        elif error <= product.get_base_min_size_units():
+            return worst_tick, desired_quantity, read_tick, None
         # best bid and best ask are separated by the minimum spread so there is nowhere else for me to go
         # return available qty of 0 at best price
-        elif best_price == worst_price and (self.spread_locked() or not allow_exceed_best):
-            return str(best_price), 0.
+        elif best_tick == worst_tick and (self.spread_locked() or not allow_exceed_best):
+            return best_tick, 0., read_tick, self.__get_spread_tick(side)
 
         # take a slightly worse price but in exchange fill more quantity
-        if side == OrderSide.bid:
-            new_price = self.get_product().get_higher_price(str(worst_price))
-        else:
-            new_price = self.get_product().get_lower_price(str(worst_price))
-
-        return str(new_price), desired_quantity + worst_qty - error
+        new_tick = worst_tick + 1 if side == OrderSide.bid else worst_tick - 1
+        other_best_tick = self.__get_spread_tick(side) if best_tick == worst_tick else None
+        return new_tick, desired_quantity + units_to_size(worst_qty - error), read_tick, other_best_tick
+
+    # the other side's best tick as read by spread_locked; any level at all changes an empty side
+    def __get_spread_tick(self, side: OrderSide) -> float:
+        other_side = OrderSide.ask if side == OrderSide.bid else OrderSide.bid
+        best_tick = self.get_best_tick(other_side)
+        if best_tick is None:
+            return float('inf') if other_side == OrderSide.ask else float('-inf')
+        return best_tick
 
     def spread_locked(self) -> bool:
-        best_bid, best_ask = self.get_best_bid_ask(0)
-        if best_bid and best_ask:
-            if self.get_product().get_higher_price(str(best_bid)) == self.get_product().round_price(str(best_ask)):
-                return True
-        return False
+        best_bid = self.get_best_tick(OrderSide.bid)
+        best_ask = self.get_best_tick(OrderSide.ask)
+        return best_bid is not None and best_ask is not None and best_bid + 1 == best_ask
+
+    def get_best_tick(self, side: OrderSide) -> Optional[int]:
+        return self.store.get_depth(side, 0)[1]
 
     # this returns
     # (best price, worst price, total price for depth, excess quantity above depth, filled qty at worst price)
@@ -87,42 +127,22 @@ class OrderBook:
     def get_price(self, side: OrderSide, depth: float = 0) -> Tuple[float, float, float, float, float]:
         if depth is None:
             raise OrderBookException('depth cannot by none in get_price: {}'.format(depth))
-
-        total_price = 0.
-        total_qty = 0.
-        best_price = None
-        worst_price = None
-        excess_qty = 0.
-        worst_qty = 0.
-        reverse_order_sort = True if side is OrderSide.bid else False
-        counter = 0
-        iter_count = 10
-        keep_going = True
-        while keep_going:
-            price_keys = self.redis_server.zrange(self.__get_ob_order_set_redis_key(side), counter,
-                                                  counter + iter_count - 1, withscores=True, desc=reverse_order_sort)
-            if len(price_keys) == 0:
-                break
-            sizes = self.redis_server.mget(map(lambda x: x[0], price_keys))
-            for idx, (_, price) in enumerate(price_keys):
-                if best_price is None:
-                    best_price = price
-                worst_price = price
-                if sizes[idx] is None:
-                    continue
-                size = float(sizes[idx])
-                qty = min(size, depth - total_qty)
-                excess_qty = size - qty
-                worst_qty = size
-
-                total_price = total_price + (price * qty)
-                total_qty = total_qty + qty
-                if total_qty >= depth:
-                    keep_going = False
-                    break
-
-            counter = counter + iter_count
-        return best_price, worst_price, total_price, excess_qty, worst_qty
+        best_tick, worst_tick, notional, _, excess_qty, worst_qty = self.store.get_depth(side, size_to_units(depth))
+        product = self.get_product()
+        return (None if best_tick is None else product.ticks_to_price(best_tick),
+                None if worst_tick is None else product.ticks_to_price(worst_tick),
+                product.notional_to_quote_value(notional), units_to_size(excess_qty), units_to_size(worst_qty))
+
+    # volume weighted average price of filling depth (or the whole side if it holds less)
+    def get_vwap(self, side: OrderSide, depth: float) -> Optional[float]:
+        if depth is None:
+            raise OrderBookException('depth cannot by none in get_vwap: {}'.format(depth))
+        best_tick, _, notional, total_qty, _, _ = self.store.get_depth(side, size_to_units(depth))
+        if best_tick is None:
+            return None
+        if total_qty <= 0:
+            return self.get_product().ticks_to_price(best_tick)
+        return notional / (total_qty * self.get_product().get_tick_divisor())
 
     def get_best_bid(self, depth: float = 0) -> float:
         return self.get_price(OrderSide.bid, depth)[1]
@@ -139,8 +159,8 @@ class OrderBook:
         else:
             return self.get_best_ask(depth)
 
-    def validate_order(self, order: Order) -> bool:
-        if isinstance(order, Order):
+    def validate_order(self, order: Union[Order, OrderEvent]) -> bool:
+        if isinstance(order, (Order, OrderEvent)):
             if order.get_product_id() != self.get_product_id():
                 raise OrderBookException(
                     'You can only add orders with the same product id {} {}'.format(self.get_product_id(),
@@ -155,7 +175,7 @@ class OrderBook:
                 return True
         else:
             raise OrderBookException(
-                'You can only add orders of type Order to an order book {}'.format(str(type(order)))
+                'You can only add orders of type Order or OrderEvent to an order book {}'.format(str(type(order)))
             )
 
     # optimize so that this is way faster
@@ -177,23 +197,11 @@ class OrderBook:
     # 4) Else append array element
     def get_trade_quantities(self, side: OrderSide, order_type: OrderType, seconds_ago: int,
                              group_by_period: int = None) -> List[float]:
-        now_time = float(datetime.now(tz.tzutc()).strftime('%s'))
+        now_time = float(int(time()))
         first_time = now_time - seconds_ago
         quantities = []
         last_created_at = None
-        # this gets all relevant keys
-        size_key_by_timestamp = self.redis_server.zrangebyscore(self.__get_th_order_set_redis_key(order_type, side),
-                                                                first_time,
-                                                                now_time, withscores=True)
-        if len(size_key_by_timestamp) == 0:
-            return []
-        sizes = self.redis_server.mget(map(lambda x: x[0], size_key_by_timestamp))
-        for idx, (_, timestamp) in enumerate(size_key_by_timestamp):
-            size = sizes[idx]
-            if size is None:
-                continue
-            else:
-                size = float(sizes[idx])
+        for timestamp, size in self.trade_history.get_trades(side, order_type, first_time, now_time):
             created_at = int(timestamp)
             quantity = 0
             if group_by_period is None:
@@ -208,7 +216,19 @@ class OrderBook:
             last_created_at = r_created_at
         return quantities
 
+    # rolling statistics are only kept per second over the whole lookback so any other window
+    # or grouping falls back to fetching the trades
+    def __get_statistics(self, side: OrderSide, order_type: OrderType, seconds_ago: int,
+                         group_by_period: Optional[int] = None) -> Optional[RollingTradeStatistics]:
+        if group_by_period not in [None, 1]:
+            return None
+        now_time = float(int(time()))
+        return self.trade_history.get_statistics(side, order_type, seconds_ago, now_time)
+
     def get_volume(self, side: OrderSide, order_type: OrderType, seconds_ago: int) -> float:
+        statistics = self.__get_statistics(side, order_type, seconds_ago)
+        if statistics is not None:
+            return statistics.get_volume()
         order_quantities = self.get_trade_quantities(side, order_type, seconds_ago)
         return sum(order_quantities)
 
@@ -229,6 +249,9 @@ class OrderBook:
 
     def get_average_trade_size(self, side: OrderSide, order_type: OrderType, seconds_ago: int,
                                group_by_period: Optional[int] = None) -> Optional[float]:
+        statistics = self.__get_statistics(side, order_type, seconds_ago, group_by_period)
+        if statistics is not None:
+            return statistics.get_mean()
         order_quantities = self.get_trade_quantities(side, order_type, seconds_ago, group_by_period)
         if len(order_quantities) == 0:
             return None
@@ -236,6 +259,9 @@ class OrderBook:
 
     def get_median_trade_size(self, side: OrderSide, order_type: OrderType, seconds_ago: int,
                               group_by_period: Optional[int] = None) -> Optional[float]:
+        statistics = self.__get_statistics(side, order_type, seconds_ago, group_by_period)
+        if statistics is not None:
+            return statistics.get_median()
         order_quantities = self.get_trade_quantities(side, order_type, seconds_ago, group_by_period)
         if len(order_quantities) == 0:
             return None
@@ -243,6 +269,9 @@ class OrderBook:
 
     def get_mode_trade_size(self, side: OrderSide, order_type: OrderType, seconds_ago: int,
                             group_by_period: Optional[int] = None) -> Optional[float]:
+        statistics = self.__get_statistics(side, order_type, seconds_ago, group_by_period)
+        if statistics is not None:
+            return statistics.get_mode()
         order_quantities = self.get_trade_quantities(side, order_type, seconds_ago, group_by_period)
         if len(order_quantities) == 0:
             return None
@@ -251,163 +280,232 @@ class OrderBook:
         except StatisticsError:
             return None
 
-    def __get_root_ob_redis_key(self, side: OrderSide) -> str:
-        return 'order_book:book:{}:{}'.format(self.get_product_id(), side.name)
-
-    # this key points to a hash of order_id => size
-    def __get_ob_order_hash_redis_key(self, side: OrderSide, price: str) -> str:
-        return '{}:{:.5f}:order_list'.format(self.__get_root_ob_redis_key(side), float(price))
-
-    # this key points to the sum of orders at this price
-    def __get_ob_sum_size_redis_key(self, side: OrderSide, price: str) -> str:
-        return '{}:{:.5f}:order_size_sum'.format(self.__get_root_ob_redis_key(side), float(price))
-
-    # this key points to a set with price keys and score of price to facilitate getting a range
-    def __get_ob_order_set_redis_key(self, side: OrderSide) -> str:
-        return '{}'.format(self.__get_root_ob_redis_key(side))
-
-    # redis key for trade history
-    def __get_th_order_set_redis_key(self, order_type: OrderType, side: OrderSide) -> str:
-        return 'order_book:history:trades:{}:{}:{}'.format(self.get_product_id(),
-                                                           side.name,
-                                                           order_type.name)
-
-    # redis key for trade history
-    def __get_th_redis_key(self, order_type: OrderType, side: OrderSide, timestamp: str) -> str:
-        return 'order_book:history:trades:{}:{}:{}:{}'.format(self.get_product_id(),
-                                                              side.name,
-                                                              order_type.name,
-                                                              timestamp)
-
-    @staticmethod
-    def __get_pr_redis_key(side: OrderSide) -> str:
-        return 'order_book:changed_products:{}'.format(side.name)
-
-    def __add_trade_to_trade_history(self, order: Order) -> None:
-        th_set_key = self.__get_th_order_set_redis_key(order.get_order_type(), order.get_order_side())
-        th_order_size_key = self.__get_th_redis_key(order.get_order_type(), order.get_order_side(),
-                                                    order.get_unix_timestamp())
-        self.redis_server.zadd(th_set_key, order.get_unix_timestamp(), th_order_size_key)
-        self.redis_server.incrbyfloat(th_order_size_key, order.get_size())
+    def __add_trade_to_trade_history(self, order: Union[Order, OrderEvent]) -> None:
+        self.trade_history.add_trade(order.get_order_side(), order.get_order_type(), int(order.get_unix_timestamp()),
+                                     order.get_size())
 
     def __update_sequence_id(self, sequence_id: int) -> None:
         if sequence_id > self.sequence_id:
             self.sequence_id = sequence_id
 
-    def __remove_order(self, order: Order) -> None:
-        price = order.get_price()
+    # events already carry their tick, orders are still parsed here
+    def __get_price_ticks(self, order: Union[Order, OrderEvent]) -> int:
+        if isinstance(order, OrderEvent):
+            return order.get_price_ticks()
+        return self.product.price_to_ticks(order.get_price())
+
+    def __apply_operation(self, operation: BookOperation, order: Union[Order, OrderEvent]) -> None:
+        self.__count_mutation()
+        tick = self.__get_price_ticks(order)
+        self.__record_change(operation, order, tick)
+        if self.store.uses_scripts():
+            self.__run_script(operation, order, tick)
+            return
         side = order.get_order_side()
-        order_key = self.__get_ob_order_hash_redis_key(side, price)
-        size_key = self.__get_ob_sum_size_redis_key(side, price)
-        self.redis_server.hdel(order_key, order.get_order_id())
-        if self.redis_server.hlen(order_key) == 0:
-            # why bother deleting here?
-            self.redis_server.delete(order_key)
-            self.redis_server.delete(size_key)
-            self.redis_server.zrem(self.__get_ob_order_set_redis_key(side),
-                                   self.__get_ob_sum_size_redis_key(side, price))
-        else:
-            self.redis_server.incrbyfloat(size_key, '-' + order.get_size())
+        if operation == BookOperation.add:
+            self.store.add_order(side, tick, order.get_order_id(), order.get_size_units())
+        elif operation == BookOperation.remove:
+            self.store.remove_order(side, tick, order.get_order_id(), order.get_size_units())
+        elif operation == BookOperation.change:
+            self.store.change_order(side, tick, order.get_order_id(), order.get_filled_units(),
+                                    order.get_remaining_units())
+        elif operation == BookOperation.match:
+            self.store.match_order(side, tick, order.get_order_id(), order.get_size_units())
+        self.__register_product_change(side)
+        self.__add_trade_to_trade_history(order)
 
-    def __change_order(self, order: Order) -> None:
-        price = order.get_price()
-        order_id = order.get_order_id()
+    def __run_script(self, operation: BookOperation, order: Union[Order, OrderEvent], tick: int) -> None:
         side = order.get_order_side()
-        new_order_size = order.get_filled_size()
-        order_key = self.__get_ob_order_hash_redis_key(side, price)
-        size_key = self.__get_ob_sum_size_redis_key(side, price)
-        if self.redis_server.hexists(order_key, order_id):
-            self.redis_server.hset(order_key, order_id, new_order_size)
-            self.redis_server.incrbyfloat(size_key, '-' + order.get_remaining_size())
-
-    def __match_order(self, order: Order) -> None:
-        price = order.get_price()
-        order_id = order.get_order_id()
+        size = order.get_remaining_units() if operation == BookOperation.change else order.get_size_units()
+        timestamp = int(order.get_unix_timestamp())
+        history_keys = self.trade_history.get_keys(side, order.get_order_type(), timestamp)
+        history_args = self.trade_history.get_script_args(side, order.get_order_type(), timestamp, order.get_size())
+        self.store.run_script(operation, side, tick, order.get_order_id() or '', size, order.get_filled_units(),
+                              history_keys, history_args)
+
+    def __record_change(self, operation: BookOperation, order: Union[Order, OrderEvent], tick: int) -> None:
         side = order.get_order_side()
-        order_key = self.__get_ob_order_hash_redis_key(side, price)
-        size_key = self.__get_ob_sum_size_redis_key(side, price)
-        self.redis_server.hincrbyfloat(order_key, order_id, '-' + order.get_size())
-        self.redis_server.incrbyfloat(size_key, '-' + order.get_size())
+        if order.get_order_type() == OrderType.match:
+            self.traded_sides.add(side)
+        if operation == BookOperation.record:
+            return
+        self.changed_ticks[side] = get_better_tick(side, self.changed_ticks.get(side), tick)
+
+    # every order counts as one mutation towards the batch size however many writes it takes
+    def __count_mutation(self) -> None:
+        if self.batcher is not None:
+            self.batcher.add_mutation()
 
     def __register_product_change(self, side) -> None:
-        self.redis_server.sadd(self.__get_pr_redis_key(side), self.get_product_id())
+        self.store.register_change(side)
+
+    # replace the whole book with a snapshot in one write per side instead of one per order
+    # anything already in the book is dropped and the sequence id is reset to the snapshot's
+    def load_snapshot(self, snapshot: OrderBookSnapshot) -> None:
+        if snapshot.get_sequence_id() < self.get_sequence_id():
+            raise SequenceException(
+                'You cannot load a snapshot with a lower sequence id {} {}'.format(self.get_sequence_id(),
+                                                                                    snapshot.get_sequence_id())
+            )
+        self.sequence_id = snapshot.get_sequence_id()
+        for side in OrderSide:
+            self.store.load_levels(side, snapshot.get_levels(side))
+            self.trade_history.add_trades(side, OrderType.match, snapshot.get_trades(side))
+            self.__register_product_change(side)
+            self.changed_ticks[side] = ALL_TICKS[side]
+            self.traded_sides.add(side)
+        self.orders_added = self.orders_added + snapshot.get_order_count() + snapshot.get_trade_count()
+
+    # (side => best tick changed, sides traded on) since the last call
+    def pop_changes(self) -> Tuple[Dict[OrderSide, float], Set[OrderSide]]:
+        changes = self.changed_ticks, self.traded_sides
+        self.changed_ticks = {}
+        self.traded_sides = set()
+        return changes
+
+    def pop_changed_sides(self) -> Set[OrderSide]:
+        return self.store.pop_changed_sides()
+
+    def flush(self) -> None:
+        self.store.flush()
 
     # allow addition of order to order book
     # this should be used for new orders
-    def __add__(self, order: Order) -> None:
+    def __add__(self, order: Union[Order, OrderEvent]) -> None:
         self.validate_order(order)
         self.__update_sequence_id(order.get_sequence_id())
-        price = order.get_price()
-        side = order.get_order_side()
-        if not order.get_historical():
-            # This marks that we have live orders at this price
-            self.redis_server.zadd(self.__get_ob_order_set_redis_key(side), price,
-                                   self.__get_ob_sum_size_redis_key(side, price))
-            # This adds the order to a list of orders keyed off price
-            self.redis_server.hset(self.__get_ob_order_hash_redis_key(side, price), order.get_order_id(),
-                                   order.get_size())
-            self.redis_server.incrbyfloat(self.__get_ob_sum_size_redis_key(side, price), order.get_size())
-
-        self.__register_product_change(order.get_order_side())
+        self.__apply_operation(BookOperation.record if order.get_historical() else BookOperation.add, order)
         self.orders_added = self.orders_added + 1
         # if self.orders_added % 1000 == 1:
         # print('Heartbeat {} orders added to {}'.format(self.orders_added, self.get_product_id()))
-        self.__add_trade_to_trade_history(order)
 
     # allow subtraction of order from order book
-    def __sub__(self, order: Order) -> None:
+    def __sub__(self, order: Union[Order, OrderEvent]) -> None:
         self.validate_order(order)
         self.__update_sequence_id(order.get_sequence_id())
-        if not order.get_historical():
-            if order.get_status() in [OrderStatus.filled, OrderStatus.canceled]:
-                self.__remove_order(order)
-            elif order.get_order_type() == OrderType.change:
-                self.__change_order(order)
-            else:
-                self.__match_order(order)
-
-        self.__register_product_change(order.get_order_side())
+        if order.get_historical():
+            operation = BookOperation.record
+        elif order.get_status() in [OrderStatus.filled, OrderStatus.canceled]:
+            operation = BookOperation.remove
+        elif order.get_order_type() == OrderType.change:
+            operation = BookOperation.change
+        else:
+            operation = BookOperation.match
+        self.__apply_operation(operation, order)
         self.orders_subtracted = self.orders_subtracted + 1
         # if self.orders_subtracted % 1000 == 1:
         #     print('Heartbeat {} orders removed from {}'.format(self.orders_subtracted, self.get_product_id()))
-        self.__add_trade_to_trade_history(order)
 
 
 class OrderBookManager:
     BATCH_SIZE = 10
 
-    def __init__(self, product_manager: ProductManager) -> None:
+    # in_memory keeps the price levels inside this process (see LadderOrderBookStore)
+    # and mirror decides whether they are copied back to redis for other readers
+    # batch_writes queues every redis write of every book on one shared pipeline (see RedisWriteBatcher)
+    def __init__(self, product_manager: ProductManager, in_memory: bool = False, mirror: bool = False,
+                 mirror_interval: float = 0., batch_writes: bool = False, max_batch_size: int = 500,
+                 max_batch_delay: float = 0.002, transaction: bool = False, use_scripts: bool = False) -> None:
         self.product_manager = product_manager
-        self.order_books = {product_id: OrderBook(product_manager.get_product(product_id)) for product_id in
-                            self.product_manager.get_product_ids()}
-        self.network_manager = NetworkManager()
+        self.in_memory = in_memory
+        self.mirror = mirror
+        self.use_scripts = use_scripts
+        self.mirror_interval = mirror_interval
+        self.last_mirror_time = 0.
         self.redis_server = StrictRedis(host='localhost', port=6379, db=0, encoding="utf-8", decode_responses=True)
+        self.batcher = RedisWriteBatcher(self.redis_server, max_batch_size, max_batch_delay,
+                                         transaction) if batch_writes else None
+        self.order_books = {product_id: self.__create_order_book(product_id) for
+                            product_id in self.product_manager.get_product_ids()}
+        self.network_manager = NetworkManager()
+        self.edge_scheduler = EdgeRecomputeScheduler(self.network_manager, NETWORK_RECOMPUTE_WINDOW,
+                                                     NETWORK_RECOMPUTE_MAX_AGE)
+
+    def __create_order_book(self, product_id: str) -> OrderBook:
+        return OrderBook(self.product_manager.get_product(product_id), store=self.__get_store(product_id, self.mirror),
+                         batcher=self.batcher, trade_history=self.__get_trade_history(product_id))
+
+    def __get_store(self, product_id: str, mirror: bool) -> OrderBookStore:
+        if not self.in_memory:
+            return RedisOrderBookStore(product_id, self.redis_server, self.batcher, self.use_scripts)
+        mirror_store = RedisOrderBookStore(product_id, self.redis_server, self.batcher) if mirror else None
+        return LadderOrderBookStore(product_id, mirror_store)
+
+    # in memory books keep their trade history in memory too as nothing else reads it
+    def __get_trade_history(self, product_id: str) -> TradeHistory:
+        if self.in_memory:
+            return MemoryTradeHistory(NETWORK_LOOKBACK)
+        return RedisTradeHistory(product_id, NETWORK_LOOKBACK, self.redis_server, self.batcher)
+
+    def get_batcher(self) -> Optional[RedisWriteBatcher]:
+        return self.batcher
+
+    def is_write_batch_due(self) -> bool:
+        return self.batcher is not None and self.batcher.is_due()
+
+    def flush_writes(self) -> None:
+        if self.batcher is not None:
+            self.batcher.flush()
 
     def get_order_book(self, product_id: str) -> OrderBook:
         return self.order_books[product_id]
 
+    # an empty book in place of the product's current one, to be loaded from a snapshot
+    def reset_order_book(self, product_id: str) -> OrderBook:
+        self.order_books[product_id] = self.__create_order_book(product_id)
+        return self.order_books[product_id]
+
     def get_network_manager(self) -> NetworkManager:
         return self.network_manager
 
+    def get_edge_scheduler(self) -> EdgeRecomputeScheduler:
+        return self.edge_scheduler
+
+    # only the edges the changes can have moved are recomputed, once their changes have been
+    # coalesced for long enough (see EdgeRecomputeScheduler)
     def update_network_manager(self) -> NetworkManager:
-        for side in OrderSide:
-            products = self.redis_server.execute_command('SPOP', self.__get_pr_redis_key(side), self.BATCH_SIZE)
-            for next_product in products:
-                self.network_manager.update_from_order_book(self.get_order_book(next_product), side)
+        now_time = time()
+        if self.in_memory:
+            for product_id, order_book in self.order_books.items():
+                self.edge_scheduler.mark_changes(product_id, order_book.pop_changes(), now_time)
+        else:
+            # the changed sets only say which sides changed so everything on them counts as changed
+            # they are drained so one wakeup of the network processor handles every change
+            for side in OrderSide:
+                products = self.redis_server.execute_command('SPOP', self.__get_pr_redis_key(side), self.BATCH_SIZE)
+                while len(products) > 0:
+                    for next_product in products:
+                        self.edge_scheduler.mark(next_product, side, ALL_TICKS[side], True, now_time)
+                    if len(products) < self.BATCH_SIZE:
+                        break
+                    products = self.redis_server.execute_command('SPOP', self.__get_pr_redis_key(side),
+                                                                 self.BATCH_SIZE)
+        self.edge_scheduler.recompute_due(self.order_books, now_time)
+        self.network_manager.publish_changes()
         return self.get_network_manager()
 
+    # copy in memory books back to redis at most once every mirror_interval seconds
+    def flush_mirror(self, force: bool = False) -> None:
+        now_time = time()
+        if not force and now_time - self.last_mirror_time < self.mirror_interval:
+            return
+        for order_book in self.order_books.values():
+            order_book.flush()
+        self.flush_writes()
+        self.last_mirror_time = now_time
+
     @staticmethod
     def __get_pr_redis_key(side: OrderSide) -> str:
         return 'order_book:changed_products:{}'.format(side.name)
 
-    def __add__(self, order: Order) -> OrderBook:
+    def __add__(self, order: Union[Order, OrderEvent]) -> OrderBook:
         order_book = self.get_order_book(order.get_product_id())
         val = order_book + order
         return val
 
     # allow subtraction of order to order book
     # this should be used for cancellation
-    def __sub__(self, order: Order) -> OrderBook:
+    def __sub__(self, order: Union[Order, OrderEvent]) -> OrderBook:
         order_book = self.get_order_book(order.get_product_id())
         val = order_book - order
         return val
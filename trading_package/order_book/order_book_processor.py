@@ -1,40 +1,115 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from multiprocessing import Process, queues
-from dateutil import parser
 from trading_package.client_initializer import *
-from trading_package.order_book.order_book import Order, OrderBookManager, OrderBook
+from trading_package.config.constants import *
+from trading_package.exchange_websocket.message_codec import FeedMessage
+from trading_package.exchange_websocket.shared_ring_buffer import SharedRingBufferReader
+from trading_package.helper.cpu_usage import CpuUsage
+from trading_package.helper.fixed_point import size_to_units
+from trading_package.helper.timestamps import parse_timestamp_ns, now_ns
+from trading_package.order_book.order_book import OrderBookManager, OrderBook
+from trading_package.order_book.order_event import OrderEvent
+from trading_package.order_book.order_book_resync import OrderBookResync
+from trading_package.order_book.order_book_shards import OrderBookShardMap
+from trading_package.order_book.order_book_snapshot import OrderBookSnapshot
 from trading_package.helper.enums import *
 from multiprocessing import Queue, Event
 from trading_package.portfolio.product import ProductManager
+from time import time
 import traceback
-from typing import Optional, Dict
+from typing import Optional, Dict, Union, List
 
 
 class OrderBookProcessor(Process):
     PROCESS_NAME = 'Order Book Processor'
 
-    def __init__(self, product_manager: ProductManager, websocket_feed_queue: Queue, logging_queue: Queue,
-                 exit_event: Event, ready_event: Event) -> None:
+    def __init__(self, product_manager: ProductManager,
+                 websocket_feed_queue: Union[Queue, SharedRingBufferReader], logging_queue: Queue,
+                 exit_event: Event, ready_event: Event, network_event: Optional[Event] = None,
+                 shard_map: Optional[OrderBookShardMap] = None, shard: int = 0) -> None:
         Process.__init__(self)
+        # with a shard map this only keeps the books of the products its shard owns
+        self.shard_map = shard_map
+        self.shard = shard
+        if shard_map is not None and shard_map.get_shard_count() > 1:
+            self.PROCESS_NAME = '{} {}'.format(self.PROCESS_NAME, shard)
         self.websocket_feed_queue = websocket_feed_queue
         self.product_manager = product_manager
         self.exit = exit_event
         self.logging_queue = logging_queue
         self.ready_event = ready_event
-        self.order_book_manager = OrderBookManager(self.product_manager)
+        # set whenever books in redis change so the network processor only wakes up when there is work
+        self.network_event = network_event
+        self.order_book_manager = OrderBookManager(self.product_manager, in_memory=IN_MEMORY_ORDER_BOOK,
+                                                   mirror=ORDER_BOOK_REDIS_MIRROR,
+                                                   mirror_interval=ORDER_BOOK_MIRROR_INTERVAL,
+                                                   batch_writes=ORDER_BOOK_BATCH_WRITES,
+                                                   max_batch_size=ORDER_BOOK_WRITE_MAX_BATCH_SIZE,
+                                                   max_batch_delay=ORDER_BOOK_WRITE_MAX_DELAY,
+                                                   transaction=ORDER_BOOK_WRITE_TRANSACTION,
+                                                   use_scripts=ORDER_BOOK_LUA_SCRIPTS)
+        # product id => resync in progress
+        self.resyncs = {}
+        self.resync_executor = None
+        self.feed_overruns = 0
+        # last reading of the clock (see get_timestamp_ns)
+        self.clock_ns = 0
+        self.cpu_usage = CpuUsage(PROCESS_CPU_STATS_INTERVAL)
 
     def run(self) -> None:
+        self.resync_executor = ThreadPoolExecutor(max_workers=ORDER_BOOK_RESYNC_THREADS)
         self.on_open()
+        self.notify_network()
         self.ready_event.set()
         while not self.exit.is_set():
-            self.process_next_order()
+            processed = self.process_order_batch()
+            self.check_feed_overruns()
+            if self.finish_resyncs() > 0 or processed > 0:
+                self.notify_network()
+            # in memory books update the network once per batch so bursts are coalesced
+            if self.order_book_manager.in_memory:
+                self.update_network_manager()
+            if self.cpu_usage.is_due():
+                self.log(LogType.info, self.cpu_usage.get_message())
+                if self.order_book_manager.in_memory:
+                    self.log(LogType.info, self.order_book_manager.get_edge_scheduler().get_message())
         # flush queues at close
         while not self.websocket_feed_queue.empty():
             self.websocket_feed_queue.get(block=False)
         self.on_close()
 
-    def process_next_order(self) -> Optional[Order]:
+    # wait up to PROCESS_QUEUE_TIMEOUT for the first order then drain the queue (up to a batch worth of orders)
+    # without blocking, flushing redis writes whenever the batch fills up or gets too old and once more at the end
+    def process_order_batch(self) -> int:
+        processed = 0
+        timeout = PROCESS_QUEUE_TIMEOUT
+        while processed < ORDER_BOOK_WRITE_MAX_BATCH_SIZE:
+            if self.process_next_order(timeout) is None and self.websocket_feed_queue.empty():
+                break
+            timeout = None
+            processed = processed + 1
+            if self.order_book_manager.is_write_batch_due():
+                self.flush_writes()
+        self.flush_writes()
+        return processed
+
+    # blocks for up to timeout seconds if given
+    def process_next_order(self, timeout: Optional[float] = None) -> Optional[Dict]:
         try:
-            next_order = self.websocket_feed_queue.get(block=False)
+            next_order = self.websocket_feed_queue.get(block=timeout is not None, timeout=timeout)
+            if next_order['type'] == ORDER_BOOK_RESYNC_MESSAGE:
+                self.log(LogType.error, 'Sequence gap on {} at {}, resyncing'.format(next_order['product_id'],
+                                                                                    next_order['sequence']))
+                self.start_resync(next_order['product_id'], int(next_order['sequence']))
+                return next_order
+            if next_order['type'] == ORDER_BOOK_HANDOFF_MESSAGE:
+                self.start_handoff(next_order['product_id'], int(next_order['sequence']))
+                return next_order
+            resync = self.resyncs.get(next_order['product_id'])
+            if resync is not None:
+                resync.add_message(next_order)
+                return next_order
             this_sequence = self.get_sequence_id(next_order['product_id'])
             next_sequence = int(next_order['sequence'])
             if next_sequence <= this_sequence:
@@ -47,6 +122,30 @@ class OrderBookProcessor(Process):
             self.on_error(e)
             return None
 
+    def replay_order(self, order: Dict) -> None:
+        try:
+            self.update_order_book(order)
+        except Exception as e:
+            self.on_error(e)
+
+    def flush_writes(self) -> None:
+        try:
+            self.order_book_manager.flush_writes()
+        except Exception as e:
+            self.on_error(e)
+
+    # books in memory are picked up by update_network_manager in this process instead
+    def notify_network(self) -> None:
+        if self.network_event is not None and not self.order_book_manager.in_memory:
+            self.network_event.set()
+
+    def update_network_manager(self) -> None:
+        try:
+            self.order_book_manager.update_network_manager()
+            self.order_book_manager.flush_mirror()
+        except Exception as e:
+            self.on_error(e)
+
     @staticmethod
     def map_trade_side_to_order_side(trade_side: str) -> OrderSide:
         if trade_side == 'sell':
@@ -56,57 +155,64 @@ class OrderBookProcessor(Process):
         else:
             raise Exception('Trade side {} not recognized'.format(trade_side))
 
+    def get_product_ids(self) -> List[str]:
+        if self.shard_map is None:
+            return self.product_manager.get_product_ids()
+        return self.shard_map.get_product_ids(self.shard)
+
     def get_sequence_id(self, product_id: str) -> int:
         return self.order_book_manager.get_order_book(product_id).get_sequence_id()
 
-    def get_change_order(self, order: Dict) -> Order:
-        product_id = order['product_id']
-        sequence_id = order['sequence']
+    # binary messages already carry the time in nanoseconds (see MessageCodec)
+    # messages cannot be from the future; the clock is only read again when one looks newer than the last reading,
+    # which is rare as messages are received after they were sent
+    def get_timestamp_ns(self, order: Union[Dict, FeedMessage]) -> int:
+        if isinstance(order, FeedMessage):
+            timestamp_ns = order.get_timestamp_ns()
+        else:
+            timestamp_ns = parse_timestamp_ns(order['time'])
+        if timestamp_ns > self.clock_ns:
+            self.clock_ns = now_ns()
+        return min(timestamp_ns, self.clock_ns)
+
+    # the price is turned into ticks here, once, and everything downstream works on the integer
+    # binary messages already carry ticks and size units (see MessageCodec)
+    def get_price_ticks(self, order: Union[Dict, FeedMessage]) -> int:
+        if isinstance(order, FeedMessage):
+            return order.get_price_ticks()
+        return self.product_manager.get_product(order['product_id']).price_to_ticks(order['price'])
+
+    # key is the field the size is in on a dict message (see MessageCodec.SIZE_FIELDS)
+    def get_size_units(self, order: Union[Dict, FeedMessage], key: str) -> int:
+        if isinstance(order, FeedMessage):
+            return order.get_old_size_units() if key == 'old_size' else order.get_size_units()
+        return size_to_units(order[key])
+
+    # messages become OrderEvents rather than Orders as this runs for every message (see OrderEvent)
+    def get_change_order(self, order: Union[Dict, FeedMessage]) -> OrderEvent:
         side = self.map_trade_side_to_order_side(order['side'])
-        price = order['price']
-        created_at = parser.parse(order['time'])
-        order_id = order['order_id']
-        old_size = order['old_size']
-        new_size = order['new_size']
-        order = Order(product_id, sequence_id, side, old_size, price, order_type=OrderType.change,
-                      created_at=created_at,
-                      order_id=order_id)
-        order.add_filled_size(new_size)
-        return order
-
-    def get_open_order(self, order: Dict) -> Order:
-        qty = order['remaining_size']
-        product_id = order['product_id']
-        sequence_id = order['sequence']
+        return OrderEvent(order['product_id'], order['sequence'], side, self.get_size_units(order, 'old_size'),
+                          self.get_price_ticks(order), self.get_timestamp_ns(order), order_type=OrderType.change,
+                          order_id=order['order_id'], filled_units=self.get_size_units(order, 'new_size'))
+
+    def get_open_order(self, order: Union[Dict, FeedMessage]) -> OrderEvent:
         side = self.map_trade_side_to_order_side(order['side'])
-        price = order['price']
-        created_at = parser.parse(order['time'])
-        order_id = order['order_id']
-        return Order(product_id, sequence_id, side, qty, price, created_at=created_at, order_id=order_id)
-
-    def get_done_order(self, order: Dict) -> Order:
-        qty = order['remaining_size']
-        product_id = order['product_id']
-        sequence_id = order['sequence']
+        return OrderEvent(order['product_id'], order['sequence'], side, self.get_size_units(order, 'remaining_size'),
+                          self.get_price_ticks(order), self.get_timestamp_ns(order), order_id=order['order_id'])
+
+    def get_done_order(self, order: Union[Dict, FeedMessage]) -> OrderEvent:
         order_type = OrderType.match if order['reason'] == 'filled' else OrderType.cancel
         order_status = OrderStatus.filled if order['reason'] == 'filled' else OrderStatus.canceled
         side = self.map_trade_side_to_order_side(order['side'])
-        price = order['price']
-        created_at = parser.parse(order['time'])
-        order_id = order['order_id']
-        return Order(product_id, sequence_id, side, qty, price, order_type=order_type, created_at=created_at,
-                     status=order_status, order_id=order_id)
-
-    def get_match_order(self, order: Dict) -> Order:
-        qty = order['size']
-        product_id = order['product_id']
-        sequence_id = order['sequence']
+        return OrderEvent(order['product_id'], order['sequence'], side, self.get_size_units(order, 'remaining_size'),
+                          self.get_price_ticks(order), self.get_timestamp_ns(order), order_type=order_type,
+                          status=order_status, order_id=order['order_id'])
+
+    def get_match_order(self, order: Union[Dict, FeedMessage]) -> OrderEvent:
         side = self.map_trade_side_to_order_side(order['side'])
-        price = order['price']
-        created_at = parser.parse(order['time'])
-        order_id = order['maker_order_id']
-        return Order(product_id, sequence_id, side, qty, price, order_type=OrderType.match, created_at=created_at,
-                     order_id=order_id)
+        return OrderEvent(order['product_id'], order['sequence'], side, self.get_size_units(order, 'size'),
+                          self.get_price_ticks(order), self.get_timestamp_ns(order), order_type=OrderType.match,
+                          order_id=order['maker_order_id'])
 
     def update_order_book(self, order) -> Optional[OrderBook]:
         if order['type'] == 'received':
@@ -124,34 +230,95 @@ class OrderBookProcessor(Process):
                 return None
             return self.order_book_manager - self.get_change_order(order)
 
+    # fetches a level 3 snapshot (and recent trades if asked for) from the exchange
+    def fetch_snapshot(self, product_id: str, include_trades: bool = False) -> OrderBookSnapshot:
+        product = self.product_manager.get_product(product_id)
+        orders = publicClient.getProductOrderBook(product=product_id, level=3)
+        historical_orders = publicClient.getProductTrades(product=product_id) if include_trades else []
+        return OrderBookSnapshot.from_gdax(product, orders, historical_orders)
+
+    def load_snapshot(self, snapshot: OrderBookSnapshot, product_id: str) -> None:
+        self.order_book_manager.get_order_book(product_id).load_snapshot(snapshot)
+        self.flush_writes()
+
+    # each book is loaded from one level 3 snapshot in bulk (see OrderBookSnapshot)
     def on_open(self) -> None:
         self.log(LogType.info, "-- Process Started! --")
-        for product_id in self.product_manager.get_product_ids():
-            order_book = self.order_book_manager.get_order_book(product_id)
-            orders = publicClient.getProductOrderBook(product=product_id, level=3)
-            sequence_id = orders['sequence']
-            for side in ['bids', 'asks']:
-                for raw_order in orders[side]:
-                    price = raw_order[0]
-                    qty = raw_order[1]
-                    order_id = raw_order[2]
-                    order = Order(product_id, sequence_id, OrderSide[side[:-1]], qty, price, order_id=order_id)
-                    order_book + order
-            historical_orders = publicClient.getProductTrades(product=product_id)
-            for historical_order in historical_orders:
-                price = historical_order['price']
-                qty = historical_order['size']
-                side = self.map_trade_side_to_order_side(historical_order['side'])
-                created_at = parser.parse(historical_order['time'])
-                order = Order(product_id, sequence_id, side, qty, price, historical=True, order_type=OrderType.match,
-                              created_at=created_at)
-                order_book + order
+        for product_id in self.get_product_ids():
+            start_time = time()
+            snapshot = self.fetch_snapshot(product_id, include_trades=True)
+            fetch_time = time()
+            self.load_snapshot(snapshot, product_id)
+            self.log(LogType.info, 'Loaded {}: {} orders at {} levels and {} trades in {:.3f}s '
+                                   '(fetch {:.3f}s, load {:.3f}s)'.format(product_id, snapshot.get_order_count(),
+                                                                         snapshot.get_level_count(),
+                                                                         snapshot.get_trade_count(),
+                                                                         time() - start_time, fetch_time - start_time,
+                                                                         time() - fetch_time))
+
+    # a gap during a resync means the buffer has a hole in it too so the resync starts over
+    def start_resync(self, product_id: str, gap_sequence_id: int, include_trades: bool = False) -> None:
+        self.resyncs[product_id] = OrderBookResync(product_id, gap_sequence_id, self.resync_executor,
+                                                   partial(self.fetch_snapshot, include_trades=include_trades))
+
+    # a product moved to this shard (see OrderBookShardMap) is resynced into a fresh book from the first
+    # message routed here; in memory books have no trade history for it so that comes with the snapshot
+    def start_handoff(self, product_id: str, sequence_id: int) -> None:
+        self.log(LogType.info, 'Taking over {} at {}'.format(product_id, sequence_id))
+        self.order_book_manager.reset_order_book(product_id)
+        self.start_resync(product_id, sequence_id, include_trades=self.order_book_manager.in_memory)
+
+    # messages a ring buffer reader was overrun by are lost for every product so every book is resynced
+    def check_feed_overruns(self) -> None:
+        if not isinstance(self.websocket_feed_queue, SharedRingBufferReader):
+            return
+        overruns = self.websocket_feed_queue.get_overruns()
+        if overruns == self.feed_overruns:
+            return
+        self.log(LogType.error, 'Overrun by {} websocket messages'.format(overruns - self.feed_overruns))
+        self.feed_overruns = overruns
+        for product_id in self.get_product_ids():
+            self.log(LogType.error, 'Resyncing {} from {}'.format(product_id, self.get_sequence_id(product_id) + 1))
+            self.start_resync(product_id, self.get_sequence_id(product_id) + 1)
+
+    # load every snapshot that has arrived and replay what was buffered while it was fetched
+    # trades are not reloaded as the book already has those from before the gap
+    # returns the number of books resynced
+    def finish_resyncs(self) -> int:
+        resynced = 0
+        for product_id, resync in list(self.resyncs.items()):
+            try:
+                snapshot = resync.get_snapshot()
+                if snapshot is None:
+                    continue
+                del self.resyncs[product_id]
+                self.load_snapshot(snapshot, product_id)
+                replay_messages = resync.get_replay_messages(snapshot)
+                for message in replay_messages:
+                    self.replay_order(message)
+                self.flush_writes()
+                resynced = resynced + 1
+                self.log(LogType.info, 'Resynced {} at {} after {} attempts, replayed {} of {} buffered '
+                                       'messages'.format(product_id, snapshot.get_sequence_id(),
+                                                         resync.get_attempts(), len(replay_messages),
+                                                         resync.get_buffer_size()))
+            except Exception as e:
+                self.on_error(e)
+        return resynced
 
     def on_error(self, e: Exception) -> None:
         self.log(LogType.error, traceback.format_exc())
         self.log(LogType.error, str(e))
 
     def on_close(self) -> None:
+        if self.resync_executor is not None:
+            self.resync_executor.shutdown(wait=False)
+        batcher = self.order_book_manager.get_batcher()
+        if batcher is not None:
+            self.log(LogType.info, 'Redis writes: {} mutations in {} flushes ({:.1f} per flush)'.format(
+                batcher.mutation_count, batcher.flush_count, batcher.get_mutations_per_flush()))
+        if self.order_book_manager.in_memory:
+            self.log(LogType.info, self.order_book_manager.get_edge_scheduler().get_message())
         self.log(LogType.info, "-- Process Terminated! --")
 
     def log(self, log_type: LogType, msg: str) -> None:
@@ -0,0 +1,60 @@
+from concurrent.futures import Executor
+from typing import Callable, Dict, List, Optional
+
+from trading_package.order_book.order_book_snapshot import OrderBookSnapshot
+
+
+class OrderBookResyncException(Exception):
+    pass
+
+
+# Rebuilds one product's book after a sequence gap while every other product keeps going.
+# Messages for the product are buffered from the gap onwards while a snapshot is fetched
+# in the background, then only those newer than the snapshot need replaying
+class OrderBookResync:
+    def __init__(self, product_id: str, gap_sequence_id: int, executor: Executor,
+                 fetch_snapshot: Callable[[str], OrderBookSnapshot]) -> None:
+        self.product_id = product_id
+        # the first sequence id after the gap
+        self.gap_sequence_id = gap_sequence_id
+        self.executor = executor
+        self.fetch_snapshot = fetch_snapshot
+        self.buffer = []
+        self.attempts = 0
+        self.future = None
+        self.start()
+
+    def get_product_id(self) -> str:
+        return self.product_id
+
+    def get_attempts(self) -> int:
+        return self.attempts
+
+    def get_buffer_size(self) -> int:
+        return len(self.buffer)
+
+    def start(self) -> None:
+        self.attempts = self.attempts + 1
+        self.future = self.executor.submit(self.fetch_snapshot, self.product_id)
+
+    def add_message(self, message: Dict) -> None:
+        self.buffer.append(message)
+
+    # returns the snapshot once one that reaches the gap has arrived
+    # a snapshot from before the gap (or a failed fetch) is fetched again
+    def get_snapshot(self) -> Optional[OrderBookSnapshot]:
+        if not self.future.done():
+            return None
+        try:
+            snapshot = self.future.result()
+        except Exception as e:
+            self.start()
+            raise OrderBookResyncException('Snapshot for {} failed: {}'.format(self.product_id, e))
+        if snapshot.get_sequence_id() < self.gap_sequence_id - 1:
+            self.start()
+            return None
+        return snapshot
+
+    # buffered messages the snapshot does not already include, oldest first
+    def get_replay_messages(self, snapshot: OrderBookSnapshot) -> List[Dict]:
+        return [message for message in self.buffer if int(message['sequence']) > snapshot.get_sequence_id()]
@@ -0,0 +1,87 @@
+from typing import List, Optional
+
+from redis import StrictRedis
+from redis.client import Script
+from redis.exceptions import ResponseError
+
+from trading_package.helper.enums import BookOperation
+
+# Every script takes the same keys and arguments so that a websocket message is applied
+# to its price level, flagged as a changed product and added to the trade history
+# atomically in one round trip
+# KEYS: order set, order hash, level size, changed products, trade history set, trade history size
+# ARGV: tick, order id, size units, new size units (change only), product id, timestamp, trade size,
+#       trade history lookback, oldest trade history timestamp to keep (see RedisTradeHistory)
+RECORD_TRADE = '''
+redis.call('SADD', KEYS[4], ARGV[5])
+redis.call('ZADD', KEYS[5], ARGV[6], KEYS[6])
+redis.call('INCRBYFLOAT', KEYS[6], ARGV[7])
+redis.call('EXPIRE', KEYS[6], ARGV[8])
+redis.call('ZREMRANGEBYSCORE', KEYS[5], '-inf', '(' .. ARGV[9])
+'''
+
+ADD_ORDER = '''
+redis.call('ZADD', KEYS[1], ARGV[1], KEYS[3])
+redis.call('HSET', KEYS[2], ARGV[2], ARGV[3])
+redis.call('INCRBY', KEYS[3], ARGV[3])
+''' + RECORD_TRADE
+
+REMOVE_ORDER = '''
+redis.call('HDEL', KEYS[2], ARGV[2])
+if redis.call('HLEN', KEYS[2]) == 0 then
+    redis.call('DEL', KEYS[2], KEYS[3])
+    redis.call('ZREM', KEYS[1], KEYS[3])
+else
+    redis.call('DECRBY', KEYS[3], ARGV[3])
+end
+''' + RECORD_TRADE
+
+CHANGE_ORDER = '''
+if redis.call('HEXISTS', KEYS[2], ARGV[2]) == 1 then
+    redis.call('HSET', KEYS[2], ARGV[2], ARGV[4])
+    redis.call('DECRBY', KEYS[3], ARGV[3])
+end
+''' + RECORD_TRADE
+
+MATCH_ORDER = '''
+redis.call('HINCRBY', KEYS[2], ARGV[2], '-' .. ARGV[3])
+redis.call('DECRBY', KEYS[3], ARGV[3])
+''' + RECORD_TRADE
+
+SCRIPT_SOURCES = {
+    BookOperation.add: ADD_ORDER,
+    BookOperation.remove: REMOVE_ORDER,
+    BookOperation.change: CHANGE_ORDER,
+    BookOperation.match: MATCH_ORDER,
+    BookOperation.record: RECORD_TRADE
+}
+
+
+class OrderBookScripts:
+    def __init__(self, redis_server: StrictRedis) -> None:
+        self.redis_server = redis_server
+        self.scripts = {operation: redis_server.register_script(source) for operation, source in
+                        SCRIPT_SOURCES.items()}
+
+    def get_script(self, operation: BookOperation) -> Script:
+        return self.scripts[operation]
+
+    # returns False if the server will not run lua scripts
+    def load(self) -> bool:
+        try:
+            for script in self.scripts.values():
+                script.sha = self.redis_server.script_load(script.script)
+        except ResponseError:
+            return False
+        return True
+
+    # with client set to a pipeline the script is only queued
+    def run(self, operation: BookOperation, keys: List[str], args: List[str], client=None) -> None:
+        self.scripts[operation](keys=keys, args=args, client=client)
+
+
+# returns None if the server will not run lua scripts so the caller can fall back
+# to issuing the commands itself
+def load_order_book_scripts(redis_server: StrictRedis) -> Optional[OrderBookScripts]:
+    scripts = OrderBookScripts(redis_server)
+    return scripts if scripts.load() else None
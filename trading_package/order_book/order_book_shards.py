@@ -0,0 +1,106 @@
+from multiprocessing.sharedctypes import RawArray
+from typing import Dict, List, Optional
+
+
+class OrderBookShardException(Exception):
+    pass
+
+
+# Which order book processor (shard) owns each product, shared between processes.
+# The websocket routes every message to the owning shard and counts messages per product
+# so the process manager can move products between shards to even out the load (see rebalance).
+# Products in pinned always stay on the shard they are pinned to
+class OrderBookShardMap:
+    def __init__(self, product_ids: List[str], shard_count: int, pinned: Optional[Dict[str, int]] = None) -> None:
+        if shard_count < 1:
+            raise OrderBookShardException('At least one shard is needed, got {}'.format(shard_count))
+        self.product_ids = sorted(product_ids)
+        self.product_indexes = {product_id: idx for idx, product_id in enumerate(self.product_ids)}
+        self.shard_count = shard_count
+        self.pinned = {} if pinned is None else dict(pinned)
+        for product_id, shard in self.pinned.items():
+            if product_id not in self.product_indexes or not 0 <= shard < shard_count:
+                raise OrderBookShardException('Cannot pin {} to shard {}'.format(product_id, shard))
+        # per product: owning shard and messages routed so far
+        self.shards = RawArray('i', len(self.product_ids))
+        self.message_counts = RawArray('q', len(self.product_ids))
+        # with no rates observed yet every product counts the same
+        self.assign(self.get_balanced_assignment({product_id: 1. for product_id in self.product_ids}))
+
+    def get_shard_count(self) -> int:
+        return self.shard_count
+
+    def get_shard(self, product_id: str) -> int:
+        return self.shards[self.product_indexes[product_id]]
+
+    # every product, or only those owned by shard
+    def get_product_ids(self, shard: Optional[int] = None) -> List[str]:
+        if shard is None:
+            return list(self.product_ids)
+        return [product_id for idx, product_id in enumerate(self.product_ids) if self.shards[idx] == shard]
+
+    def get_assignment(self) -> Dict[str, int]:
+        return {product_id: self.shards[idx] for idx, product_id in enumerate(self.product_ids)}
+
+    def assign(self, assignment: Dict[str, int]) -> None:
+        for product_id, shard in assignment.items():
+            if not 0 <= shard < self.shard_count:
+                raise OrderBookShardException('Shard {} out of range {}'.format(shard, self.shard_count))
+            self.shards[self.product_indexes[product_id]] = shard
+
+    # counts a message for the product and returns the shard it goes to
+    def add_message(self, product_id: str) -> int:
+        idx = self.product_indexes[product_id]
+        self.message_counts[idx] = self.message_counts[idx] + 1
+        return self.shards[idx]
+
+    def get_message_counts(self) -> Dict[str, int]:
+        return {product_id: self.message_counts[idx] for idx, product_id in enumerate(self.product_ids)}
+
+    # total rate of each shard
+    def get_loads(self, rates: Dict[str, float], assignment: Optional[Dict[str, int]] = None) -> List[float]:
+        assignment = self.get_assignment() if assignment is None else assignment
+        loads = [0.] * self.shard_count
+        for product_id, shard in assignment.items():
+            loads[shard] = loads[shard] + rates.get(product_id, 0.)
+        return loads
+
+    # busiest products first, each onto the least loaded shard, after the pinned ones
+    def get_balanced_assignment(self, rates: Dict[str, float]) -> Dict[str, int]:
+        assignment = dict(self.pinned)
+        loads = self.get_loads(rates, assignment)
+        unpinned = [product_id for product_id in self.product_ids if product_id not in self.pinned]
+        for product_id in sorted(unpinned, key=lambda product_id: (-rates.get(product_id, 0.), product_id)):
+            shard = loads.index(min(loads))
+            assignment[product_id] = shard
+            loads[shard] = loads[shard] + rates.get(product_id, 0.)
+        return assignment
+
+    # moving a product costs its new shard a snapshot so nothing moves unless the busiest shard is more than
+    # threshold times the average, and then products move one at a time from the busiest shard to the quietest
+    # for as long as that evens them out (the product moved being the one that leaves them closest)
+    # returns {product id: new shard} for the products that moved
+    def rebalance(self, rates: Dict[str, float], threshold: float) -> Dict[str, int]:
+        assignment = self.get_assignment()
+        loads = self.get_loads(rates, assignment)
+        mean_load = sum(loads) / self.shard_count
+        if mean_load <= 0 or max(loads) <= threshold * mean_load:
+            return {}
+        moved = {}
+        for _ in range(len(self.product_ids)):
+            busiest = loads.index(max(loads))
+            quietest = loads.index(min(loads))
+            gap = loads[busiest] - loads[quietest]
+            candidates = [product_id for product_id, shard in assignment.items() if
+                          shard == busiest and product_id not in self.pinned and 0 < rates.get(product_id, 0.) < gap]
+            if len(candidates) == 0:
+                break
+            product_id = min(candidates, key=lambda candidate: (abs(gap - 2 * rates[candidate]), candidate))
+            assignment[product_id] = quietest
+            loads[busiest] = loads[busiest] - rates[product_id]
+            loads[quietest] = loads[quietest] + rates[product_id]
+            moved[product_id] = quietest
+        current = self.get_assignment()
+        moved = {product_id: shard for product_id, shard in moved.items() if current[product_id] != shard}
+        self.assign(moved)
+        return moved
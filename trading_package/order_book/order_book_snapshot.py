@@ -0,0 +1,78 @@
+from typing import Dict, List, Tuple
+
+from numpy import array, argsort, add, flatnonzero, diff, rint, int64, float64, concatenate
+
+from trading_package.config.constants import SIZE_UNITS
+from trading_package.helper.enums import OrderSide
+from trading_package.helper.timestamps import NANOSECONDS, parse_timestamp_ns, now_ns
+from trading_package.portfolio.product import Product
+
+
+# a price level as (tick, total size, {order_id: size})
+Level = Tuple[int, int, Dict[str, int]]
+
+
+# A full level 3 snapshot of one product already aggregated into price levels
+# so it can be written to a store in one go (see OrderBook.load_snapshot)
+# rather than applied one order at a time
+class OrderBookSnapshot:
+    def __init__(self, sequence_id: int, levels: Dict[OrderSide, List[Level]],
+                 trades: Dict[OrderSide, List[Tuple[int, str]]]) -> None:
+        self.sequence_id = int(sequence_id)
+        self.levels = levels
+        self.trades = trades
+
+    def get_sequence_id(self) -> int:
+        return self.sequence_id
+
+    # levels are sorted by ascending tick
+    def get_levels(self, side: OrderSide) -> List[Level]:
+        return self.levels.get(side, [])
+
+    # [(unix timestamp, size)]
+    def get_trades(self, side: OrderSide) -> List[Tuple[int, str]]:
+        return self.trades.get(side, [])
+
+    def get_order_count(self) -> int:
+        return sum(len(orders) for side in OrderSide for _, _, orders in self.get_levels(side))
+
+    def get_level_count(self) -> int:
+        return sum(len(self.get_levels(side)) for side in OrderSide)
+
+    def get_trade_count(self) -> int:
+        return sum(len(self.get_trades(side)) for side in OrderSide)
+
+    # order_book is the response of getProductOrderBook(level=3) and trades that of getProductTrades
+    @staticmethod
+    def from_gdax(product: Product, order_book: Dict, trades: List[Dict]) -> 'OrderBookSnapshot':
+        levels = {side: aggregate_levels(product, order_book[side.name + 's']) for side in OrderSide}
+        now_time = now_ns()
+        sides = {'buy': OrderSide.bid, 'sell': OrderSide.ask}
+        trades_by_side = {side: [] for side in OrderSide}
+        for trade in trades:
+            # orders cannot be created in the future (see Order)
+            timestamp = min(now_time, parse_timestamp_ns(trade['time'])) // NANOSECONDS
+            trades_by_side[sides[trade['side']]].append((timestamp, trade['size']))
+        return OrderBookSnapshot(order_book['sequence'], levels, trades_by_side)
+
+
+# sums [[price, size, order_id]] into levels with numpy instead of one store write per order
+# ticks and units are rounded the same way as Product.price_to_ticks and size_to_units
+def aggregate_levels(product: Product, raw_orders: List[List[str]]) -> List[Level]:
+    if len(raw_orders) == 0:
+        return []
+    prices, sizes, order_ids = zip(*[raw_order[:3] for raw_order in raw_orders])
+    ticks = rint(array(prices, dtype=float64) * product.get_tick_divisor()).astype(int64)
+    units = rint(array(sizes, dtype=float64) * SIZE_UNITS).astype(int64)
+    # a stable sort keeps orders at the same price in the order the exchange queued them
+    order = argsort(ticks, kind='mergesort')
+    ticks = ticks[order]
+    units = units[order]
+    order_ids = [order_ids[idx] for idx in order.tolist()]
+    starts = concatenate(([0], flatnonzero(diff(ticks)) + 1))
+    level_ticks = ticks[starts].tolist()
+    level_sizes = add.reduceat(units, starts).tolist()
+    ends = starts.tolist()[1:] + [len(ticks)]
+    units = units.tolist()
+    return [(tick, size, dict(zip(order_ids[start:end], units[start:end])))
+            for tick, size, start, end in zip(level_ticks, level_sizes, starts.tolist(), ends)]
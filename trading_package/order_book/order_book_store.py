@@ -0,0 +1,339 @@
+from typing import List, Optional, Set, Tuple
+
+from redis import StrictRedis
+
+from trading_package.helper.enums import OrderSide, BookOperation
+from trading_package.order_book.order_book_scripts import load_order_book_scripts
+from trading_package.order_book.price_ladder import PriceLadder
+from trading_package.order_book.redis_write_batcher import RedisWriteBatcher
+
+
+class OrderBookStoreException(Exception):
+    pass
+
+
+# An order book store holds the price levels of a single product.
+# Prices are integer ticks of the product's quote increment and sizes integer size units
+# (see Product.price_to_ticks and fixed_point) so no strings or floats are handled here
+class OrderBookStore:
+    def add_order(self, side: OrderSide, tick: int, order_id: str, size: int) -> None:
+        raise OrderBookStoreException('Not Implemented')
+
+    def remove_order(self, side: OrderSide, tick: int, order_id: str, size: int) -> None:
+        raise OrderBookStoreException('Not Implemented')
+
+    # new_size is what is left on the order and size_delta how much it shrank by
+    def change_order(self, side: OrderSide, tick: int, order_id: str, new_size: int, size_delta: int) -> None:
+        raise OrderBookStoreException('Not Implemented')
+
+    def match_order(self, side: OrderSide, tick: int, order_id: str, size: int) -> None:
+        raise OrderBookStoreException('Not Implemented')
+
+    # returns [(tick, size at tick)] starting at the start-th best level
+    def get_levels(self, side: OrderSide, start: int, count: int) -> List[Tuple[int, Optional[int]]]:
+        raise OrderBookStoreException('Not Implemented')
+
+    # (best tick, worst tick, notional, total size, excess size above depth, size at worst tick)
+    # for filling depth from the top of the book, notional being the sum of tick * size
+    # by default this walks the levels a page at a time until depth is reached
+    def get_depth(self, side: OrderSide, depth: int) -> Tuple[int, int, int, int, int, int]:
+        notional = 0
+        total_qty = 0
+        best_tick = None
+        worst_tick = None
+        excess_qty = 0
+        worst_qty = 0
+        counter = 0
+        iter_count = 10
+        keep_going = True
+        while keep_going:
+            levels = self.get_levels(side, counter, iter_count)
+            if len(levels) == 0:
+                break
+            for tick, size in levels:
+                if best_tick is None:
+                    best_tick = tick
+                worst_tick = tick
+                if size is None:
+                    continue
+                qty = min(size, depth - total_qty)
+                excess_qty = size - qty
+                worst_qty = size
+
+                notional = notional + (tick * qty)
+                total_qty = total_qty + qty
+                if total_qty >= depth:
+                    keep_going = False
+                    break
+
+            counter = counter + iter_count
+        return best_tick, worst_tick, notional, total_qty, excess_qty, worst_qty
+
+    # replace every level on a side with levels [(tick, size, {order_id: size})] sorted by tick
+    def load_levels(self, side: OrderSide, levels: List[Tuple[int, int, dict]]) -> None:
+        raise OrderBookStoreException('Not Implemented')
+
+    def register_change(self, side: OrderSide) -> None:
+        raise OrderBookStoreException('Not Implemented')
+
+    # sides changed since the last call, stores that do not keep track report every side
+    def pop_changed_sides(self) -> Set[OrderSide]:
+        return set(OrderSide)
+
+    # stores that can apply a whole message (level, changed product and trade history) in one go
+    def uses_scripts(self) -> bool:
+        return False
+
+    def flush(self) -> None:
+        pass
+
+
+class RedisOrderBookStore(OrderBookStore):
+    # writes are sent straight to redis unless a batcher is given in which case
+    # they are queued on its pipeline until the batcher is flushed
+    # use_scripts applies each message with a single lua script (see order_book_scripts)
+    # and falls back to plain commands if the server does not support them
+    # The order ids at each level are also kept here so removes and changes know what is at a level without
+    # reading it back, which would flush the batcher on every message. This store is taken to be the only
+    # writer of its product's levels, starting from an empty book or one given to load_levels
+    def __init__(self, product_id: str, redis_server: Optional[StrictRedis] = None,
+                 batcher: Optional[RedisWriteBatcher] = None, use_scripts: bool = False) -> None:
+        self.product_id = product_id
+        self.redis_server = redis_server or StrictRedis(host='localhost', port=6379, db=0, encoding="utf-8",
+                                                        decode_responses=True)
+        self.batcher = batcher
+        self.scripts = load_order_book_scripts(self.redis_server) if use_scripts else None
+        # (side, tick) => order ids at that level
+        self.level_orders = {}
+
+    def get_root_key(self, side: OrderSide) -> str:
+        return 'order_book:book:{}:{}'.format(self.product_id, side.name)
+
+    # this key points to a hash of order_id => size
+    def get_order_hash_key(self, side: OrderSide, tick: int) -> str:
+        return '{}:{}:order_list'.format(self.get_root_key(side), tick)
+
+    # this key points to the sum of orders at this price
+    def get_sum_size_key(self, side: OrderSide, tick: int) -> str:
+        return '{}:{}:order_size_sum'.format(self.get_root_key(side), tick)
+
+    # this key points to a set with price keys and score of tick to facilitate getting a range
+    def get_order_set_key(self, side: OrderSide) -> str:
+        return '{}'.format(self.get_root_key(side))
+
+    @staticmethod
+    def get_changed_products_key(side: OrderSide) -> str:
+        return 'order_book:changed_products:{}'.format(side.name)
+
+    def __get_writer(self):
+        return self.redis_server if self.batcher is None else self.batcher.get_pipeline()
+
+    def flush_pending(self) -> None:
+        if self.batcher is not None:
+            self.batcher.flush()
+
+    def add_order(self, side: OrderSide, tick: int, order_id: str, size: int) -> None:
+        self.level_orders.setdefault((side, tick), set()).add(order_id)
+        writer = self.__get_writer()
+        # This marks that we have live orders at this price
+        writer.zadd(self.get_order_set_key(side), tick, self.get_sum_size_key(side, tick))
+        # This adds the order to a list of orders keyed off price
+        writer.hset(self.get_order_hash_key(side, tick), order_id, size)
+        writer.incrby(self.get_sum_size_key(side, tick), size)
+
+    def remove_order(self, side: OrderSide, tick: int, order_id: str, size: int) -> None:
+        order_key = self.get_order_hash_key(side, tick)
+        size_key = self.get_sum_size_key(side, tick)
+        orders = self.level_orders.get((side, tick), set())
+        orders.discard(order_id)
+        writer = self.__get_writer()
+        if len(orders) == 0:
+            self.level_orders.pop((side, tick), None)
+            # why bother deleting here?
+            writer.delete(order_key)
+            writer.delete(size_key)
+            writer.zrem(self.get_order_set_key(side), size_key)
+        else:
+            writer.hdel(order_key, order_id)
+            writer.decr(size_key, size)
+
+    def change_order(self, side: OrderSide, tick: int, order_id: str, new_size: int, size_delta: int) -> None:
+        if order_id in self.level_orders.get((side, tick), ()):
+            writer = self.__get_writer()
+            writer.hset(self.get_order_hash_key(side, tick), order_id, new_size)
+            writer.decr(self.get_sum_size_key(side, tick), size_delta)
+
+    def match_order(self, side: OrderSide, tick: int, order_id: str, size: int) -> None:
+        writer = self.__get_writer()
+        writer.hincrby(self.get_order_hash_key(side, tick), order_id, -size)
+        writer.decr(self.get_sum_size_key(side, tick), size)
+
+    def get_levels(self, side: OrderSide, start: int, count: int) -> List[Tuple[int, Optional[int]]]:
+        self.flush_pending()
+        reverse_order_sort = True if side is OrderSide.bid else False
+        price_keys = self.redis_server.zrange(self.get_order_set_key(side), start, start + count - 1,
+                                              withscores=True, desc=reverse_order_sort, score_cast_func=int)
+        if len(price_keys) == 0:
+            return []
+        sizes = self.redis_server.mget(map(lambda x: x[0], price_keys))
+        return [(tick, None if sizes[idx] is None else int(sizes[idx])) for idx, (_, tick) in
+                enumerate(price_keys)]
+
+    def uses_scripts(self) -> bool:
+        return self.scripts is not None
+
+    # size is what the level changes by and new_size what is left on the order after a change
+    # history_keys and history_args come from RedisTradeHistory
+    def run_script(self, operation: BookOperation, side: OrderSide, tick: int, order_id: str, size: int,
+                   new_size: int, history_keys: Tuple[str, str], history_args: List) -> None:
+        keys = [self.get_order_set_key(side), self.get_order_hash_key(side, tick), self.get_sum_size_key(side, tick),
+                self.get_changed_products_key(side), history_keys[0], history_keys[1]]
+        args = [tick, order_id, size, new_size, self.product_id] + history_args
+        client = None if self.batcher is None else self.batcher.get_pipeline()
+        self.scripts.run(operation, keys, args, client)
+
+    def register_change(self, side: OrderSide) -> None:
+        self.__get_writer().sadd(self.get_changed_products_key(side), self.product_id)
+
+    # overwrite whole levels in one go; a size of None removes the level
+    # levels are [(side, tick, size, {order_id: size})]
+    def write_levels(self, levels: List[Tuple[OrderSide, int, Optional[int], dict]]) -> None:
+        pipe = self.redis_server.pipeline(transaction=False) if self.batcher is None else self.batcher.add_mutation()
+        for side, tick, size, orders in levels:
+            self.__write_level(pipe, side, tick, size, orders)
+        if self.batcher is None:
+            pipe.execute()
+
+    # the old levels are dropped and the new ones written in a single transaction
+    # so readers never see a half loaded side
+    def load_levels(self, side: OrderSide, levels: List[Tuple[int, int, dict]]) -> None:
+        self.flush_pending()
+        set_key = self.get_order_set_key(side)
+        old_levels = self.redis_server.zrange(set_key, 0, -1, withscores=True, score_cast_func=int)
+        pipe = self.redis_server.pipeline(transaction=True)
+        for _, tick in old_levels:
+            pipe.delete(self.get_order_hash_key(side, tick), self.get_sum_size_key(side, tick))
+        pipe.delete(set_key)
+        scores = []
+        for tick, size, orders in levels:
+            size_key = self.get_sum_size_key(side, tick)
+            pipe.set(size_key, size)
+            if orders:
+                pipe.hmset(self.get_order_hash_key(side, tick), orders)
+            scores.extend([tick, size_key])
+        if scores:
+            pipe.zadd(set_key, *scores)
+        pipe.execute()
+        self.level_orders = {key: orders for key, orders in self.level_orders.items() if key[0] != side}
+        for tick, size, orders in levels:
+            if orders:
+                self.level_orders[(side, tick)] = set(orders)
+
+    def __write_level(self, pipe, side: OrderSide, tick: int, size: Optional[int], orders: dict) -> None:
+        if size is None or not orders:
+            self.level_orders.pop((side, tick), None)
+        else:
+            self.level_orders[(side, tick)] = set(orders)
+        order_key = self.get_order_hash_key(side, tick)
+        size_key = self.get_sum_size_key(side, tick)
+        pipe.delete(order_key)
+        if size is None:
+            pipe.delete(size_key)
+            pipe.zrem(self.get_order_set_key(side), size_key)
+        else:
+            pipe.zadd(self.get_order_set_key(side), tick, size_key)
+            pipe.set(size_key, size)
+            if orders:
+                pipe.hmset(order_key, orders)
+
+
+# Keeps the book in process memory. Redis is only written to as a mirror
+# for other readers and is brought up to date when flush is called
+# Depth queries are answered from each ladder's depth index without walking the levels
+class LadderOrderBookStore(OrderBookStore):
+    def __init__(self, product_id: str, mirror: Optional[RedisOrderBookStore] = None) -> None:
+        self.product_id = product_id
+        self.ladders = {side: PriceLadder(side) for side in OrderSide}
+        self.mirror = mirror
+        self.dirty_levels = set()
+        self.changed_sides = set()
+
+    def get_ladder(self, side: OrderSide) -> PriceLadder:
+        return self.ladders[side]
+
+    def __mark_dirty(self, side: OrderSide, tick: int) -> None:
+        if self.mirror is not None:
+            self.dirty_levels.add((side, tick))
+
+    def add_order(self, side: OrderSide, tick: int, order_id: str, size: int) -> None:
+        ladder = self.ladders[side]
+        level = ladder.get_or_create_level(tick)
+        level.orders[order_id] = size
+        ladder.add_size(level, size)
+        self.__mark_dirty(side, tick)
+
+    def remove_order(self, side: OrderSide, tick: int, order_id: str, size: int) -> None:
+        ladder = self.ladders[side]
+        level = ladder.get_level(tick)
+        if level is None:
+            return
+        level.orders.pop(order_id, None)
+        if level.is_empty():
+            ladder.remove_level(tick)
+        else:
+            ladder.add_size(level, -size)
+        self.__mark_dirty(side, tick)
+
+    def change_order(self, side: OrderSide, tick: int, order_id: str, new_size: int, size_delta: int) -> None:
+        ladder = self.ladders[side]
+        level = ladder.get_level(tick)
+        if level is None or order_id not in level.orders:
+            return
+        level.orders[order_id] = new_size
+        ladder.add_size(level, -size_delta)
+        self.__mark_dirty(side, tick)
+
+    def match_order(self, side: OrderSide, tick: int, order_id: str, size: int) -> None:
+        ladder = self.ladders[side]
+        level = ladder.get_level(tick)
+        if level is None:
+            return
+        level.orders[order_id] = level.orders.get(order_id, 0) - size
+        ladder.add_size(level, -size)
+        self.__mark_dirty(side, tick)
+
+    def load_levels(self, side: OrderSide, levels: List[Tuple[int, int, dict]]) -> None:
+        self.ladders[side].load_levels(levels)
+        if self.mirror is not None:
+            self.dirty_levels = {(dirty_side, tick) for dirty_side, tick in self.dirty_levels if dirty_side != side}
+            self.mirror.load_levels(side, levels)
+
+    def get_levels(self, side: OrderSide, start: int, count: int) -> List[Tuple[int, Optional[int]]]:
+        return [(level.tick, level.size) for level in self.ladders[side].get_levels(start, count)]
+
+    def get_depth(self, side: OrderSide, depth: int) -> Tuple[int, int, int, int, int, int]:
+        result = self.ladders[side].get_depth(depth)
+        if result is None:
+            return OrderBookStore.get_depth(self, side, depth)
+        return result
+
+    def register_change(self, side: OrderSide) -> None:
+        self.changed_sides.add(side)
+
+    def pop_changed_sides(self) -> Set[OrderSide]:
+        changed_sides = self.changed_sides
+        self.changed_sides = set()
+        return changed_sides
+
+    def flush(self) -> None:
+        if self.mirror is None or not self.dirty_levels:
+            return
+        levels = []
+        for side, tick in self.dirty_levels:
+            level = self.ladders[side].get_level(tick)
+            if level is None:
+                levels.append((side, tick, None, {}))
+            else:
+                levels.append((side, tick, level.size, level.orders))
+        self.mirror.write_levels(levels)
+        self.dirty_levels = set()
@@ -0,0 +1,78 @@
+from trading_package.helper.enums import *
+from trading_package.helper.fixed_point import units_to_str
+from trading_package.helper.timestamps import NANOSECONDS
+
+
+# A websocket message as the order book needs it.
+# This is the hot path so unlike Order there is no per instance dict, no datetime
+# and the price and sizes come in already as ticks and size units so nothing is parsed again downstream
+class OrderEvent:
+    __slots__ = ['product_id', 'sequence_id', 'order_side', 'size_units', 'filled_units', 'price_ticks',
+                 'order_type', 'status', 'order_id', 'timestamp_ns', 'historical']
+
+    # timestamp_ns is the exchange's time in epoch nanoseconds, already clamped to now by whoever read the message
+    # (see OrderBookProcessor.get_timestamp_ns) so no clock is read per event
+    def __init__(self, product_id: str, sequence_id: int, order_side: OrderSide, size_units: int, price_ticks: int,
+                 timestamp_ns: int, order_type: OrderType = OrderType.limit, status: OrderStatus = OrderStatus.open,
+                 order_id: str = None, filled_units: int = 0, historical: bool = False) -> None:
+        self.product_id = product_id
+        self.sequence_id = int(sequence_id)
+        self.order_side = order_side
+        self.size_units = size_units
+        self.filled_units = filled_units
+        self.price_ticks = price_ticks
+        self.order_type = order_type
+        self.status = status
+        self.order_id = order_id
+        self.timestamp_ns = timestamp_ns
+        self.historical = historical
+
+    def get_product_id(self) -> str:
+        return self.product_id
+
+    def get_sequence_id(self) -> int:
+        return self.sequence_id
+
+    def get_order_side(self) -> OrderSide:
+        return self.order_side
+
+    # only the trade history still wants the size as a string
+    def get_size(self) -> str:
+        return units_to_str(self.size_units)
+
+    def get_size_units(self) -> int:
+        return self.size_units
+
+    def get_filled_units(self) -> int:
+        return self.filled_units
+
+    def get_remaining_units(self) -> int:
+        return self.size_units - self.filled_units
+
+    def get_price_ticks(self) -> int:
+        return self.price_ticks
+
+    def get_order_type(self) -> OrderType:
+        return self.order_type
+
+    def get_status(self) -> OrderStatus:
+        return self.status
+
+    def get_order_id(self) -> str:
+        return self.order_id
+
+    def get_timestamp_ns(self) -> int:
+        return self.timestamp_ns
+
+    def get_unix_timestamp(self) -> int:
+        return self.timestamp_ns // NANOSECONDS
+
+    def get_historical(self) -> bool:
+        return self.historical
+
+    def __str__(self) -> str:
+        return '{}-{}-{}-{}-{}-{}'.format(self.product_id, self.get_size(), self.order_side, self.price_ticks,
+                                          self.order_type, self.status)
+
+    def __repr__(self) -> str:
+        return self.__str__()
@@ -0,0 +1,139 @@
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+from trading_package.helper.enums import OrderSide
+from trading_package.order_book.depth_index import DepthIndex
+
+
+# prices are integer ticks and sizes integer size units (see Product.price_to_ticks and fixed_point)
+class PriceLevel:
+    def __init__(self, tick: int) -> None:
+        self.tick = tick
+        self.size = 0
+        # order_id => size
+        self.orders = {}
+
+    def get_tick(self) -> int:
+        return self.tick
+
+    def get_size(self) -> int:
+        return self.size
+
+    def get_orders(self) -> Dict[str, int]:
+        return self.orders
+
+    def is_empty(self) -> bool:
+        return len(self.orders) == 0
+
+
+# one side of the order book
+# ticks are kept in an ascending array (so both ends of the book are cheap to reach)
+# and each tick points to a level holding the orders at that price
+# level sizes are also summed in a depth index so depth queries do not have to walk the levels
+class PriceLadder:
+    def __init__(self, side: OrderSide) -> None:
+        self.side = side
+        self.ticks = []
+        self.levels = {}
+        self.index = DepthIndex()
+
+    def get_side(self) -> OrderSide:
+        return self.side
+
+    # position of a tick in the depth index, the best possible price is 1
+    def __get_index_position(self, tick: int) -> int:
+        if self.side == OrderSide.bid:
+            return self.index.get_capacity() - tick
+        return tick + 1
+
+    def __get_index_tick(self, position: int) -> int:
+        if self.side == OrderSide.bid:
+            return self.index.get_capacity() - position
+        return position - 1
+
+    def get_level(self, tick: int) -> Optional[PriceLevel]:
+        return self.levels.get(tick)
+
+    def get_or_create_level(self, tick: int) -> PriceLevel:
+        level = self.levels.get(tick)
+        if level is None:
+            level = PriceLevel(tick)
+            self.levels[tick] = level
+            self.ticks.insert(bisect_left(self.ticks, tick), tick)
+        return level
+
+    def add_size(self, level: PriceLevel, size: int) -> None:
+        level.size = level.size + size
+        self.index.add(self.__get_index_position(level.tick), size, size * level.tick)
+
+    def remove_level(self, tick: int) -> None:
+        level = self.levels.pop(tick, None)
+        if level is not None:
+            del self.ticks[bisect_left(self.ticks, tick)]
+            self.index.add(self.__get_index_position(tick), -level.size, -level.size * tick)
+
+    # levels are returned best price first
+    def get_levels(self, start: int, count: int) -> List[PriceLevel]:
+        if self.side == OrderSide.bid:
+            end = len(self.ticks) - start
+            if end <= 0:
+                return []
+            return [self.levels[tick] for tick in reversed(self.ticks[max(end - count, 0):end])]
+        return [self.levels[tick] for tick in self.ticks[start:start + count]]
+
+    def get_best_level(self) -> Optional[PriceLevel]:
+        levels = self.get_levels(0, 1)
+        return levels[0] if levels else None
+
+    def get_worst_level(self) -> Optional[PriceLevel]:
+        if not self.ticks:
+            return None
+        return self.levels[self.ticks[0] if self.side == OrderSide.bid else self.ticks[-1]]
+
+    # (best tick, worst tick, notional, total size, excess size above depth, size at worst tick)
+    # for filling depth from the top of the book, in O(log n)
+    # returns None while any level size is negative as the index cannot be searched then
+    def get_depth(self, depth: int) -> Optional[Tuple[int, int, int, int, int, int]]:
+        best_level = self.get_best_level()
+        if best_level is None:
+            return None, None, 0, 0, 0, 0
+        if self.index.has_negative_points():
+            return None
+        if depth <= 0:
+            level, size_before, notional_before = best_level, 0, 0
+            qty = 0
+        else:
+            position, size_before, notional_before = self.index.search(depth)
+            if position > self.index.get_capacity():
+                level = self.get_worst_level()
+                qty = level.size
+                size_before = self.index.get_total_size() - qty
+                notional_before = self.index.get_total_notional() - qty * level.tick
+            else:
+                level = self.levels.get(self.__get_index_tick(position))
+                if level is None:
+                    return None
+                qty = depth - size_before
+        return (best_level.tick, level.tick, notional_before + qty * level.tick, size_before + qty,
+                level.size - qty, level.size)
+
+    # replace the whole side with levels [(tick, size, {order_id: size})] sorted by tick
+    def load_levels(self, levels: List[Tuple[int, int, Dict[str, int]]]) -> None:
+        self.clear()
+        points = {}
+        for tick, size, orders in levels:
+            level = PriceLevel(tick)
+            level.size = size
+            level.orders = dict(orders)
+            self.levels[tick] = level
+            self.ticks.append(tick)
+            points[self.__get_index_position(tick)] = (size, size * tick)
+        self.index.load(points)
+
+    def clear(self) -> None:
+        self.ticks = []
+        self.levels = {}
+        self.index.clear()
+
+    def __len__(self) -> int:
+        return len(self.ticks)
@@ -0,0 +1,54 @@
+from time import time
+from typing import List
+
+from redis import StrictRedis
+from redis.client import BasePipeline
+
+
+# Collects order book writes into a single pipeline so that a burst of websocket
+# messages costs one round trip to redis instead of several per message.
+# Writes are flushed once max_batch_size mutations are pending or the oldest
+# pending mutation is older than max_delay seconds (whichever comes first)
+class RedisWriteBatcher:
+    def __init__(self, redis_server: StrictRedis, max_batch_size: int = 500, max_delay: float = 0.002,
+                 transaction: bool = False) -> None:
+        self.redis_server = redis_server
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.pipe = redis_server.pipeline(transaction=transaction)
+        self.pending_mutations = 0
+        self.first_pending_time = None
+        self.mutation_count = 0
+        self.flush_count = 0
+
+    def get_pipeline(self) -> BasePipeline:
+        return self.pipe
+
+    # call once per logical mutation (not per redis command)
+    def add_mutation(self) -> BasePipeline:
+        if self.first_pending_time is None:
+            self.first_pending_time = time()
+        self.pending_mutations = self.pending_mutations + 1
+        self.mutation_count = self.mutation_count + 1
+        return self.pipe
+
+    def get_pending_mutations(self) -> int:
+        return self.pending_mutations
+
+    def is_due(self) -> bool:
+        if self.pending_mutations >= self.max_batch_size:
+            return True
+        return self.first_pending_time is not None and time() - self.first_pending_time >= self.max_delay
+
+    # returns the results of every command that was pending
+    def flush(self) -> List:
+        if len(self.pipe) == 0:
+            return []
+        results = self.pipe.execute()
+        self.pending_mutations = 0
+        self.first_pending_time = None
+        self.flush_count = self.flush_count + 1
+        return results
+
+    def get_mutations_per_flush(self) -> float:
+        return self.mutation_count / self.flush_count if self.flush_count else 0.
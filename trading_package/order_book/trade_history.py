@@ -0,0 +1,194 @@
+from bisect import bisect_left, bisect_right, insort
+from typing import List, Optional, Tuple
+
+from redis import StrictRedis
+
+from trading_package.helper.enums import OrderSide, OrderType
+from trading_package.helper.fixed_point import size_to_units
+from trading_package.order_book.redis_write_batcher import RedisWriteBatcher
+from trading_package.order_book.trade_statistics import RollingTradeStatistics
+
+
+class TradeHistoryException(Exception):
+    pass
+
+
+# Trade sizes summed into one second buckets per side and order type.
+# Only the lookback seconds up to the newest trade are ever needed so anything older is dropped
+# which keeps memory bounded by the window rather than by uptime
+class TradeHistory:
+    def add_trade(self, side: OrderSide, order_type: OrderType, timestamp: int, size: str) -> None:
+        raise TradeHistoryException('Not Implemented')
+
+    # trades are [(timestamp, size)]
+    def add_trades(self, side: OrderSide, order_type: OrderType, trades: List[Tuple[int, str]]) -> None:
+        for timestamp, size in trades:
+            self.add_trade(side, order_type, timestamp, size)
+
+    # returns [(timestamp, size)] oldest first for start_time <= timestamp <= end_time
+    def get_trades(self, side: OrderSide, order_type: OrderType, start_time: float,
+                   end_time: float) -> List[Tuple[int, float]]:
+        raise TradeHistoryException('Not Implemented')
+
+    # rolling statistics for the seconds_ago up to now if they are kept for that window
+    def get_statistics(self, side: OrderSide, order_type: OrderType, seconds_ago: int,
+                       now_time: float) -> Optional[RollingTradeStatistics]:
+        return None
+
+
+# one side and order type of an in memory trade history
+# timestamps are kept sorted so the window can be trimmed and sliced with a bisect
+# trades nearly always arrive in order so adding is an append
+class TradeWindow:
+    def __init__(self, lookback: int) -> None:
+        self.lookback = lookback
+        self.timestamps = []
+        # timestamp => size
+        self.sizes = {}
+        self.latest = None
+
+    def add(self, timestamp: int, size: float) -> None:
+        if self.latest is not None and timestamp < self.latest - self.lookback:
+            return
+        if timestamp in self.sizes:
+            self.sizes[timestamp] = self.sizes[timestamp] + size
+            return
+        self.sizes[timestamp] = size
+        if not self.timestamps or timestamp > self.timestamps[-1]:
+            self.timestamps.append(timestamp)
+        else:
+            insort(self.timestamps, timestamp)
+        if self.latest is None or timestamp > self.latest:
+            self.latest = timestamp
+            self.evict(timestamp - self.lookback)
+
+    # drop every bucket older than cutoff
+    def evict(self, cutoff: float) -> None:
+        end = bisect_left(self.timestamps, cutoff)
+        if end == 0:
+            return
+        for timestamp in self.timestamps[:end]:
+            del self.sizes[timestamp]
+        del self.timestamps[:end]
+
+    def get_trades(self, start_time: float, end_time: float) -> List[Tuple[int, float]]:
+        start = bisect_left(self.timestamps, start_time)
+        end = bisect_right(self.timestamps, end_time)
+        return [(timestamp, self.sizes[timestamp]) for timestamp in self.timestamps[start:end]]
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+
+# also keeps rolling statistics over the whole lookback as trades are added
+class MemoryTradeHistory(TradeHistory):
+    def __init__(self, lookback: int) -> None:
+        self.lookback = lookback
+        self.windows = {}
+        self.statistics = {}
+
+    def get_window(self, side: OrderSide, order_type: OrderType) -> TradeWindow:
+        window = self.windows.get((side, order_type))
+        if window is None:
+            window = TradeWindow(self.lookback)
+            self.windows[(side, order_type)] = window
+        return window
+
+    def __get_rolling_statistics(self, side: OrderSide, order_type: OrderType) -> RollingTradeStatistics:
+        statistics = self.statistics.get((side, order_type))
+        if statistics is None:
+            statistics = RollingTradeStatistics(self.lookback)
+            self.statistics[(side, order_type)] = statistics
+        return statistics
+
+    def add_trade(self, side: OrderSide, order_type: OrderType, timestamp: int, size: str) -> None:
+        window = self.get_window(side, order_type)
+        window.add(timestamp, float(size))
+        statistics = self.__get_rolling_statistics(side, order_type)
+        statistics.add(timestamp, size_to_units(size))
+        statistics.expire(window.latest - self.lookback)
+
+    def get_trades(self, side: OrderSide, order_type: OrderType, start_time: float,
+                   end_time: float) -> List[Tuple[int, float]]:
+        return self.get_window(side, order_type).get_trades(start_time, end_time)
+
+    def get_statistics(self, side: OrderSide, order_type: OrderType, seconds_ago: int,
+                       now_time: float) -> Optional[RollingTradeStatistics]:
+        if seconds_ago != self.lookback:
+            return None
+        statistics = self.__get_rolling_statistics(side, order_type)
+        statistics.expire(now_time - self.lookback)
+        return statistics
+
+
+# Each bucket is a string key holding the size traded in that second and a sorted set
+# scores the bucket keys by timestamp.
+# Bucket keys expire after lookback seconds and every write trims the sorted set of
+# buckets older than the lookback so neither grows without bound
+class RedisTradeHistory(TradeHistory):
+    def __init__(self, product_id: str, lookback: int, redis_server: Optional[StrictRedis] = None,
+                 batcher: Optional[RedisWriteBatcher] = None) -> None:
+        self.product_id = product_id
+        self.lookback = lookback
+        self.redis_server = redis_server or StrictRedis(host='localhost', port=6379, db=0, encoding="utf-8",
+                                                        decode_responses=True)
+        self.batcher = batcher
+        # (side, order type) => newest timestamp written
+        self.latest = {}
+
+    # redis key for trade history
+    def get_set_key(self, side: OrderSide, order_type: OrderType) -> str:
+        return 'order_book:history:trades:{}:{}:{}'.format(self.product_id, side.name, order_type.name)
+
+    # redis key for trade history
+    def get_size_key(self, side: OrderSide, order_type: OrderType, timestamp: int) -> str:
+        return '{}:{}'.format(self.get_set_key(side, order_type), timestamp)
+
+    def get_keys(self, side: OrderSide, order_type: OrderType, timestamp: int) -> Tuple[str, str]:
+        return self.get_set_key(side, order_type), self.get_size_key(side, order_type, timestamp)
+
+    # returns the oldest timestamp still inside the window once timestamp is added
+    def __get_cutoff(self, side: OrderSide, order_type: OrderType, timestamp: int) -> int:
+        latest = max(self.latest.get((side, order_type), timestamp), timestamp)
+        self.latest[(side, order_type)] = latest
+        return latest - self.lookback
+
+    # arguments for the lua scripts that record a trade (see order_book_scripts)
+    def get_script_args(self, side: OrderSide, order_type: OrderType, timestamp: int, size: str) -> List:
+        return [timestamp, size, self.lookback, self.__get_cutoff(side, order_type, timestamp)]
+
+    def add_trade(self, side: OrderSide, order_type: OrderType, timestamp: int, size: str) -> None:
+        writer = self.redis_server if self.batcher is None else self.batcher.get_pipeline()
+        self.__write_trade(writer, side, order_type, timestamp, size)
+
+    # every trade goes out on one pipeline
+    def add_trades(self, side: OrderSide, order_type: OrderType, trades: List[Tuple[int, str]]) -> None:
+        writer = self.redis_server.pipeline(transaction=False) if self.batcher is None else \
+            self.batcher.get_pipeline()
+        for timestamp, size in trades:
+            self.__write_trade(writer, side, order_type, timestamp, size)
+        if self.batcher is None:
+            writer.execute()
+
+    def __write_trade(self, writer, side: OrderSide, order_type: OrderType, timestamp: int, size: str) -> None:
+        cutoff = self.__get_cutoff(side, order_type, timestamp)
+        if timestamp < cutoff:
+            return
+        set_key, size_key = self.get_keys(side, order_type, timestamp)
+        writer.zadd(set_key, timestamp, size_key)
+        writer.incrbyfloat(size_key, size)
+        writer.expire(size_key, self.lookback)
+        writer.zremrangebyscore(set_key, '-inf', '({}'.format(cutoff))
+
+    def get_trades(self, side: OrderSide, order_type: OrderType, start_time: float,
+                   end_time: float) -> List[Tuple[int, float]]:
+        if self.batcher is not None:
+            self.batcher.flush()
+        # this gets all relevant keys
+        size_key_by_timestamp = self.redis_server.zrangebyscore(self.get_set_key(side, order_type), start_time,
+                                                                end_time, withscores=True)
+        if len(size_key_by_timestamp) == 0:
+            return []
+        sizes = self.redis_server.mget(map(lambda x: x[0], size_key_by_timestamp))
+        return [(int(timestamp), float(sizes[idx])) for idx, (_, timestamp) in enumerate(size_key_by_timestamp)
+                if sizes[idx] is not None]
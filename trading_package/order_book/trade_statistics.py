@@ -0,0 +1,168 @@
+from bisect import bisect_left, insort
+from heapq import heappush, heappop, heapify
+from typing import Optional
+
+from trading_package.helper.fixed_point import units_to_size
+
+
+# Rolling statistics over one second trade buckets (the same buckets get_trade_quantities
+# groups trades into) that are updated as each trade comes in rather than recomputed
+# from the whole window on every read.
+# Sizes are integer size units so sums stay exact and equal buckets compare equal for the mode.
+# Every update is O(log n) and every read O(1)
+class RollingTradeStatistics:
+    # rebuild the heaps once this many more entries are waiting to be deleted than are live
+    COMPACT_SLACK = 1024
+
+    def __init__(self, lookback: int) -> None:
+        self.lookback = lookback
+        # timestamp => size traded in that second
+        self.buckets = {}
+        self.timestamps = []
+        self.total = 0
+        # the lower half of the buckets as a max heap (negated) and the upper half as a min heap
+        # removed sizes stay in the heaps until they reach the top (see __prune)
+        self.low = []
+        self.high = []
+        self.low_size = 0
+        self.high_size = 0
+        self.delayed = {}
+        # size => number of buckets of that size and number of buckets => sizes
+        self.counts = {}
+        self.sizes_by_count = {}
+        self.max_count = 0
+
+    def get_lookback(self) -> int:
+        return self.lookback
+
+    def get_count(self) -> int:
+        return len(self.buckets)
+
+    def add(self, timestamp: int, size: int) -> None:
+        old_size = self.buckets.get(timestamp)
+        if old_size is None:
+            if self.timestamps and timestamp < self.timestamps[-1]:
+                insort(self.timestamps, timestamp)
+            else:
+                self.timestamps.append(timestamp)
+            new_size = size
+        else:
+            # out of buckets first as removing its old size can rebuild the heaps from buckets (see __compact)
+            del self.buckets[timestamp]
+            self.__remove_size(old_size)
+            new_size = old_size + size
+        self.buckets[timestamp] = new_size
+        self.__add_size(new_size)
+
+    # drop every bucket older than cutoff
+    def expire(self, cutoff: float) -> None:
+        end = bisect_left(self.timestamps, cutoff)
+        if end == 0:
+            return
+        for timestamp in self.timestamps[:end]:
+            self.__remove_size(self.buckets.pop(timestamp))
+        del self.timestamps[:end]
+
+    def get_volume(self) -> float:
+        return units_to_size(self.total)
+
+    def get_mean(self) -> Optional[float]:
+        if not self.buckets:
+            return None
+        return units_to_size(self.total) / len(self.buckets)
+
+    def get_median(self) -> Optional[float]:
+        if not self.buckets:
+            return None
+        if self.low_size > self.high_size:
+            return units_to_size(-self.low[0])
+        return units_to_size(-self.low[0] + self.high[0]) / 2
+
+    # None if there is no single most common size (as statistics.mode used to raise)
+    def get_mode(self) -> Optional[float]:
+        if self.max_count == 0:
+            return None
+        sizes = self.sizes_by_count[self.max_count]
+        if len(sizes) != 1:
+            return None
+        return units_to_size(next(iter(sizes)))
+
+    def __add_size(self, size: int) -> None:
+        self.total = self.total + size
+        if not self.low or size <= -self.low[0]:
+            heappush(self.low, -size)
+            self.low_size = self.low_size + 1
+        else:
+            heappush(self.high, size)
+            self.high_size = self.high_size + 1
+        self.__rebalance()
+        self.__change_count(size, 1)
+
+    def __remove_size(self, size: int) -> None:
+        self.total = self.total - size
+        self.delayed[size] = self.delayed.get(size, 0) + 1
+        if size <= -self.low[0]:
+            self.low_size = self.low_size - 1
+            if size == -self.low[0]:
+                self.__prune(self.low, -1)
+        else:
+            self.high_size = self.high_size - 1
+            if self.high and size == self.high[0]:
+                self.__prune(self.high, 1)
+        self.__rebalance()
+        self.__change_count(size, -1)
+        if len(self.low) + len(self.high) > self.low_size + self.high_size + self.COMPACT_SLACK:
+            self.__compact()
+
+    # pop deleted sizes off the top of a heap; sign is -1 for the max heap
+    def __prune(self, heap: list, sign: int) -> None:
+        while heap:
+            size = heap[0] * sign
+            count = self.delayed.get(size)
+            if not count:
+                return
+            if count == 1:
+                del self.delayed[size]
+            else:
+                self.delayed[size] = count - 1
+            heappop(heap)
+
+    # keep the low half the same size as the high half or one bigger
+    def __rebalance(self) -> None:
+        if self.low_size > self.high_size + 1:
+            heappush(self.high, -heappop(self.low))
+            self.low_size = self.low_size - 1
+            self.high_size = self.high_size + 1
+            self.__prune(self.low, -1)
+        elif self.low_size < self.high_size:
+            heappush(self.low, -heappop(self.high))
+            self.low_size = self.low_size + 1
+            self.high_size = self.high_size - 1
+            self.__prune(self.high, 1)
+
+    def __compact(self) -> None:
+        sizes = sorted(self.buckets.values())
+        self.low_size = (len(sizes) + 1) // 2
+        self.high_size = len(sizes) - self.low_size
+        self.low = [-size for size in sizes[:self.low_size]]
+        self.high = sizes[self.low_size:]
+        heapify(self.low)
+        heapify(self.high)
+        self.delayed = {}
+
+    def __change_count(self, size: int, change: int) -> None:
+        count = self.counts.get(size, 0)
+        if count:
+            sizes = self.sizes_by_count[count]
+            sizes.discard(size)
+            if not sizes:
+                del self.sizes_by_count[count]
+                if count == self.max_count and change < 0:
+                    self.max_count = count - 1
+        count = count + change
+        if count:
+            self.counts[size] = count
+            self.sizes_by_count.setdefault(count, set()).add(size)
+            self.max_count = max(self.max_count, count)
+        else:
+            del self.counts[size]
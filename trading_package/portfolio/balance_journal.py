@@ -0,0 +1,133 @@
+import os
+from threading import Event, Lock, Thread
+from time import time
+from typing import Dict, Optional
+
+from redis import StrictRedis
+from redis.exceptions import RedisError
+
+
+# Write-behind journal for the portfolio's balance writes so the portfolio never waits on redis.
+# Writes are kept in memory, the latest value per key (and per history entry) replacing any earlier one
+# not yet written, and a background thread writes them every flush_interval seconds in one pipeline
+# per database. A crash loses at most flush_interval seconds of balances; with sync every write goes
+# straight to redis instead, as before. Anything not yet written is written by close.
+# The thread is started by the first write so it runs in the process that writes (not the one that forked it)
+class BalanceJournal:
+    def __init__(self, redis_server: StrictRedis, persistent_redis_server: StrictRedis,
+                 flush_interval: float = 0.5, sync: bool = False) -> None:
+        self.redis_server = redis_server
+        self.persistent_redis_server = persistent_redis_server
+        self.flush_interval = flush_interval
+        self.sync = sync
+        self.lock = Lock()
+        # key => value, key => {member: score}
+        self.pending_values = {}
+        self.pending_history = {}
+        self.first_pending_time = None
+        self.stop_event = Event()
+        self.thread = None
+        self.pid = None
+        self.stats = {'writes': 0, 'coalesced': 0, 'flushed': 0, 'flushes': 0, 'errors': 0, 'lag': 0.,
+                      'max_lag': 0.}
+
+    def set(self, key: str, value) -> None:
+        if self.sync:
+            self.redis_server.set(key, value)
+            return
+        with self.lock:
+            self.__add_write(key in self.pending_values)
+            self.pending_values[key] = value
+        self.__ensure_thread()
+
+    # a balance history entry, member is the balance and score its unix time
+    def add_history(self, key: str, score: str, member) -> None:
+        if self.sync:
+            self.persistent_redis_server.zadd(key, score, member)
+            return
+        with self.lock:
+            history = self.pending_history.setdefault(key, {})
+            self.__add_write(member in history)
+            history[member] = score
+        self.__ensure_thread()
+
+    def __add_write(self, coalesced: bool) -> None:
+        self.stats['writes'] = self.stats['writes'] + 1
+        if coalesced:
+            self.stats['coalesced'] = self.stats['coalesced'] + 1
+        if self.first_pending_time is None:
+            self.first_pending_time = time()
+
+    def __ensure_thread(self) -> None:
+        if self.thread is not None and self.pid == os.getpid():
+            return
+        self.pid = os.getpid()
+        self.stop_event.clear()
+        self.thread = Thread(target=self.__run, name='BalanceJournal', daemon=True)
+        self.thread.start()
+
+    def __run(self) -> None:
+        while not self.stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def get_pending(self) -> int:
+        with self.lock:
+            return len(self.pending_values) + sum(len(history) for history in self.pending_history.values())
+
+    # writes everything pending, returns the number of writes made
+    # if redis fails they are put back to be tried again unless newer values came in meanwhile
+    def flush(self) -> int:
+        with self.lock:
+            values, history, first_pending_time = self.pending_values, self.pending_history, self.first_pending_time
+            self.pending_values, self.pending_history, self.first_pending_time = {}, {}, None
+        if first_pending_time is None:
+            return 0
+        try:
+            pipe = self.redis_server.pipeline(transaction=False)
+            for key, value in values.items():
+                pipe.set(key, value)
+            pipe.execute()
+            pipe = self.persistent_redis_server.pipeline(transaction=False)
+            for key, scores in history.items():
+                for member, score in scores.items():
+                    pipe.zadd(key, score, member)
+            pipe.execute()
+        except RedisError:
+            with self.lock:
+                self.stats['errors'] = self.stats['errors'] + 1
+                for key, value in values.items():
+                    self.pending_values.setdefault(key, value)
+                for key, scores in history.items():
+                    for member, score in scores.items():
+                        self.pending_history.setdefault(key, {}).setdefault(member, score)
+                self.first_pending_time = first_pending_time if self.first_pending_time is None else \
+                    min(first_pending_time, self.first_pending_time)
+            return 0
+        flushed = len(values) + sum(len(scores) for scores in history.values())
+        lag = time() - first_pending_time
+        with self.lock:
+            self.stats['flushed'] = self.stats['flushed'] + flushed
+            self.stats['flushes'] = self.stats['flushes'] + 1
+            self.stats['lag'] = self.stats['lag'] + lag
+            self.stats['max_lag'] = max(self.stats['max_lag'], lag)
+        return flushed
+
+    # lag is how long the oldest write of each flush waited for it
+    def get_stats(self) -> Dict[str, float]:
+        with self.lock:
+            return dict(self.stats)
+
+    def get_message(self) -> str:
+        stats = self.get_stats()
+        return 'Balance journal: {} writes ({} coalesced) in {} flushes, lag {:.3f}s on average (max {:.3f}s), ' \
+               '{} errors'.format(stats['writes'], stats['coalesced'], stats['flushes'],
+                                  stats['lag'] / stats['flushes'] if stats['flushes'] > 0 else 0.,
+                                  stats['max_lag'], stats['errors'])
+
+    # stops the thread and writes whatever is left
+    def close(self, timeout: Optional[float] = None) -> int:
+        self.stop_event.set()
+        if self.thread is not None and self.pid == os.getpid():
+            self.thread.join(timeout)
+        self.thread = None
+        return self.flush()
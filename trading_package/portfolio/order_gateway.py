@@ -0,0 +1,115 @@
+import base64
+import hashlib
+import hmac
+import json
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from time import time
+from typing import Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import AuthBase
+
+from trading_package.helper.enums import OrderSide
+from trading_package.order_book.order import Order
+from trading_package.portfolio.product import ProductManager
+
+
+# signs requests the way the exchange's authenticated endpoints expect
+class GdaxAuth(AuthBase):
+    def __init__(self, key: str, b64_secret: str, passphrase: str) -> None:
+        self.key = key
+        self.secret = base64.b64decode(b64_secret)
+        self.passphrase = passphrase
+
+    def get_signature(self, timestamp: str, method: str, path: str, body: str) -> str:
+        message = (timestamp + method + path + body).encode('utf-8')
+        return base64.b64encode(hmac.new(self.secret, message, hashlib.sha256).digest()).decode('utf-8')
+
+    def __call__(self, request):
+        timestamp = str(time())
+        body = request.body or ''
+        if isinstance(body, bytes):
+            body = body.decode('utf-8')
+        request.headers.update({
+            'CB-ACCESS-SIGN': self.get_signature(timestamp, request.method, request.path_url, body),
+            'CB-ACCESS-TIMESTAMP': timestamp,
+            'CB-ACCESS-KEY': self.key,
+            'CB-ACCESS-PASSPHRASE': self.passphrase,
+            'Content-Type': 'application/json'
+        })
+        return request
+
+
+# Places and cancels orders on a pool of threads so that independent requests go out together and
+# whoever submits them never waits on the exchange. Each thread keeps its own session, and with it
+# a kept alive connection, so a request does not pay for a new TLS handshake.
+# Every call returns a Future of the exchange's json response; requests that fail raise from the future
+# Prices are sent as the exact string of their product's tick when the product is known
+class OrderGateway:
+    def __init__(self, url: str, key: str, b64_secret: str, passphrase: str, max_workers: int = 4,
+                 timeout: float = 5., product_manager: Optional[ProductManager] = None) -> None:
+        self.url = url.rstrip('/')
+        self.product_manager = product_manager
+        self.auth = GdaxAuth(key, b64_secret, passphrase)
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='OrderGateway')
+        self.sessions = threading.local()
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'errors': 0, 'latency': 0., 'max_latency': 0.}
+
+    def __get_session(self) -> requests.Session:
+        session = getattr(self.sessions, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.auth = self.auth
+            session.mount(self.url, HTTPAdapter(pool_connections=1, pool_maxsize=1))
+            self.sessions.session = session
+        return session
+
+    def __request(self, method: str, path: str, params: Dict = None) -> Dict:
+        start = time()
+        try:
+            body = None if params is None else json.dumps(params)
+            response = self.__get_session().request(method, self.url + path, data=body, timeout=self.timeout)
+            result = response.json()
+        except Exception:
+            with self.lock:
+                self.stats['errors'] = self.stats['errors'] + 1
+            raise
+        finally:
+            latency = time() - start
+            with self.lock:
+                self.stats['requests'] = self.stats['requests'] + 1
+                self.stats['latency'] = self.stats['latency'] + latency
+                self.stats['max_latency'] = max(self.stats['max_latency'], latency)
+        return result
+
+    def place_order(self, order: Order) -> Future:
+        params = order.get_gdax_order_params()
+        params['side'] = 'buy' if order.get_order_side() is OrderSide.bid else 'sell'
+        product = None if self.product_manager is None else self.product_manager.get_product(order.get_product_id())
+        if product is not None:
+            params['price'] = product.price_to_str(order.get_price())
+        return self.executor.submit(self.__request, 'POST', '/orders', params)
+
+    # all sent at once
+    def place_orders(self, orders: List[Order]) -> List[Future]:
+        return [self.place_order(order) for order in orders]
+
+    def cancel_order(self, order_id: str) -> Future:
+        return self.executor.submit(self.__request, 'DELETE', '/orders/{}'.format(order_id))
+
+    def get_stats(self) -> Dict[str, float]:
+        with self.lock:
+            return dict(self.stats)
+
+    def get_message(self) -> str:
+        stats = self.get_stats()
+        return 'Order gateway: {} requests, {} errors, latency {:.3f}s on average (max {:.3f}s)'.format(
+            stats['requests'], stats['errors'], stats['latency'] / stats['requests'] if stats['requests'] > 0 else 0.,
+            stats['max_latency'])
+
+    def close(self, wait: bool = True) -> None:
+        self.executor.shutdown(wait=wait)
@@ -9,6 +9,8 @@ from trading_package.config.constants import *
 from trading_package.helper.enums import Currency, OrderStatus
 from trading_package.order_book.order import Order
 from trading_package.order_book.order_book import OrderBookManager
+from trading_package.portfolio.balance_journal import BalanceJournal
+from trading_package.portfolio.portfolio_limits_cache import PortfolioLimitsCache
 from trading_package.portfolio.portfolio_order_book import PortfolioOrderBook
 
 
@@ -17,9 +19,11 @@ class PortfolioException(Exception):
 
 
 class Portfolio:
+    # without a limits cache the fractions set in redis are read from it every time
     def __init__(self, currency: Currency, qty: str = 0, min_fraction: Optional[str] = None,
-                 max_fraction: Optional[str] = None) -> None:
+                 max_fraction: Optional[str] = None, limits_cache: Optional[PortfolioLimitsCache] = None) -> None:
         self.persistent_redis_server = StrictRedis(host='localhost', port=6379, db=1)
+        self.limits_cache = limits_cache
         self.currency = currency
         self.qty = Decimal(qty)
 
@@ -36,10 +40,16 @@ class Portfolio:
         self.max_fraction = Decimal(self.max_fraction)
 
     def get_max_fraction(self) -> Decimal:
+        if self.limits_cache is not None:
+            fraction = self.limits_cache.get_max_fraction(self.get_currency())
+            return self.max_fraction if fraction is None else fraction
         redis_fraction = self.persistent_redis_server.get('portfolio:max_fraction:{}'.format(self.get_currency().name))
         return Decimal(redis_fraction) if redis_fraction else self.max_fraction
 
     def get_min_fraction(self) -> Decimal:
+        if self.limits_cache is not None:
+            fraction = self.limits_cache.get_min_fraction(self.get_currency())
+            return self.min_fraction if fraction is None else fraction
         redis_fraction = self.persistent_redis_server.get('portfolio:min_fraction:{}'.format(self.get_currency().name))
         return Decimal(redis_fraction) if redis_fraction else self.min_fraction
 
@@ -82,9 +92,15 @@ class BasePortfolioGroup:
         self.redis_server = StrictRedis(host='localhost', port=6379, db=0)
         # persistent db is not cleared
         self.persistent_redis_server = StrictRedis(host='localhost', port=6379, db=1)
+        # balances are written to both behind the portfolio's back (see BalanceJournal)
+        self.journal = BalanceJournal(self.redis_server, self.persistent_redis_server,
+                                      PORTFOLIO_JOURNAL_FLUSH_INTERVAL, PORTFOLIO_JOURNAL_SYNC)
         # this is just the portfolio order book (my orders)
         self.order_book = order_book
-        self.portfolios = {currency: Portfolio(currency) for currency in self.order_book.get_currencies()}
+        # limits are read once and kept current by notifications from redis
+        self.limits_cache = PortfolioLimitsCache(self.persistent_redis_server, self.order_book.get_currencies())
+        self.portfolios = {currency: Portfolio(currency, limits_cache=self.limits_cache) for currency in
+                           self.order_book.get_currencies()}
         # this is the actual order book
         self.order_book_manager = OrderBookManager(self.order_book.product_manager)
 
@@ -96,7 +112,7 @@ class BasePortfolioGroup:
         hold_qty = self.order_book.get_hold_qty(currency)
 
         available_qty = total_qty - hold_qty
-        self.redis_server.set('portfolio:available:{}'.format(currency.name), available_qty)
+        self.journal.set('portfolio:available:{}'.format(currency.name), available_qty)
         return available_qty
 
     def get_balances(self) -> Dict[Currency, Decimal]:
@@ -163,19 +179,25 @@ class BasePortfolioGroup:
     def __add__(self, other_portfolio: Portfolio) -> Decimal:
         portfolio = self.get_portfolio_from_currency(other_portfolio.get_currency())
         portfolio + other_portfolio
-        self.redis_server.set('portfolio:balance:{}'.format(portfolio.get_currency().name), portfolio.get_qty())
-        self.persistent_redis_server.zadd('portfolio:balance:{}'.format(portfolio.get_currency().name),
-                                          datetime.now(tz.tzutc()).strftime('%s'), portfolio.get_qty())
+        self.record_balance(portfolio)
         return portfolio.get_qty()
 
     def __sub__(self, other_portfolio: Portfolio) -> Decimal:
         portfolio = self.get_portfolio_from_currency(other_portfolio.get_currency())
         portfolio - other_portfolio
-        self.redis_server.set('portfolio:balance:{}'.format(portfolio.get_currency().name), portfolio.get_qty())
-        self.persistent_redis_server.zadd('portfolio:balance:{}'.format(portfolio.get_currency().name),
-                                          datetime.now(tz.tzutc()).strftime('%s'), portfolio.get_qty())
+        self.record_balance(portfolio)
         return portfolio.get_qty()
 
+    def record_balance(self, portfolio: Portfolio) -> None:
+        balance_key = 'portfolio:balance:{}'.format(portfolio.get_currency().name)
+        self.journal.set(balance_key, portfolio.get_qty())
+        self.journal.add_history(balance_key, datetime.now(tz.tzutc()).strftime('%s'), portfolio.get_qty())
+
+    # writes any balances not yet written
+    def close(self) -> None:
+        self.journal.close()
+        self.limits_cache.close()
+
     def __str__(self) -> str:
         portfolio_strings = []
         for currency, portfolio in self.portfolios.items():
@@ -0,0 +1,175 @@
+import os
+from decimal import Decimal
+from threading import Event, Lock, Thread
+from time import time, sleep
+from typing import Dict, Iterable, Optional
+
+from redis import StrictRedis
+from redis.exceptions import RedisError, ResponseError
+
+from trading_package.config.constants import PORTFOLIO_LIMITS_CHANNEL, PORTFOLIO_LIMITS_RELOAD_INTERVAL
+from trading_package.helper.enums import Currency
+
+
+# The portfolio's min and max fractions (portfolio:min_fraction:* and portfolio:max_fraction:* in the
+# persistent db) held in memory so looking one up is a dictionary read.
+# A background thread keeps them current: redis keyspace notifications tell it when an operator sets or
+# deletes one of the keys, a key name or 'all' published on PORTFOLIO_LIMITS_CHANNEL does the same where they
+# are not switched on, and everything is read again every reload_interval seconds in case a notification was
+# missed. Keyspace notifications are a server wide setting so they are only used if the server already has
+# them on (see enable_keyspace_notifications, called by the process manager at startup).
+# The thread is started by the first lookup so it runs in the process doing the lookups
+class PortfolioLimitsCache:
+    MIN_FRACTION = 'min_fraction'
+    MAX_FRACTION = 'max_fraction'
+    # keyspace events for the keys and string and generic commands (set, del, expire...)
+    KEYSPACE_EVENTS = 'K$gx'
+    RELOAD_ALL = 'all'
+
+    def __init__(self, redis_server: StrictRedis, currencies: Iterable[Currency],
+                 reload_interval: float = PORTFOLIO_LIMITS_RELOAD_INTERVAL) -> None:
+        self.redis_server = redis_server
+        self.reload_interval = reload_interval
+        self.keys = sorted(self.get_key(kind, currency) for kind in [self.MIN_FRACTION, self.MAX_FRACTION] for
+                           currency in currencies)
+        # key => fraction or None if not set
+        self.fractions = {}
+        self.last_reload_time = 0.
+        self.stop_event = Event()
+        self.thread = None
+        self.pid = None
+        self.keyspace_notifications = None
+        # lookups are only counted by the thread looking up, everything else by the background thread under lock
+        self.lookups = 0
+        self.lock = Lock()
+        self.stats = {'notifications': 0, 'reloads': 0, 'errors': 0}
+        self.reload()
+
+    @staticmethod
+    def get_key(kind: str, currency: Currency) -> str:
+        return 'portfolio:{}:{}'.format(kind, currency.name)
+
+    def reload(self) -> None:
+        values = self.redis_server.mget(self.keys)
+        self.fractions = {key: self.__parse(value) for key, value in zip(self.keys, values)}
+        self.last_reload_time = time()
+        self.__add_stat('reloads')
+
+    def refresh(self, key: str) -> None:
+        if key == self.RELOAD_ALL:
+            self.reload()
+        elif key in self.fractions:
+            self.fractions[key] = self.__parse(self.redis_server.get(key))
+
+    @staticmethod
+    def __parse(value) -> Optional[Decimal]:
+        if value is None:
+            return None
+        return Decimal(value.decode('utf-8') if isinstance(value, bytes) else value)
+
+    def get_fraction(self, kind: str, currency: Currency) -> Optional[Decimal]:
+        self.__ensure_thread()
+        self.lookups = self.lookups + 1
+        return self.fractions.get(self.get_key(kind, currency))
+
+    def get_min_fraction(self, currency: Currency) -> Optional[Decimal]:
+        return self.get_fraction(self.MIN_FRACTION, currency)
+
+    def get_max_fraction(self, currency: Currency) -> Optional[Decimal]:
+        return self.get_fraction(self.MAX_FRACTION, currency)
+
+    # how an operator changes a limit where keyspace notifications are not available
+    def set_fraction(self, kind: str, currency: Currency, fraction: str) -> None:
+        key = self.get_key(kind, currency)
+        self.redis_server.set(key, fraction)
+        self.redis_server.publish(PORTFOLIO_LIMITS_CHANNEL, key)
+
+    def __add_stat(self, name: str) -> None:
+        with self.lock:
+            self.stats[name] = self.stats[name] + 1
+
+    def get_stats(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.stats, lookups=self.lookups)
+
+    def __ensure_thread(self) -> None:
+        if self.thread is not None and self.pid == os.getpid():
+            return
+        self.pid = os.getpid()
+        self.stop_event.clear()
+        self.thread = Thread(target=self.__run, name='PortfolioLimitsCache', daemon=True)
+        self.thread.start()
+
+    # switches on the keyspace notifications the cache listens for, adding to whatever the server already has
+    # this changes the server for every client so it is a setup step rather than something lookups do
+    # returns whether they are on
+    @classmethod
+    def enable_keyspace_notifications(cls, redis_server: StrictRedis) -> bool:
+        try:
+            events = redis_server.config_get('notify-keyspace-events').get('notify-keyspace-events', '')
+            missing = cls.get_missing_events(events)
+            if len(missing) > 0:
+                redis_server.config_set('notify-keyspace-events', events + ''.join(missing))
+        except ResponseError:
+            return False
+        return True
+
+    @classmethod
+    def keyspace_notifications_enabled(cls, redis_server: StrictRedis) -> bool:
+        try:
+            events = redis_server.config_get('notify-keyspace-events').get('notify-keyspace-events', '')
+        except ResponseError:
+            return False
+        return len(cls.get_missing_events(events)) == 0
+
+    # A stands for every kind of command
+    @classmethod
+    def get_missing_events(cls, events: str) -> str:
+        return ''.join(event for event in cls.KEYSPACE_EVENTS if event not in events and
+                       not (event != 'K' and 'A' in events))
+
+    def __subscribe(self):
+        pubsub = self.redis_server.pubsub(ignore_subscribe_messages=True)
+        self.keyspace_notifications = self.keyspace_notifications_enabled(self.redis_server)
+        if self.keyspace_notifications:
+            db = self.redis_server.connection_pool.connection_kwargs.get('db', 0)
+            pubsub.psubscribe('__keyspace@{}__:portfolio:*_fraction:*'.format(db))
+        pubsub.subscribe(PORTFOLIO_LIMITS_CHANNEL)
+        # anything changed before the subscription started is picked up here
+        self.reload()
+        return pubsub
+
+    def __run(self) -> None:
+        pubsub = None
+        while not self.stop_event.is_set():
+            try:
+                if pubsub is None:
+                    pubsub = self.__subscribe()
+                message = pubsub.get_message(timeout=0.1)
+                if message is not None:
+                    self.__handle(message)
+                if time() - self.last_reload_time >= self.reload_interval:
+                    self.reload()
+            except RedisError:
+                self.__add_stat('errors')
+                pubsub = None
+                sleep(0.1)
+        if pubsub is not None:
+            pubsub.close()
+
+    def __handle(self, message: Dict) -> None:
+        channel = message['channel']
+        channel = channel.decode('utf-8') if isinstance(channel, bytes) else channel
+        self.__add_stat('notifications')
+        if message['type'] == 'pmessage':
+            # __keyspace@<db>__:<key>
+            self.refresh(channel.split('__:', 1)[1])
+        elif message['type'] == 'message':
+            data = message['data']
+            self.refresh(data.decode('utf-8') if isinstance(data, bytes) else data)
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        self.stop_event.set()
+        if self.thread is not None and self.pid == os.getpid():
+            self.thread.join(timeout)
+        self.thread = None
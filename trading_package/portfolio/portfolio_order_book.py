@@ -24,10 +24,21 @@ class PortfolioOrderBookException(Exception):
     pass
 
 
+# Orders are indexed by id and the open orders' holds and edge quantities are kept as running totals,
+# updated whenever an order is added, removed, matched or changes status, so none of the queries
+# the strategy makes every loop have to go through the open orders.
+# Orders must only be changed through the book for the totals to stay right
 class PortfolioOrderBook:
     def __init__(self, product_manager: ProductManager) -> None:
         self.orders = {status: {} for status in OrderStatus}
         self.product_manager = product_manager
+        # order id => (status, order)
+        self.order_index = {}
+        # open orders only: source currency => remaining qty in that currency
+        self.hold_qties = {}
+        # currency set => remaining product qty, (source, destination) => number of orders
+        self.edge_qties = {}
+        self.edge_order_counts = {}
 
     def get_product_manager(self) -> ProductManager:
         return self.product_manager
@@ -57,59 +68,72 @@ class PortfolioOrderBook:
         return order_ids
 
     def get_order_and_status_by_id(self, order_id: str) -> Tuple[Order, OrderStatus]:
-        order = None
-        order_status = None
-        for status, orders_by_id in self.orders.items():
-            if order_id in orders_by_id:
-                order = orders_by_id[order_id]
-                order_status = status
-                break
+        order_status, order = self.order_index.get(order_id, (None, None))
         return order, order_status
 
     def update_order_status(self, order_id: str, status: OrderStatus) -> Order:
         order, order_status = self.get_order_and_status_by_id(order_id)
-        self.orders[order_status].pop(order.get_order_id())
+        self.__remove(order_id)
         order.update_status(status)
-        self.orders[status][order_id] = order
+        self.__insert(order)
         return order
 
+    # adds (sign 1) or takes away (sign -1) what an order in the open orders counts for in the running totals
+    # status is the one it is held under, which the order's own can run ahead of (see cancel_order in
+    # PortfolioProcessor)
+    def __track(self, order: Order, status: OrderStatus, sign: int) -> None:
+        if status != OrderStatus.open:
+            return
+        product = self.product_manager.get_product(order.get_product_id())
+        side = order.get_order_side()
+        source_currency = product.get_source_currency(side)
+        edge = (source_currency, product.get_destination_currency(side))
+        currency_set = frozenset(product.get_currency_set())
+        remaining_size = order.get_remaining_size()
+        hold_qty = sign * Decimal(product.get_currency_quantity_from_quote_quantity(source_currency, remaining_size,
+                                                                                    order.get_price()))
+        self.__add_total(self.hold_qties, source_currency, hold_qty)
+        self.__add_total(self.edge_qties, currency_set, sign * Decimal(remaining_size))
+        self.__add_total(self.edge_order_counts, edge, sign)
+
+    # totals that come back to zero are dropped so they do not build up
+    @staticmethod
+    def __add_total(totals: Dict, key, value) -> None:
+        total = totals.get(key, 0) + value
+        if total == 0:
+            totals.pop(key, None)
+        else:
+            totals[key] = total
+
+    def __insert(self, order: Order) -> None:
+        self.orders[order.get_status()][order.get_order_id()] = order
+        self.order_index[order.get_order_id()] = (order.get_status(), order)
+        self.__track(order, order.get_status(), 1)
+
+    def __remove(self, order_id: str) -> Order:
+        order_status, order = self.order_index.pop(order_id)
+        self.__track(order, order_status, -1)
+        return self.orders[order_status].pop(order_id)
+
     # NOTE THAT THIS RETURNS PRODUCT QTY NOT SOURCE QTY
     def get_edge_qty(self, source_currency: Currency, destination_currency: Currency) -> Decimal:
-        currency_set = {source_currency, destination_currency}
-        qty = 0
-        for order_id, order in self.get_orders(OrderStatus.open).items():
-            product = self.product_manager.get_product(order.get_product_id())
-            if product.get_currency_set() == currency_set:
-                qty = qty + Decimal(order.get_remaining_size())
-        return qty
+        return self.edge_qties.get(frozenset([source_currency, destination_currency]), Decimal('0'))
 
     def any_open_orders(self) -> bool:
         return True if self.get_orders(OrderStatus.open) else False
 
     def get_edges_with_open_orders(self) -> Set[Tuple[Currency, Currency]]:
-        out = set()
-        for order in self.get_orders(OrderStatus.open).values():
-            product = self.product_manager.get_product(order.get_product_id())
-            side = order.get_order_side()
-            source_currency = product.get_source_currency(side)
-            dest_currency = product.get_destination_currency(side)
-            out.add((source_currency, dest_currency))
-        return out
+        return set(self.edge_order_counts)
 
     def get_hold_qty(self, currency: Currency) -> Decimal:
-        qty = 0
-        for order_id, order in self.get_orders(OrderStatus.open).items():
-            product = self.product_manager.get_product(order.get_product_id())
-            if currency == product.get_source_currency(order.get_order_side()):
-                this_qty = product.get_currency_quantity_from_quote_quantity(currency, order.get_remaining_size(),
-                                                                             order.get_price())
-                qty = qty + Decimal(this_qty)
-        return qty
+        return self.hold_qties.get(currency, Decimal('0'))
 
     def match_order(self, order_id: str, qty: str) -> Order:
         logger.info('Order {} matched for qty {}'.format(order_id, qty))
         order, order_status = self.get_order_and_status_by_id(order_id)
+        self.__track(order, order_status, -1)
         order.add_filled_size(qty)
+        self.__track(order, order_status, 1)
         return order
 
     def fill_order(self, order_id: str) -> Order:
@@ -133,10 +157,11 @@ class PortfolioOrderBook:
     # this should be used for new orders
     def __add__(self, order: Order) -> Order:
         logger.info('Order {} added'.format(order.get_order_id()))
-        self.orders[order.get_status()][order.get_order_id()] = order
+        if order.get_order_id() in self.order_index:
+            self.__remove(order.get_order_id())
+        self.__insert(order)
         return order
 
     def __sub__(self, order_id: str) -> Order:
         logger.info('Order {} removed'.format(order_id))
-        order, order_status = self.get_order_and_status_by_id(order_id)
-        return self.orders[order.get_status()].pop(order_id)
+        return self.__remove(order_id)
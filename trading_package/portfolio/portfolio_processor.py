@@ -1,16 +1,26 @@
 import traceback
+from collections import deque
+from concurrent.futures import Future
 from multiprocessing import Queue, Event, Process, queues
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Union
 
 from dateutil import parser
 from requests import RequestException
 
 from trading_package.client_initializer import *
-from trading_package.config.constants import STALE_OPEN_ORDERS, ORDER_CONFIRMATION_TIME
+from trading_package.config.constants import STALE_OPEN_ORDERS, ORDER_CONFIRMATION_TIME, PROCESS_QUEUE_TIMEOUT, \
+    PROCESS_QUEUE_BATCH_SIZE, PROCESS_CPU_STATS_INTERVAL, STRATEGY_MIN_INTERVAL, ORDER_GATEWAY_URL, \
+    ORDER_GATEWAY_WORKERS, ORDER_GATEWAY_TIMEOUT
+from trading_package.config.secrets import KEY, B64_SECRET, PASS_PHRASE
+from trading_package.exchange_websocket.order_id_filter import OrderIdFilter, HeldMessages, get_order_id
+from trading_package.exchange_websocket.shared_ring_buffer import SharedRingBufferReader
+from trading_package.helper.cpu_usage import CpuUsage
 from trading_package.helper.enums import *
+from trading_package.network.network_change_listener import NetworkChangeListener
 from trading_package.order_book.order import Order
 from trading_package.portfolio.portfolio import BasePortfolioGroup
 from trading_package.portfolio.portfolio import Portfolio
+from trading_package.portfolio.order_gateway import OrderGateway
 from trading_package.portfolio.portfolio_order_book import PortfolioOrderBook
 from trading_package.portfolio.product import ProductManager
 
@@ -24,8 +34,9 @@ class PortfolioProcessor(Process):
     DEBUG: bool = True
     BATCH_SIZE: int = 100
 
-    def __init__(self, product_manager: ProductManager, websocket_feed_queue: Queue, logging_queue: Queue,
-                 exit_event: Event, ready_events: List[Event]) -> None:
+    def __init__(self, product_manager: ProductManager,
+                 websocket_feed_queue: Union[Queue, SharedRingBufferReader], logging_queue: Queue,
+                 exit_event: Event, ready_events: List[Event], order_id_filter: Optional[OrderIdFilter] = None) -> None:
         Process.__init__(self)
         self.websocket_feed_queue = websocket_feed_queue
         self.logging_queue = logging_queue
@@ -34,14 +45,30 @@ class PortfolioProcessor(Process):
         self.order_book = PortfolioOrderBook(self.product_manager)
         self.portfolio = BasePortfolioGroup(self.order_book)
         self.ready_events = ready_events
-        self.registered_orders = []
+        self.registered_orders = set()
+        # the websocket is told which orders are ours so it only sends us messages about them
+        self.order_id_filter = order_id_filter
+        # messages about orders not registered yet, replayed once they are (see register_orders)
+        self.held_messages = HeldMessages()
+        self.feed_overruns = 0
+        self.cpu_usage = CpuUsage(PROCESS_CPU_STATS_INTERVAL)
+        # subscribed and started in run so the connections and threads belong to this process
+        self.network_changes = None
+        self.order_gateway = None
+        # (kind, context, future) of gateway requests that have completed, appended by the gateway's threads
+        self.gateway_results = deque()
 
     def run(self) -> None:
         self.on_open()
+        self.network_changes = NetworkChangeListener(STRATEGY_MIN_INTERVAL)
+        self.order_gateway = OrderGateway(ORDER_GATEWAY_URL, KEY, B64_SECRET, PASS_PHRASE, ORDER_GATEWAY_WORKERS,
+                                          ORDER_GATEWAY_TIMEOUT, self.product_manager)
         self.register_orders([order_id for order_id, order in self.order_book.get_orders(OrderStatus.open).items()])
         all_processes_ready = False
         while not self.exit.is_set():
             self.process_websocket_message()
+            self.process_gateway_results()
+            self.check_feed_overruns()
             # self.remove_unconfirmed_orders_if_needed()
             # self.cancel_orders_if_needed()
 
@@ -49,16 +76,35 @@ class PortfolioProcessor(Process):
             if not all_processes_ready:
                 all_processes_ready = all([re.is_set() for re in self.ready_events])
             else:
-                self.create_orders_if_needed()
+                self.network_changes.poll()
+                if self.network_changes.is_due():
+                    self.network_changes.pop_changes()
+                    self.create_orders_if_needed()
+            if self.cpu_usage.is_due():
+                self.log(LogType.info, self.cpu_usage.get_message())
+                self.log(LogType.info, self.portfolio.order_book_manager.get_network_manager().get_cache_message())
+                self.log(LogType.info, self.network_changes.get_message())
+                self.log(LogType.info, self.portfolio.journal.get_message())
+                self.log(LogType.info, self.order_gateway.get_message())
+        self.network_changes.close()
+        self.order_gateway.close()
+        self.process_gateway_results()
         while not self.websocket_feed_queue.empty():
             self.websocket_feed_queue.get(block=False)
         self.on_close()
 
+    # orders have to be in the order book before they are registered as anything held for them is applied here
     def register_orders(self, order_ids: List[str]) -> None:
-        self.registered_orders.extend(order_ids)
+        self.registered_orders.update(order_ids)
+        if self.order_id_filter is not None:
+            self.order_id_filter.register(order_ids)
+        for order in self.held_messages.release(order_ids):
+            self.update_order_status(order)
 
     def de_register_orders(self, order_ids: List[str]) -> None:
-        [self.registered_orders.remove(order_id) for order_id in order_ids]
+        self.registered_orders.difference_update(order_ids)
+        if self.order_id_filter is not None:
+            self.order_id_filter.de_register(order_ids)
 
     def cancel_all_orders(self) -> None:
         if self.DEBUG:
@@ -81,32 +127,51 @@ class PortfolioProcessor(Process):
             self.cancel_order(order_id)
         return order_ids_to_cancel
 
+    # the legs are placed together and handled as they complete (see process_gateway_results)
     def create_orders_if_needed(self) -> None:
         orders = self.portfolio.get_next_trades()
         if self.DEBUG:
             return
-        created_order_ids = []
-        for order in orders:
-            order_json = order.get_gdax_order_params()
-            try:
-                if order.get_order_side() is OrderSide.bid:
-                    self.log(LogType.info, 'Placing buy order: {}'.format(order))
-                    gdax_response = authClient.buy(order_json)
-                else:
-                    self.log(LogType.info, 'Placing sell order: {}'.format(order))
-                    gdax_response = authClient.sell(order_json)
-                self.validate_gdax_response(gdax_response)
-            except (RequestException, ApiError) as e:
-                self.on_error(e)
-                for order_id in created_order_ids:
-                    self.cancel_order(order_id)
-                break
+        # whether any leg failed and the ids of those placed
+        batch = {'failed': False, 'order_ids': []}
+        for order, future in zip(orders, self.order_gateway.place_orders(orders)):
+            self.log(LogType.info, 'Placing {} order: {}'.format(
+                'buy' if order.get_order_side() is OrderSide.bid else 'sell', order))
+            self.__add_gateway_result('place', batch, future)
+
+    def __add_gateway_result(self, kind: str, context, future: Future) -> None:
+        future.add_done_callback(lambda done: self.gateway_results.append((kind, context, done)))
+
+    def process_gateway_results(self) -> int:
+        count = 0
+        while len(self.gateway_results) > 0:
+            kind, context, future = self.gateway_results.popleft()
+            if kind == 'place':
+                self.handle_placed_order(context, future)
             else:
-                order = self.parse_gdax_json_to_order(gdax_response)
-                self.register_orders([order.get_order_id()])
-                created_order_ids.append(order.get_order_id())
-                order.set_confirmed(False)
-                self.order_book + order
+                self.handle_canceled_order(context, future)
+            count = count + 1
+        return count
+
+    # once any leg of a batch fails the legs that were placed are canceled, as are any placed after
+    def handle_placed_order(self, batch: Dict, future: Future) -> None:
+        try:
+            gdax_response = future.result()
+            self.validate_gdax_response(gdax_response)
+        except (RequestException, ValueError, ApiError) as e:
+            self.on_error(e)
+            batch['failed'] = True
+        else:
+            order = self.parse_gdax_json_to_order(gdax_response)
+            order.set_confirmed(False)
+            self.order_book + order
+            # messages about the order may have come in while it was being placed
+            self.register_orders([order.get_order_id()])
+            batch['order_ids'].append(order.get_order_id())
+        if batch['failed']:
+            for order_id in batch['order_ids']:
+                self.cancel_order(order_id)
+            batch['order_ids'] = []
 
     @staticmethod
     def validate_gdax_response(gdax_response: Dict) -> bool:
@@ -118,45 +183,60 @@ class PortfolioProcessor(Process):
         else:
             return True
 
-    def cancel_order(self, order_id: str) -> Optional[Order]:
+    def cancel_order(self, order_id: str) -> Optional[Future]:
         if self.DEBUG:
             return
+        future = self.order_gateway.cancel_order(order_id)
+        self.__add_gateway_result('cancel', order_id, future)
+        return future
+
+    def handle_canceled_order(self, order_id: str, future: Future) -> Optional[Order]:
         try:
-            gdax_response = authClient.cancelOrder(order_id)
+            gdax_response = future.result()
             self.validate_gdax_response(gdax_response)
             # we set the order status to canceled so it does not get canceled again
             # but we are still waiting on official confirmation to come through websocket
             order, order_status = self.order_book.get_order_and_status_by_id(order_id)
             order.update_status(OrderStatus.canceled)
             return order
-        except ApiError as e:
+        except (RequestException, ValueError, ApiError) as e:
             self.on_error(e)
-            return None
 
+    # waits up to PROCESS_QUEUE_TIMEOUT for the first message then drains up to PROCESS_QUEUE_BATCH_SIZE
+    # without blocking, stopping early after BATCH_SIZE updates to our own orders
     def process_websocket_message(self) -> None:
         try:
             order_count = 0
-            while not self.websocket_feed_queue.empty():
-                order = self.websocket_feed_queue.get(block=False)
+            message_count = 0
+            while message_count < PROCESS_QUEUE_BATCH_SIZE:
+                order = self.websocket_feed_queue.get(block=message_count == 0, timeout=PROCESS_QUEUE_TIMEOUT)
+                message_count = message_count + 1
                 if order is None:
                     continue
-                elif 'order_id' in order:
-                    order_id = order['order_id']
-                elif 'maker_order_id' in order:
-                    order_id = order['maker_order_id']
-                else:
-                    continue
+                order_id = get_order_id(order)
                 if order_id in self.registered_orders:
                     self.update_order_status(order)
+                    self.network_changes.mark()
                     order_count = order_count + 1
                     if order_count >= self.BATCH_SIZE:
                         return
+                else:
+                    self.held_messages.hold(order_id, order)
         except queues.Empty:
             return None
         except Exception as e:
             self.on_error(e)
             return None
 
+    # updates to our orders may have been among the messages lost to a ring buffer overrun
+    def check_feed_overruns(self) -> None:
+        if not isinstance(self.websocket_feed_queue, SharedRingBufferReader):
+            return
+        overruns = self.websocket_feed_queue.get_overruns()
+        if overruns != self.feed_overruns:
+            self.log(LogType.error, 'Overrun by {} websocket messages'.format(overruns - self.feed_overruns))
+            self.feed_overruns = overruns
+
     def update_order_status(self, order) -> None:
         if order['type'] == 'done':
             self.log(LogType.info, 'Order {} done with reason {} for size {}'.format(order['order_id'],
@@ -220,6 +300,8 @@ class PortfolioProcessor(Process):
         self.log(LogType.error, str(e))
 
     def on_close(self) -> None:
+        self.portfolio.close()
+        self.log(LogType.info, self.portfolio.journal.get_message())
         self.log(LogType.info, "-- Process Terminated! --")
 
     def log(self, log_type: LogType, msg: str) -> None:
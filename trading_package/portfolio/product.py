@@ -1,7 +1,9 @@
-from decimal import Decimal, ROUND_DOWN, ROUND_HALF_EVEN
+from decimal import Decimal, ROUND_DOWN
 from typing import Set, List, Dict, Optional
 
+from trading_package.config.constants import SIZE_UNITS
 from trading_package.helper.enums import *
+from trading_package.helper.fixed_point import size_to_units
 
 
 class ProductException(Exception):
@@ -16,6 +18,13 @@ class Product:
         self.base_currency = base_currency
         self.quote_increment = Decimal(quote_increment)
         self.base_min_size = Decimal(base_min_size)
+        # the order book works in integer ticks of quote_increment and integer size units
+        # so the increment has to divide a whole unit of price
+        tick_divisor = Decimal(1) / self.quote_increment
+        if tick_divisor != tick_divisor.to_integral_value():
+            raise ProductException('Quote increment {} does not divide 1'.format(quote_increment))
+        self.tick_divisor = int(tick_divisor)
+        self.base_min_size_units = size_to_units(base_min_size)
         self.currency_pair = {
             OrderSide.bid: {
                 'source': self.quote_currency,
@@ -36,6 +45,33 @@ class Product:
     def get_quote_increment(self) -> str:
         return str(self.quote_increment)
 
+    def get_base_min_size_units(self) -> int:
+        return self.base_min_size_units
+
+    def get_tick_divisor(self) -> int:
+        return self.tick_divisor
+
+    def price_to_ticks(self, price: str) -> int:
+        return int(round(float(price) * self.tick_divisor))
+
+    def ticks_to_price(self, ticks: int) -> float:
+        return ticks / self.tick_divisor
+
+    def ticks_to_decimal(self, ticks: int) -> Decimal:
+        return self.quote_increment * ticks
+
+    # exact price string for sending to the exchange
+    def ticks_to_str(self, ticks: int) -> str:
+        return str(self.ticks_to_decimal(ticks))
+
+    # any price as the exact string of the nearest tick
+    def price_to_str(self, price: str) -> str:
+        return self.ticks_to_str(self.price_to_ticks(price))
+
+    # notional is ticks * size units, what filling them costs in the quote currency
+    def notional_to_quote_value(self, notional: int) -> float:
+        return notional / (self.tick_divisor * SIZE_UNITS)
+
     def get_currency_set(self) -> Set[Currency]:
         return {self.quote_currency, self.base_currency}
 
@@ -78,19 +114,17 @@ class Product:
             return 1.0 / price
 
     def get_lower_price(self, price: str) -> Decimal:
-        lower_price = Decimal(price).quantize(self.quote_increment, rounding=ROUND_HALF_EVEN) - self.quote_increment
-        return lower_price
+        return self.ticks_to_decimal(self.price_to_ticks(price) - 1)
 
     def get_higher_price(self, price: str) -> Decimal:
-        higher_price = Decimal(price).quantize(self.quote_increment, rounding=ROUND_HALF_EVEN) + self.quote_increment
-        return higher_price
+        return self.ticks_to_decimal(self.price_to_ticks(price) + 1)
 
     # Note that this rounds down
     def round_quantity(self, quantity: str, rounding=ROUND_DOWN) -> Decimal:
         return Decimal(quantity).quantize(self.base_min_size, rounding=rounding)
 
     def round_price(self, price: str) -> Decimal:
-        return Decimal(price).quantize(self.quote_increment, rounding=ROUND_HALF_EVEN)
+        return self.ticks_to_decimal(self.price_to_ticks(price))
 
     def get_quote_quantity_from_currency_quantity(self, currency: Currency, quantity: str, quote_price: str) -> Decimal:
         if self.get_quote_quantity_currency() == currency:
@@ -1,5 +1,7 @@
 import logging
 from datetime import datetime
+from time import time
+from typing import Dict, List, Optional
 from multiprocessing import Event, Queue, queues
 from signal import getsignal, signal, SIGINT, SIG_IGN
 
@@ -7,10 +9,21 @@ from redis import StrictRedis
 from redis.exceptions import ConnectionError
 
 from trading_package.client_initializer import *
+from trading_package.config.constants import IN_MEMORY_ORDER_BOOK, WEBSOCKET_RING_BUFFER, WEBSOCKET_RING_SLOTS, \
+    WEBSOCKET_RING_SLOT_SIZE, WEBSOCKET_RING_STATS_INTERVAL, WEBSOCKET_BINARY_MESSAGES, PROCESS_QUEUE_TIMEOUT, \
+    PROCESS_QUEUE_BATCH_SIZE, PROCESS_CPU_STATS_INTERVAL, ORDER_BOOK_SHARDS, ORDER_BOOK_SHARD_MAP, \
+    ORDER_BOOK_REBALANCE_INTERVAL, ORDER_BOOK_REBALANCE_THRESHOLD, PORTFOLIO_ORDER_ID_FILTER, \
+    PORTFOLIO_LIMITS_KEYSPACE_EVENTS
 from trading_package.exchange_websocket.exchange_websocket import ExchangeWebsocket
+from trading_package.exchange_websocket.message_codec import MessageCodec
+from trading_package.exchange_websocket.order_id_filter import OrderIdFilter
+from trading_package.exchange_websocket.shared_ring_buffer import SharedRingBuffer
+from trading_package.helper.cpu_usage import CpuUsage
 from trading_package.helper.enums import LogType, Currency
 from trading_package.network.network_processor import NetworkProcessor
 from trading_package.order_book.order_book_processor import OrderBookProcessor
+from trading_package.order_book.order_book_shards import OrderBookShardMap
+from trading_package.portfolio.portfolio_limits_cache import PortfolioLimitsCache
 from trading_package.portfolio.portfolio_processor import PortfolioProcessor
 from trading_package.portfolio.product import ProductManager, Product
 
@@ -43,20 +56,56 @@ def get_product_manager() -> ProductManager:
     return pm
 
 
-def log(q: Queue(), batch_size: int = 1) -> None:
+# with a timeout the first message is waited for, the rest of the batch is only what is already queued
+# returns the number of messages logged
+def log(q: Queue(), batch_size: int = 1, timeout: Optional[float] = None) -> int:
     count = 0
-    while not q.empty():
-        if count >= batch_size:
+    while count < batch_size:
+        try:
+            raw_msg = q.get(block=timeout is not None and count == 0, timeout=timeout)
+        except queues.Empty:
             break
         try:
-            raw_msg = q.get(block=False)
             process_name = raw_msg['process'] if 'process' in raw_msg else ''
             msg = '{}:{}'.format(process_name, raw_msg['msg'])
             logger.log(LogType[raw_msg['type']].value, msg)
             count = count + 1
-        except (KeyError, queues.Empty) as e:
+        except KeyError as e:
             print(e)
             break
+    return count
+
+
+# per consumer throughput, lag and overruns since the last call; returns the stats to pass next time
+def log_ring_buffer_stats(ring_buffer: SharedRingBuffer, reader_names: List[str], last_stats: Optional[Dict],
+                          now_time: float) -> Dict:
+    stats = ring_buffer.get_stats()
+    if last_stats is not None:
+        elapsed = max(now_time - last_stats['time'], 1e-9)
+        for reader_id, reader_stats in enumerate(stats):
+            last_reader_stats = last_stats['readers'][reader_id]
+            logger.log(LogType.info.value, 'Ring buffer {}: {:.1f} msgs/sec, lag {} msgs, {} overrun msgs'.format(
+                reader_names[reader_id], (reader_stats['reads'] - last_reader_stats['reads']) / elapsed,
+                reader_stats['lag'], reader_stats['overruns'] - last_reader_stats['overruns']))
+    return {'time': now_time, 'readers': stats}
+
+
+# per shard message rate since the last call, moving products between shards if they have drifted apart
+# (see OrderBookShardMap.rebalance); returns the counts to pass next time
+def rebalance_order_book_shards(shard_map: OrderBookShardMap, last_counts: Optional[Dict],
+                                now_time: float) -> Dict:
+    counts = shard_map.get_message_counts()
+    if last_counts is not None:
+        elapsed = max(now_time - last_counts['time'], 1e-9)
+        rates = {product_id: (count - last_counts['products'][product_id]) / elapsed for product_id, count in
+                 counts.items()}
+        for shard, load in enumerate(shard_map.get_loads(rates)):
+            logger.log(LogType.info.value, 'Order book shard {}: {:.1f} msgs/sec over {}'.format(
+                shard, load, ', '.join(shard_map.get_product_ids(shard))))
+        for product_id, shard in shard_map.rebalance(rates, ORDER_BOOK_REBALANCE_THRESHOLD).items():
+            logger.log(LogType.info.value, 'Moving {} ({:.1f} msgs/sec) to order book shard {}'.format(
+                product_id, rates[product_id], shard))
+    return {'time': now_time, 'products': counts}
 
 
 def main() -> bool:
@@ -65,19 +114,43 @@ def main() -> bool:
     restart_event_bool = False
 
     exit_event = Event()
-    ready_events = [Event() for _ in range(3)]
-    comm_queues = [Queue() for _ in range(3)]
-    logger_queue = comm_queues[2]
+    # one ready event for the websocket and each order book shard
+    # an in memory order book computes the network itself so no network processor is needed
+    ready_events = [Event() for _ in range(1 + ORDER_BOOK_SHARDS + (0 if IN_MEMORY_ORDER_BOOK else 1))]
+    # portfolio, logging and one per order book shard
+    comm_queues = [Queue() for _ in range(2 + ORDER_BOOK_SHARDS)]
+    network_event = Event()
+    logger_queue = comm_queues[1]
+    order_book_queues = comm_queues[2:]
     product_manager = get_product_manager()
-    processes = [ExchangeWebsocket(product_manager, comm_queues[0], comm_queues[1], ready_events[0], exit_event),
-                 OrderBookProcessor(product_manager, comm_queues[1], logger_queue, exit_event, ready_events[1]),
-                 PortfolioProcessor(product_manager, comm_queues[0], logger_queue, exit_event, ready_events),
-                 NetworkProcessor(product_manager, logger_queue, exit_event, ready_events[2])]
+    shard_map = OrderBookShardMap(product_manager.get_product_ids(), ORDER_BOOK_SHARDS, ORDER_BOOK_SHARD_MAP)
+    # with ring buffers each processor reads from one instead of its own queue:
+    # the portfolio from a ring of every message and each order book shard from a ring of its products' messages
+    codec = MessageCodec(product_manager) if WEBSOCKET_BINARY_MESSAGES else None
+    ring_buffers = [SharedRingBuffer(WEBSOCKET_RING_SLOTS, WEBSOCKET_RING_SLOT_SIZE, 1, codec) for _ in
+                    range(1 + ORDER_BOOK_SHARDS)] if WEBSOCKET_RING_BUFFER else None
+    portfolio_feed = comm_queues[0] if ring_buffers is None else ring_buffers[0].get_reader(0)
+    order_id_filter = OrderIdFilter() if PORTFOLIO_ORDER_ID_FILTER else None
+    processes = [ExchangeWebsocket(product_manager, comm_queues[0], order_book_queues, ready_events[0], exit_event,
+                                   ring_buffers, shard_map, order_id_filter)]
+    for shard in range(ORDER_BOOK_SHARDS):
+        order_book_feed = order_book_queues[shard] if ring_buffers is None else ring_buffers[shard + 1].get_reader(0)
+        processes.append(OrderBookProcessor(product_manager, order_book_feed, logger_queue, exit_event,
+                                            ready_events[shard + 1], network_event, shard_map, shard))
+    processes.append(PortfolioProcessor(product_manager, portfolio_feed, logger_queue, exit_event, ready_events,
+                                        order_id_filter))
+    if not IN_MEMORY_ORDER_BOOK:
+        processes.append(NetworkProcessor(product_manager, logger_queue, exit_event, ready_events[-1], network_event))
+    # the name of the process reading each ring
+    feed_names = [PortfolioProcessor.PROCESS_NAME] + [process.PROCESS_NAME for process in
+                                                      processes[1:1 + ORDER_BOOK_SHARDS]]
     try:
         # clear out redis at the beginning
         try:
             redis_server = StrictRedis(host='localhost', port=6379, db=0)
             redis_server.flushdb()
+            if PORTFOLIO_LIMITS_KEYSPACE_EVENTS:
+                PortfolioLimitsCache.enable_keyspace_notifications(redis_server)
         except ConnectionError as e:
             print("Redis server not running: exiting")
             print(e)
@@ -89,8 +162,25 @@ def main() -> bool:
         logger.log(LogType.info.value, 'All Processes Started!')
         signal(SIGINT, default_handler)
         # a subprocess may set the exit event
+        ring_buffer_stats = None if ring_buffers is None else [
+            log_ring_buffer_stats(ring_buffer, [feed_name], None, time()) for ring_buffer, feed_name in
+            zip(ring_buffers, feed_names)]
+        shard_counts = rebalance_order_book_shards(shard_map, None, time())
+        cpu_usage = CpuUsage(PROCESS_CPU_STATS_INTERVAL)
         while not exit_event.is_set():
-            log(logger_queue)
+            log(logger_queue, batch_size=PROCESS_QUEUE_BATCH_SIZE, timeout=PROCESS_QUEUE_TIMEOUT)
+            if cpu_usage.is_due():
+                logger.log(LogType.info.value, 'Process Manager:{}'.format(cpu_usage.get_message()))
+                if order_id_filter is not None:
+                    logger.log(LogType.info.value, 'Portfolio feed: {delivered} messages delivered, {dropped} dropped '
+                                                   'at the websocket, {replayed} replayed once their order was '
+                                                   'registered'.format(**order_id_filter.get_counts()))
+            if ring_buffers is not None and time() - ring_buffer_stats[0]['time'] >= WEBSOCKET_RING_STATS_INTERVAL:
+                ring_buffer_stats = [log_ring_buffer_stats(ring_buffer, [feed_name], last_stats, time()) for
+                                     ring_buffer, feed_name, last_stats in
+                                     zip(ring_buffers, feed_names, ring_buffer_stats)]
+            if time() - shard_counts['time'] >= ORDER_BOOK_REBALANCE_INTERVAL:
+                shard_counts = rebalance_order_book_shards(shard_map, shard_counts, time())
         logger.log(LogType.info.value, 'Restart Event Set')
         restart_event_bool = True
     except KeyboardInterrupt as e:
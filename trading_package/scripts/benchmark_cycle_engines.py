@@ -0,0 +1,93 @@
+import random
+from time import time
+from typing import Dict, List, Optional, Tuple
+
+from networkx import DiGraph, simple_cycles
+
+from trading_package.network.cycle_set import CycleSet
+from trading_package.network.negative_cycle_finder import NegativeCycleFinder
+
+# Compares the two cycle engines on synthetic networks of growing size:
+# simple_cycles (every cycle enumerated into a CycleSet then valued) against bellman_ford (NegativeCycleFinder).
+# Like the exchange a few quote currencies trade with each other and every other currency trades against
+# some of them. Enumeration stops after ENUMERATION_BUDGET seconds as the number of cycles explodes
+
+CURRENCY_COUNTS = [20, 50, 200]
+QUOTE_CURRENCY_COUNT = 4
+QUOTES_PER_CURRENCY = 3
+ENUMERATION_BUDGET = 30.
+MAX_CYCLE_LENGTH = 4
+MAX_NEGATIVE_CYCLES = 20
+FEE = 0.998
+MISPRICED_EDGES = 0.02
+
+
+def get_weights(currency_count: int, seed: int = 1) -> Dict[Tuple[str, str], float]:
+    random.seed(seed)
+    quote_currencies = ['Q{}'.format(idx) for idx in range(QUOTE_CURRENCY_COUNT)]
+    currencies = ['C{}'.format(idx) for idx in range(currency_count - QUOTE_CURRENCY_COUNT)]
+    prices = {currency: random.uniform(0.01, 1000) for currency in quote_currencies + currencies}
+    products = [(base, quote) for idx, base in enumerate(quote_currencies) for quote in quote_currencies[idx + 1:]]
+    products.extend((base, quote) for base in currencies for quote in
+                    random.sample(quote_currencies, QUOTES_PER_CURRENCY))
+    weights = {}
+    for base, quote in products:
+        for start, end in [(base, quote), (quote, base)]:
+            mispricing = 1.01 if random.random() < MISPRICED_EDGES else 1.
+            weights[(start, end)] = prices[start] / prices[end] * FEE * mispricing
+    return weights
+
+
+# the number of cycles, or None if there were too many to enumerate within budget
+def count_cycles(weights: Dict[Tuple[str, str], float], budget: float) -> Optional[int]:
+    dg = DiGraph()
+    dg.add_edges_from(weights.keys())
+    start = time()
+    count = 0
+    for _ in simple_cycles(dg):
+        count = count + 1
+        if count % 1000 == 0 and time() - start > budget:
+            return None
+    return count
+
+
+def run_simple_cycles(weights: Dict[Tuple[str, str], float]) -> Tuple[float, float, List]:
+    start = time()
+    cycle_set = CycleSet(weights.keys())
+    enumerated = time()
+    ranked = cycle_set.get_ranked_cycles(weights)
+    return enumerated - start, time() - enumerated, [(value, cycle) for value, cycle in ranked if value > 1]
+
+
+def run_bellman_ford(weights: Dict[Tuple[str, str], float], start_currency: Optional[str] = None,
+                     max_length: Optional[int] = None) -> Tuple[float, List]:
+    start = time()
+    ranked = NegativeCycleFinder(weights).get_ranked_cycles(start_currency, max_length, MAX_NEGATIVE_CYCLES)
+    return time() - start, ranked
+
+
+if __name__ == '__main__':
+    print('{:>10} {:>6} {:<36} {:>10} {:>10} {:>8} {:>8}'.format('currencies', 'edges', 'engine', 'setup ms',
+                                                                  'search ms', 'found', 'best'))
+    for currency_count in CURRENCY_COUNTS:
+        weights = get_weights(currency_count)
+        rows = []
+        if count_cycles(weights, ENUMERATION_BUDGET) is None:
+            rows.append(('simple_cycles', None, None, []))
+        else:
+            enumeration, valuation, ranked = run_simple_cycles(weights)
+            rows.append(('simple_cycles', enumeration, valuation, ranked))
+        duration, ranked = run_bellman_ford(weights)
+        rows.append(('bellman_ford', 0., duration, ranked))
+        duration, ranked = run_bellman_ford(weights, max_length=MAX_CYCLE_LENGTH)
+        rows.append(('bellman_ford <= {} edges'.format(MAX_CYCLE_LENGTH), 0., duration, ranked))
+        duration, ranked = run_bellman_ford(weights, 'Q0', MAX_CYCLE_LENGTH)
+        rows.append(('bellman_ford through Q0 <= {} edges'.format(MAX_CYCLE_LENGTH), 0., duration, ranked))
+        for engine, setup, search, ranked in rows:
+            if setup is None:
+                print('{:>10} {:>6} {:<36} {:>10}'.format(currency_count, len(weights), engine,
+                                                          '> {:.0f} s'.format(ENUMERATION_BUDGET)))
+                continue
+            best = '{:.4f}'.format(ranked[-1][0]) if len(ranked) > 0 else '-'
+            print('{:>10} {:>6} {:<36} {:>10.1f} {:>10.1f} {:>8} {:>8}'.format(
+                currency_count, len(weights), engine, setup * 1e3, search * 1e3, len(ranked), best))
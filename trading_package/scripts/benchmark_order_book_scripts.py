@@ -0,0 +1,81 @@
+import random
+from time import time
+from typing import List, Optional
+
+from redis import StrictRedis
+
+from trading_package.helper.enums import *
+from trading_package.order_book.order import Order
+from trading_package.order_book.order_book import OrderBook
+from trading_package.order_book.order_book_store import RedisOrderBookStore
+from trading_package.order_book.redis_write_batcher import RedisWriteBatcher
+from trading_package.portfolio.product import Product
+
+# Compares applying websocket messages to the redis order book with lua scripts
+# against the plain command fallback, with and without write batching.
+# Flushes redis db 0 so do not run it against a live book
+
+MESSAGE_COUNT = 5000
+PRODUCT = Product(product_id='BTC-USD', quote_currency=Currency.USD, base_currency=Currency.BTC,
+                  quote_increment='0.01', base_min_size='0.01')
+
+
+def get_orders(count: int, seed: int = 1) -> List[Order]:
+    random.seed(seed)
+    product_id = PRODUCT.get_product_id()
+    # [side, price, order_id, remaining size] of orders still on the book
+    live = []
+    orders = []
+    for idx in range(1, count + 1):
+        if random.random() < 0.5 or not live:
+            side = random.choice(list(OrderSide))
+            offset = random.randint(1, 50) * 0.01
+            price = '{:.2f}'.format(1000 - offset if side is OrderSide.bid else 1000 + offset)
+            size = random.uniform(0.01, 3)
+            live.append([side, price, str(idx), size])
+            orders.append(Order(product_id, idx, side, '{:.8f}'.format(size), price, order_id=str(idx)))
+        elif random.random() < 0.6:
+            side, price, order_id, size = live.pop(random.randrange(len(live)))
+            orders.append(Order(product_id, idx, side, '{:.8f}'.format(size), price, order_type=OrderType.cancel,
+                                status=OrderStatus.canceled, order_id=order_id))
+        else:
+            open_order = live[random.randrange(len(live))]
+            side, price, order_id, size = open_order
+            open_order[3] = size - size / 2
+            orders.append(Order(product_id, idx, side, '{:.8f}'.format(size / 2), price, order_type=OrderType.match,
+                                order_id=order_id))
+    return orders
+
+
+def run(orders: List[Order], use_scripts: bool, batch_writes: bool) -> Optional[float]:
+    redis_server = StrictRedis(host='localhost', port=6379, db=0, encoding="utf-8", decode_responses=True)
+    redis_server.flushdb()
+    batcher = RedisWriteBatcher(redis_server) if batch_writes else None
+    store = RedisOrderBookStore(PRODUCT.get_product_id(), redis_server, batcher, use_scripts=use_scripts)
+    if use_scripts and not store.uses_scripts():
+        return None
+    order_book = OrderBook(PRODUCT, store=store, batcher=batcher)
+    start = time()
+    for order in orders:
+        if order.get_order_type() is OrderType.limit:
+            order_book + order
+        else:
+            order_book - order
+        if batcher is not None and batcher.is_due():
+            batcher.flush()
+    if batcher is not None:
+        batcher.flush()
+    return len(orders) / (time() - start)
+
+
+if __name__ == '__main__':
+    orders = get_orders(MESSAGE_COUNT)
+    for batch_writes in [False, True]:
+        for use_scripts in [False, True]:
+            rate = run(orders, use_scripts, batch_writes)
+            name = '{} {}'.format('lua scripts' if use_scripts else 'commands',
+                                  '(batched)' if batch_writes else '(unbatched)')
+            if rate is None:
+                print('{:<25} not supported by server'.format(name))
+            else:
+                print('{:<25} {:>10.0f} msgs/sec'.format(name, rate))
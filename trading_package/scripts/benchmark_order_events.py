@@ -0,0 +1,56 @@
+import random
+from time import time
+from typing import Callable, Dict, List
+
+from dateutil import parser
+
+from trading_package.helper.enums import *
+from trading_package.helper.fixed_point import size_to_units
+from trading_package.helper.timestamps import parse_timestamp_ns
+from trading_package.order_book.order import Order
+from trading_package.order_book.order_event import OrderEvent
+from trading_package.portfolio.product import Product
+
+# Compares turning websocket messages into what the order book applies:
+# dateutil and Order (as the order book processor used to) against the fixed format parser and OrderEvent
+
+MESSAGE_COUNT = 100000
+SIDES = {'buy': OrderSide.bid, 'sell': OrderSide.ask}
+PRODUCT = Product('BTC-USD', Currency.USD, Currency.BTC, '0.01', '0.01')
+
+
+def get_messages(count: int, seed: int = 1) -> List[Dict]:
+    random.seed(seed)
+    return [{'type': 'open', 'product_id': 'BTC-USD', 'sequence': idx, 'side': random.choice(['buy', 'sell']),
+             'price': '{:.2f}'.format(random.uniform(900, 1100)), 'remaining_size': '{:.8f}'.format(random.random()),
+             'order_id': str(idx), 'time': '2017-08-01T15:{:02d}:{:02d}.{:06d}Z'.format(
+                 random.randint(0, 59), random.randint(0, 59), random.randint(0, 999999))} for idx in range(count)]
+
+
+def to_order(message: Dict) -> int:
+    order = Order(message['product_id'], message['sequence'], SIDES[message['side']], message['remaining_size'],
+                  message['price'], created_at=parser.parse(message['time']), order_id=message['order_id'])
+    return int(order.get_created_at().strftime('%s'))
+
+
+def to_order_event(message: Dict) -> int:
+    order = OrderEvent(message['product_id'], message['sequence'], SIDES[message['side']],
+                       size_to_units(message['remaining_size']), PRODUCT.price_to_ticks(message['price']),
+                       parse_timestamp_ns(message['time']), order_id=message['order_id'])
+    return order.get_unix_timestamp()
+
+
+def run(messages: List[Dict], convert: Callable[[Dict], int]) -> float:
+    start = time()
+    for message in messages:
+        convert(message)
+    return (time() - start) / len(messages)
+
+
+if __name__ == '__main__':
+    messages = get_messages(MESSAGE_COUNT)
+    before = run(messages, to_order)
+    after = run(messages, to_order_event)
+    print('{:<30} {:>8.2f} us/msg'.format('dateutil + Order', before * 1e6))
+    print('{:<30} {:>8.2f} us/msg'.format('parse_timestamp_ns + OrderEvent', after * 1e6))
+    print('{:<30} {:>8.1f}x'.format('speed up', before / after))